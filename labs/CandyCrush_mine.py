@@ -1,5 +1,13 @@
-import random, time, pygame, sys, copy
+import random, time, pygame, sys, os
 from pygame.locals import *
+from flatboard import copyBoard
+from matchrules import MINERULES
+from boardgen import BoardGenerator
+from boardpool import openPool
+from movelog import MoveLogWriter, getLogPath, newSeed
+from savegame import saveGame, openSavedGame, reseed
+from movinggem import MovingGem, STEPDIRECTIONS, OPPOSITE, DOWN, ROWABOVEBOARD
+from moveindex import MoveIndex
 
 FPS = 30
 WINDOWWIDTH = 600
@@ -10,9 +18,22 @@ BOARDHEIGHT = 8
 GEMIMAGESIZE = 64
 
 NUMGEMIMAGES = 4
-assert NUMGEMIMAGES >= 1
+assert NUMGEMIMAGES >= 2
+
+GEMGENERATOR = BoardGenerator(MINERULES, NUMGEMIMAGES, random) # deals new boards and refills
 
 MOVERATE = 25
+DROPTIME = 0.3 # seconds the gems of a refill take to fall, however far they fall
+
+# Starting boards are read from this pool file (made by boardpool.py with
+# --variant mine) if it exists and matches the board.
+BOARDPOOLFILE = 'boards.pool'
+BOARDPOOLTIER = None # difficulty tier to pick boards from, None for any
+
+MOVELOGDIR = 'movelogs' # every game's move log goes here (see movelog.py), None for no logs
+# S saves the game to this file (see savegame.py), and the next game
+# resumes from it.
+SAVEFILE = 'mine.gemsave'
 
 
 #             R    G    B
@@ -32,17 +53,10 @@ SCORECOLOR = BROWN # color of the text for the player's score
 XMARGIN = int((WINDOWWIDTH - GEMIMAGESIZE * BOARDWIDTH) / 2)
 YMARGIN = int((WINDOWHEIGHT - GEMIMAGESIZE * BOARDHEIGHT) / 2)
 
-# constants for direction values
-UP = 'up'
-DOWN = 'down'
-LEFT = 'left'
-RIGHT = 'right'
-
 EMPTY_SPACE = -1 # an arbitrary, nonpositive value
-ROWABOVEBOARD = 'row above board' # an arbitrary, noninteger value
 
 def main():
-    global FPSCLOCK, DISPLAYSURF, GEMIMAGES, BASICFONT, BOARDRECTS
+    global FPSCLOCK, DISPLAYSURF, GEMIMAGES, BASICFONT, BOARDRECTS, BOARDPOOL
 
     # Initial set up.
     pygame.init()
@@ -78,6 +92,8 @@ def main():
                              GEMIMAGESIZE))
             BOARDRECTS[x].append(r)
 
+    BOARDPOOL = openPool(BOARDPOOLFILE, BOARDWIDTH, BOARDHEIGHT, NUMGEMIMAGES, 'mine')
+
     while True:
         runGame()
 
@@ -88,7 +104,27 @@ def runGame():
     # initalize the board
     gameBoard = getBlankBoard()
     score = 0
-    fillBoardAndAnimate(gameBoard, [], score) # Drop the initial gems.
+    # Every gem of the game comes from its own random number generator,
+    # so the seed and the swaps are enough to play it again.
+    savedGame = openSavedGame(SAVEFILE, BOARDWIDTH, BOARDHEIGHT, NUMGEMIMAGES, 'mine')
+    if savedGame is not None:
+        os.remove(SAVEFILE) # a saved game is resumed once
+        newBoard, seed, score = savedGame.board, savedGame.seed, savedGame.score
+        GEMGENERATOR.rng = random.Random(seed)
+    elif BOARDPOOL is not None:
+        newBoard, seed, legalMoves, bestPoints = BOARDPOOL.sample(random, BOARDPOOLTIER)
+        GEMGENERATOR.rng = random.Random(seed) # the refills that go with this board
+    else:
+        seed = newSeed()
+        GEMGENERATOR.rng = random.Random(seed)
+        newBoard = GEMGENERATOR.newBoard(BOARDWIDTH, BOARDHEIGHT) # no runs, at least one move
+    moveLog = None
+    if MOVELOGDIR is not None:
+        moveLog = MoveLogWriter(getLogPath(MOVELOGDIR, 'mine', seed), 'mine', newBoard,
+                                NUMGEMIMAGES, seed, BOARDPOOL is not None or savedGame is not None,
+                                score)
+    fillBoardAndAnimate(gameBoard, [], score, [column[::-1] for column in newBoard]) # Drop the initial gems.
+    moveIndex = MoveIndex(gameBoard, MINERULES.directions, MINERULES.minRun) # the legal swaps, kept up to date after each move
 
     # initialize variables for the start of a new game
     firstSelectedGem = None
@@ -105,10 +141,25 @@ def runGame():
                 pygame.quit()
                 sys.exit()
             elif event.type == KEYUP and event.key == K_BACKSPACE:
+                if moveLog is not None:
+                    moveLog.close()
                 return
 
+            elif event.type == KEYUP and event.key == K_s and not gameIsOver:
+                # The generator restarts from a new seed, so the saved
+                # board and seed deal the rest of the game, and the move
+                # log goes on in a new log from here.
+                seed = reseed(GEMGENERATOR.rng)
+                saveGame(SAVEFILE, 'mine', gameBoard, NUMGEMIMAGES, score, seed)
+                if moveLog is not None:
+                    moveLog.close()
+                    moveLog = MoveLogWriter(getLogPath(MOVELOGDIR, 'mine', seed), 'mine',
+                                            gameBoard, NUMGEMIMAGES, seed, True, score)
+
             elif event.type == MOUSEBUTTONUP:
                 if gameIsOver:
+                    if moveLog is not None:
+                        moveLog.close()
                     return
 
                 if event.pos == (lastMouseDownX, lastMouseDownY):
@@ -137,23 +188,25 @@ def runGame():
             animateMovingGems(boardCopy, [firstSwappingGem, secondSwappingGem], [], score)
 
             # Swap the gems in the board data structure.
-            gameBoard[firstSwappingGem['x']][firstSwappingGem['y']] = secondSwappingGem['imageNum']
-            gameBoard[secondSwappingGem['x']][secondSwappingGem['y']] = firstSwappingGem['imageNum']
+            gameBoard[firstSwappingGem.x][firstSwappingGem.y] = secondSwappingGem.imageNum
+            gameBoard[secondSwappingGem.x][secondSwappingGem.y] = firstSwappingGem.imageNum
 
             matchedGems = findMatchingGems(gameBoard)
             if matchedGems == []:
                 #GAMESOUNDS['bad swap'].play()
                 animateMovingGems(boardCopy, [firstSwappingGem, secondSwappingGem], [], score)
-                gameBoard[firstSwappingGem['x']][firstSwappingGem['y']] = firstSwappingGem['imageNum']
-                gameBoard[secondSwappingGem['x']][secondSwappingGem['y']] = secondSwappingGem['imageNum']
+                gameBoard[firstSwappingGem.x][firstSwappingGem.y] = firstSwappingGem.imageNum
+                gameBoard[secondSwappingGem.x][secondSwappingGem.y] = secondSwappingGem.imageNum
             else:
                 # This was a matching move.
+                movedSpaces = {(firstSwappingGem.x, firstSwappingGem.y),
+                               (secondSwappingGem.x, secondSwappingGem.y)}
                 scoreAdd = 0
                 while matchedGems != []:
 
                     points = []
                     for gemSet in matchedGems:
-                        scoreAdd += len(gemSet)
+                        scoreAdd += MINERULES.scoreGemSet(gemSet)
                         for gem in gemSet:
                             gameBoard[gem[0]][gem[1]] = EMPTY_SPACE
 
@@ -161,13 +214,17 @@ def runGame():
                     score += scoreAdd
 
                     # Drop the new gems.
-                    fillBoardAndAnimate(gameBoard, points, score)
+                    movedSpaces |= fillBoardAndAnimate(gameBoard, points, score)
 
                     # Check if there are any new matches.
                     matchedGems = findMatchingGems(gameBoard)
+                moveIndex.update(movedSpaces)
+            if moveLog is not None:
+                moveLog.logSwap((firstSwappingGem.x, firstSwappingGem.y),
+                                (secondSwappingGem.x, secondSwappingGem.y), score, gameBoard)
             firstSelectedGem = None
 
-            if not canMakeMove(gameBoard):
+            if not moveIndex.hasMoves():
                 gameIsOver = True
 
         # Draw the board.
@@ -189,28 +246,13 @@ def runGame():
 
 
 def getSwappingGems(board, firstXY, secondXY):
-    firstGem = {'imageNum': board[firstXY['x']][firstXY['y']],
-                'x': firstXY['x'],
-                'y': firstXY['y']}
-    secondGem = {'imageNum': board[secondXY['x']][secondXY['y']],
-                 'x': secondXY['x'],
-                 'y': secondXY['y']}
-    highlightedGem = None
-    if firstGem['x'] == secondGem['x'] + 1 and firstGem['y'] == secondGem['y']:
-        firstGem['direction'] = LEFT
-        secondGem['direction'] = RIGHT
-    elif firstGem['x'] == secondGem['x'] - 1 and firstGem['y'] == secondGem['y']:
-        firstGem['direction'] = RIGHT
-        secondGem['direction'] = LEFT
-    elif firstGem['y'] == secondGem['y'] + 1 and firstGem['x'] == secondGem['x']:
-        firstGem['direction'] = UP
-        secondGem['direction'] = DOWN
-    elif firstGem['y'] == secondGem['y'] - 1 and firstGem['x'] == secondGem['x']:
-        firstGem['direction'] = DOWN
-        secondGem['direction'] = UP
-    else:
+    direction = STEPDIRECTIONS.get((secondXY['x'] - firstXY['x'], secondXY['y'] - firstXY['y']))
+    if direction is None:
         # These gems are not adjacent and can't be swapped.
         return None, None
+    firstGem = MovingGem(board[firstXY['x']][firstXY['y']], firstXY['x'], firstXY['y'], direction)
+    secondGem = MovingGem(board[secondXY['x']][secondXY['y']], secondXY['x'], secondXY['y'],
+                          OPPOSITE[direction])
     return firstGem, secondGem
 
 
@@ -222,142 +264,24 @@ def getBlankBoard():
 
 
 def canMakeMove(board):
-    oneOffPatterns = (((0,1), (1,0), (2,0)),
-                      ((0,1), (1,1), (2,0)),
-                      ((0,0), (1,1), (2,0)),
-                      ((0,1), (1,0), (2,1)),
-                      ((0,0), (1,0), (2,1)),
-                      ((0,0), (1,1), (2,1)),
-                      ((0,0), (0,2), (0,3)),
-                      ((0,0), (0,1), (0,3)))
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            for pat in oneOffPatterns:
-                if (getGemAt(board, x+pat[0][0], y+pat[0][1]) == \
-                    getGemAt(board, x+pat[1][0], y+pat[1][1]) == \
-                    getGemAt(board, x+pat[2][0], y+pat[2][1]) != None) or \
-                   (getGemAt(board, x+pat[0][1], y+pat[0][0]) == \
-                    getGemAt(board, x+pat[1][1], y+pat[1][0]) == \
-                    getGemAt(board, x+pat[2][1], y+pat[2][0]) != None):
-                    return True
-    return False
-
-
-def drawMovingGem(gem, progress):
-    movex = 0
-    movey = 0
-    progress *= 0.01
-
-    if gem['direction'] == UP:
-        movey = -int(progress * GEMIMAGESIZE)
-    elif gem['direction'] == DOWN:
-        movey = int(progress * GEMIMAGESIZE)
-    elif gem['direction'] == RIGHT:
-        movex = int(progress * GEMIMAGESIZE)
-    elif gem['direction'] == LEFT:
-        movex = -int(progress * GEMIMAGESIZE)
-
-    basex = gem['x']
-    basey = gem['y']
-    if basey == ROWABOVEBOARD:
-        basey = -1
-
-    pixelx = XMARGIN + (basex * GEMIMAGESIZE)
-    pixely = YMARGIN + (basey * GEMIMAGESIZE)
-    r = pygame.Rect( (pixelx + movex, pixely + movey, GEMIMAGESIZE, GEMIMAGESIZE) )
-    DISPLAYSURF.blit(GEMIMAGES[gem['imageNum']], r)
-
-
-def pullDownAllGems(board):
-    # pulls down gems on the board to the bottom to fill in any gaps
-    for x in range(BOARDWIDTH):
-        gemsInColumn = []
-        for y in range(BOARDHEIGHT):
-            if board[x][y] != EMPTY_SPACE:
-                gemsInColumn.append(board[x][y])
-        board[x] = ([EMPTY_SPACE] * (BOARDHEIGHT - len(gemsInColumn))) + gemsInColumn
+    # Diagonal runs count here too, like in findMatchingGems().
+    return MINERULES.canMakeMove(board)
 
 
-def getGemAt(board, x, y):
-    if x < 0 or y < 0 or x >= BOARDWIDTH or y >= BOARDHEIGHT:
-        return None
-    else:
-        return board[x][y]
+def getMovingGemPosition(gem, progress):
+    offset = int(progress * 0.01 * GEMIMAGESIZE * gem.distance)
+    pixelx = XMARGIN + (gem.x * GEMIMAGESIZE) + gem.dx * offset
+    pixely = YMARGIN + (gem.y * GEMIMAGESIZE) + gem.dy * offset
+    return (pixelx, pixely)
 
 
 def getDropSlots(board):
-    boardCopy = copy.deepcopy(board)
-    pullDownAllGems(boardCopy)
-
-    dropSlots = []
-    for i in range(BOARDWIDTH):
-        dropSlots.append([])
+    return GEMGENERATOR.getDropSlots(board)
 
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT-1, -1, -1): # start from bottom, going up
-            if boardCopy[x][y] == EMPTY_SPACE:
-                possibleGems = list(range(len(GEMIMAGES)))
-                for offsetX, offsetY in ((0, -1), (1, 0), (0, 1), (-1, 0)):
-                    neighborGem = getGemAt(boardCopy, x + offsetX, y + offsetY)
-                    if neighborGem != None and neighborGem in possibleGems:
-                        possibleGems.remove(neighborGem)
-
-                newGem = random.choice(possibleGems)
-                boardCopy[x][y] = newGem
-                dropSlots[x].append(newGem)
-    return dropSlots
 
 
 def findMatchingGems(board):
-    gemsToRemove = []
-    boardCopy = copy.deepcopy(board)
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            # look for horizontal matches
-            if getGemAt(boardCopy, x, y) == getGemAt(boardCopy, x + 1, y) == getGemAt(boardCopy, x + 2, y) and getGemAt(boardCopy, x, y) != EMPTY_SPACE:
-                targetGem = boardCopy[x][y]
-                offset = 0
-                removeSet = []
-                while getGemAt(boardCopy, x + offset, y) == targetGem:
-                    removeSet.append((x + offset, y))
-                    boardCopy[x + offset][y] = EMPTY_SPACE
-                    offset += 1
-                gemsToRemove.append(removeSet)
-
-            # look for vertical matches
-            if getGemAt(boardCopy, x, y) == getGemAt(boardCopy, x, y + 1) == getGemAt(boardCopy, x, y + 2) and getGemAt(boardCopy, x, y) != EMPTY_SPACE:
-                targetGem = boardCopy[x][y]
-                offset = 0
-                removeSet = []
-                while getGemAt(boardCopy, x, y + offset) == targetGem:
-                    # keep checking, in case there's more than 3 gems in a row
-                    removeSet.append((x, y + offset))
-                    boardCopy[x][y + offset] = EMPTY_SPACE
-                    offset += 1
-                gemsToRemove.append(removeSet)
-            if getGemAt(boardCopy, x, y) == getGemAt(boardCopy, x + 1, y+1) == getGemAt(boardCopy, x + 2, y +2) and getGemAt(boardCopy, x, y) != EMPTY_SPACE:
-                targetGem = boardCopy[x][y]
-                offset = 0
-                removeSet = []
-                while getGemAt(boardCopy, x + offset, y+offset) == targetGem:
-                    # keep checking if there's more than 3 gems in a row
-                    removeSet.append((x + offset, y+offset))
-                    boardCopy[x + offset][y + offset] = EMPTY_SPACE
-                    offset += 1
-                gemsToRemove.append(removeSet)
-
-            if getGemAt(boardCopy, x, y) == getGemAt(boardCopy, x + 1, y-1) == getGemAt(boardCopy, x + 2, y -2) and getGemAt(boardCopy, x, y) != EMPTY_SPACE:
-                targetGem = boardCopy[x][y]
-                offset = 0
-                removeSet = []
-                while getGemAt(boardCopy, x + offset, y-offset) == targetGem:
-                    # keep checking if there's more than 3 gems in a row
-                    removeSet.append((x + offset, y-offset))
-                    boardCopy[x + offset][y - offset] = EMPTY_SPACE
-                    offset += 1
-                gemsToRemove.append(removeSet)
-
-    return gemsToRemove
+    return MINERULES.findMatchingGems(board)
 
 
 
@@ -365,26 +289,35 @@ def highlightSpace(x, y):
     pygame.draw.rect(DISPLAYSURF, HIGHLIGHTCOLOR, BOARDRECTS[x][y], 4)
 
 
-def getDroppingGems(board):
-    # Find all the gems that have an empty space below them
-    boardCopy = copy.deepcopy(board)
-    droppingGems = []
+def getFallingGems(board, dropSlots):
+    # Every gem that falls when the gems of board drop to the bottom and
+    # the gems in dropSlots come in from above, with the number of rows it
+    # falls as its distance. The gems of a slot start stacked above the
+    # board, the first one lowest.
+    fallingGems = []
     for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT - 2, -1, -1):
-            if boardCopy[x][y + 1] == EMPTY_SPACE and boardCopy[x][y] != EMPTY_SPACE:
-                # This space drops if not empty but the space below it is
-                droppingGems.append( {'imageNum': boardCopy[x][y], 'x': x, 'y': y, 'direction': DOWN} )
-                boardCopy[x][y] = EMPTY_SPACE
-    return droppingGems
-
-
-def animateMovingGems(board, gems, pointsText, score):
-    progress = 0
-    while progress < 100: # animation loop
+        landingY = BOARDHEIGHT - 1
+        for y in range(BOARDHEIGHT - 1, -1, -1):
+            if board[x][y] != EMPTY_SPACE:
+                if y != landingY:
+                    fallingGems.append(MovingGem(board[x][y], x, y, DOWN, landingY - y))
+                landingY -= 1
+        for i, gem in enumerate(dropSlots[x]):
+            fallingGems.append(MovingGem(gem, x, ROWABOVEBOARD - i, DOWN, landingY - ROWABOVEBOARD))
+    return fallingGems
+
+
+def animateMovingGems(board, gems, pointsText, score, duration=None):
+    if duration is None:
+        duration = 100.0 / MOVERATE / FPS
+    FPSCLOCK.tick()
+    elapsed = 0.0
+    while elapsed < duration: # animation loop
+        progress = 100 * elapsed / duration
         DISPLAYSURF.fill(BGCOLOR)
         drawBoard(board)
-        for gem in gems:
-            drawMovingGem(gem, progress)
+        DISPLAYSURF.blits([(GEMIMAGES[gem.imageNum], getMovingGemPosition(gem, progress))
+                           for gem in gems], doreturn=False)
         drawScore(score)
         for pointText in pointsText:
             pointsSurf = BASICFONT.render(str(pointText['points']), 1, SCORECOLOR)
@@ -393,51 +326,35 @@ def animateMovingGems(board, gems, pointsText, score):
             DISPLAYSURF.blit(pointsSurf, pointsRect)
 
         pygame.display.update()
-        FPSCLOCK.tick(FPS)
-        progress += MOVERATE
+        elapsed += FPSCLOCK.tick(FPS) / 1000.0
 
 
 def moveGems(board, movingGems):
+    # Returns the set of (x, y) spaces whose contents changed. The gems of
+    # a column have to be in bottom to top order, like getFallingGems()
+    # makes them.
+    changedSpaces = set()
     for gem in movingGems:
-        if gem['y'] != ROWABOVEBOARD:
-            board[gem['x']][gem['y']] = EMPTY_SPACE
-            movex = 0
-            movey = 0
-            if gem['direction'] == LEFT:
-                movex = -1
-            elif gem['direction'] == RIGHT:
-                movex = 1
-            elif gem['direction'] == DOWN:
-                movey = 1
-            elif gem['direction'] == UP:
-                movey = -1
-            board[gem['x'] + movex][gem['y'] + movey] = gem['imageNum']
-        else:
-            # gem is located above the board (where new gems come from)
-            board[gem['x']][0] = gem['imageNum'] # move to top row
-
-
-def fillBoardAndAnimate(board, points, score):
-    dropSlots = getDropSlots(board)
-    while dropSlots != [[]] * BOARDWIDTH:
-        # do the dropping animation as long as there are more gems to drop
-        movingGems = getDroppingGems(board)
-        for x in range(len(dropSlots)):
-            if len(dropSlots[x]) != 0:
-                # cause the lowest gem in each slot to begin moving in the DOWN direction
-                movingGems.append({'imageNum': dropSlots[x][0], 'x': x, 'y': ROWABOVEBOARD, 'direction': DOWN})
-
-        boardCopy = getBoardCopyMinusGems(board, movingGems)
-        animateMovingGems(boardCopy, movingGems, points, score)
-        moveGems(board, movingGems)
-
-        # Make the next row of gems from the drop slots
-        # the lowest by deleting the previous lowest gems.
-        for x in range(len(dropSlots)):
-            if len(dropSlots[x]) == 0:
-                continue
-            board[x][0] = dropSlots[x][0]
-            del dropSlots[x][0]
+        if gem.y >= 0:
+            board[gem.x][gem.y] = EMPTY_SPACE
+            changedSpaces.add((gem.x, gem.y))
+        newx = gem.x + gem.dx * gem.distance
+        newy = gem.y + gem.dy * gem.distance
+        board[newx][newy] = gem.imageNum
+        changedSpaces.add((newx, newy))
+    return changedSpaces
+
+
+def fillBoardAndAnimate(board, points, score, dropSlots=None):
+    # Returns the set of (x, y) spaces that got a different gem.
+    if dropSlots is None:
+        dropSlots = getDropSlots(board)
+    fallingGems = getFallingGems(board, dropSlots)
+    if not fallingGems:
+        return set()
+    boardCopy = getBoardCopyMinusGems(board, fallingGems)
+    animateMovingGems(boardCopy, fallingGems, points, score, DROPTIME)
+    return moveGems(board, fallingGems)
 
 
 def checkForGemClick(pos):
@@ -462,14 +379,14 @@ def getBoardCopyMinusGems(board, gems):
     # Creates and returns a copy of the passed board data structure,
     # with the gems in the "gems" list removed from it.
     #
-    # Gems is a list of dicts, with keys x, y, direction, imageNum
+    # Gems is a list of MovingGems
 
-    boardCopy = copy.deepcopy(board)
+    boardCopy = copyBoard(board)
 
     # Remove some of the gems from this board data structure copy.
     for gem in gems:
-        if gem['y'] != ROWABOVEBOARD:
-            boardCopy[gem['x']][gem['y']] = EMPTY_SPACE
+        if gem.y >= 0:
+            boardCopy[gem.x][gem.y] = EMPTY_SPACE
     return boardCopy
 
 
@@ -0,0 +1,197 @@
+"""
+Board generator for the match-3 games: deals new boards and refills that
+follow a game's MatchRules (see matchrules.py).
+
+    generator = BoardGenerator(MARIJARULES, numGems=4, rng=random.Random(seed))
+    board = generator.newBoard(8, 8)
+    dropSlots = generator.getDropSlots(board)
+
+newBoard() fills a board in one pass, space by space. Each space picks
+at random from the gems that don't complete a run with the spaces
+already filled, so the board never starts with a match. Before
+the pass, the gems of one move are planted on the board: a random shape
+from rules.movePatterns (minRun - 1 gems of a run and the gem one swap
+away from the missing space), so the board always has a legal move.
+
+getDropSlots() fills the empty spaces of a board the same way (the board
+is pulled down first, like cc_marija.getDropSlots() does), so refilled
+gems never make a run by themselves either; runs in a cascade only come
+from the gems that fell. If the refilled board would have no legal move,
+the refill is dealt again, up to REFILLATTEMPTS times.
+
+A space only runs out of gems when numGems is small next to the number
+of run directions (e.g. 3 gems with diagonal runs). The generator then
+backs up to the last space that ruled out one of its gems and picks
+again there, so it never gives up on a board that can be filled (a
+board size and gem count that can't be filled at all raise ValueError).
+A refill can be impossible to deal without a run (the gems left on the
+board decide that); it then makes one, and the cascade goes on.
+
+That only ends if most refills can be dealt without a run, so the
+generator takes more gem types than half the run directions: 2 gems do
+for rows and columns, diagonal runs need 3. (With 2 gems and diagonal
+runs, only rigid checkered boards have no run; nearly every refill makes
+one and a cascade never ends.)
+"""
+
+import random
+
+from matchrules import EMPTY_SPACE, MARIJARULES, pullDownAllGems
+
+REFILLATTEMPTS = 20 # times a refill is dealt again before a dead board is accepted
+PLANTATTEMPTS = 20 # moves planted on a new board before giving up on its size and gem count
+
+
+def checkNumGems(rules, numGems):
+    # Raises ValueError if numGems gem types are too few for the runs of
+    # rules to stop cascading (see above).
+    if numGems < 2 or numGems * 2 <= len(rules.directions):
+        raise ValueError('%d gem types are too few for runs in %d directions'
+                         % (numGems, len(rules.directions)))
+
+
+class BoardGenerator:
+    def __init__(self, rules=MARIJARULES, numGems=4, rng=None):
+        checkNumGems(rules, numGems)
+        self.rules = rules
+        self.numGems = numGems
+        self.rng = rng or random.Random()
+
+
+    def allowedGems(self, board, x, y):
+        # Returns the list of gems that can go in the space at x, y without
+        # completing a run with the spaces around it that are filled.
+        ruledOut = self._getRuledOutGems(board, x, y)
+        return [gem for gem in range(self.numGems) if gem not in ruledOut]
+
+
+    def _getRuledOutGems(self, board, x, y):
+        # Returns a dict of gem -> list of the other spaces of the runs it
+        # would complete in the space at x, y.
+        ruledOut = {}
+        for wx, wy, d, others in self.rules.getWindowsThrough((x, y), len(board), len(board[0])):
+            # others are the window's spaces after its first one; put the
+            # first one back and leave out x, y itself.
+            window = [space for space in ((wx, wy),) + others if space != (x, y)]
+            gem = board[window[0][0]][window[0][1]]
+            if gem == EMPTY_SPACE:
+                continue
+            for ox, oy in window:
+                if board[ox][oy] != gem:
+                    break
+            else:
+                ruledOut.setdefault(gem, []).extend(window)
+        return ruledOut
+
+
+    def _fill(self, board, spaces):
+        # Fills the (x, y) spaces of board in order with gems that don't
+        # complete a run. When a space has no gem left, the search backs
+        # up to the last filled space that ruled out one of its gems (the
+        # spaces in between had nothing to do with it, so picking them
+        # again can't help) and that space picks another gem. This is
+        # conflict-directed backjumping: each space keeps the set of
+        # earlier spaces that ruled out its gems, and hands it on to the
+        # space it backs up to. Raises ValueError if there is no way to
+        # fill them.
+        rng = self.rng
+        order = {space: i for i, space in enumerate(spaces)}
+        choices = [None] * len(spaces) # gems each space has not tried yet
+        conflicts = [set() for space in spaces] # earlier spaces (by index) that ruled out its gems
+        i = 0
+        while i < len(spaces):
+            x, y = spaces[i]
+            if choices[i] is None:
+                ruledOut = self._getRuledOutGems(board, x, y)
+                for windowSpaces in ruledOut.values():
+                    for space in windowSpaces:
+                        j = order.get(space)
+                        if j is not None:
+                            conflicts[i].add(j)
+                choices[i] = [gem for gem in range(self.numGems) if gem not in ruledOut]
+            gems = choices[i]
+            if gems:
+                pick = rng.randrange(len(gems))
+                board[x][y] = gems[pick]
+                gems[pick] = gems[-1]
+                gems.pop()
+                i += 1
+                continue
+
+            # back up to the latest space in conflict with this one
+            if not conflicts[i]:
+                raise ValueError('these spaces cannot be filled without making a run')
+            backTo = max(conflicts[i])
+            conflicts[backTo] |= conflicts[i]
+            conflicts[backTo].discard(backTo)
+            for j in range(backTo, i + 1):
+                if j > backTo:
+                    choices[j] = None
+                    conflicts[j] = set()
+                board[spaces[j][0]][spaces[j][1]] = EMPTY_SPACE
+            i = backTo
+
+
+    def newBoard(self, width, height):
+        # Returns a width x height board[x][y] with no runs and at least one
+        # legal move.
+        patterns = [pattern for pattern in self.rules.movePatterns
+                    if max(dx for dx, dy in pattern) < width and max(dy for dx, dy in pattern) < height]
+        for attempt in range(PLANTATTEMPTS):
+            board = [[EMPTY_SPACE] * height for x in range(width)]
+
+            # Plant one move: a shape that is one swap away from a run.
+            if patterns:
+                pattern = self.rng.choice(patterns)
+                startX = self.rng.randrange(width - max(dx for dx, dy in pattern))
+                startY = self.rng.randrange(height - max(dy for dx, dy in pattern))
+                gem = self.rng.randrange(self.numGems)
+                for dx, dy in pattern:
+                    board[startX + dx][startY + dy] = gem
+
+            try:
+                self._fill(board, [(x, y) for x in range(width) for y in range(height)
+                                   if board[x][y] == EMPTY_SPACE])
+            except ValueError:
+                continue # with 2 or 3 gems a plant can leave no way to fill the rest
+            return board
+        raise ValueError('no %dx%d board with %d gems has a legal move and no runs'
+                         % (width, height, self.numGems))
+
+
+    def getDropSlots(self, board):
+        # Creates a "drop slot" for each column and fills the slot with the
+        # gems that that column is lacking, the first gem in the slot the
+        # lowest one, like cc_marija.getDropSlots().
+        boardCopy = [list(column) for column in board]
+        pullDownAllGems(boardCopy)
+        spaces = [(x, y) for x in range(len(boardCopy)) if EMPTY_SPACE in boardCopy[x]
+                  for y in range(len(boardCopy[x]) - 1, -1, -1) # start from bottom, going up
+                  if boardCopy[x][y] == EMPTY_SPACE]
+
+        for attempt in range(REFILLATTEMPTS):
+            try:
+                self._fill(boardCopy, spaces)
+            except ValueError:
+                # The gems left on the board rule out every gem for some
+                # space, so this refill has to make a run (which cascades
+                # away like any other).
+                self._fillMakingRuns(boardCopy, spaces)
+                break
+            if not spaces or self.rules.canMakeMove(boardCopy) or attempt == REFILLATTEMPTS - 1:
+                break # the last attempt stays, even if it leaves no legal move
+            for x, y in spaces:
+                boardCopy[x][y] = EMPTY_SPACE
+
+        dropSlots = [[] for x in range(len(boardCopy))]
+        for x, y in spaces:
+            dropSlots[x].append(boardCopy[x][y])
+        return dropSlots
+
+
+    def _fillMakingRuns(self, board, spaces):
+        # Fills the spaces in order like _fill(), without backing up: a
+        # space with no gem left takes a random one.
+        for x, y in spaces:
+            gems = self.allowedGems(board, x, y) or range(self.numGems)
+            board[x][y] = self.rng.choice(gems)
@@ -0,0 +1,235 @@
+"""
+A pool of ready-made starting boards for the match-3 games, so a new
+game starts from a board read out of a file instead of one dealt (and
+checked) on the spot.
+
+Building a pool is an offline job, spread over a multiprocessing pool
+like selfplay.py. Board number i is dealt by a BoardGenerator seeded with
+(--seed + i), checked (no runs, enough legal moves) and rated:
+
+    python boardpool.py --boards 1000000 --tiers 1,20,30 --out boards.pool
+
+Each board also gets a refill seed: the game seeds the random number
+generator of its refills with it, so a pool board plays out the same way
+every time the same swaps are made on it.
+
+The file is a header, a small index of difficulty tiers and then the
+boards as fixed-size records, sorted by tier:
+
+    HEADER                 magic, version, width, height, gem types,
+                           variant, number of boards, number of tiers
+    TIER * number of tiers fewest legal moves in the tier, first record,
+                           number of records
+    records                RECORDHEAD (refill seed, legal moves, best
+                           first-round points) and then one byte per
+                           space, column by column
+
+A board's tier is the last one whose fewest legal moves it has, so with
+--tiers 1,20,30 tier 0 has the boards with 1 to 19 legal moves (the
+hardest) and tier 2 the boards with 30 or more. Boards with fewer legal
+moves than the first tier are thrown away.
+
+BoardPool reads a pool file through mmap, so opening it reads only the
+header and index, and picking a board is one slice of the file:
+
+    pool = BoardPool('boards.pool')
+    board, refillSeed, legalMoves, bestPoints = pool.sample(random, tier=0)
+"""
+
+import argparse, mmap, multiprocessing, os, random, struct, time
+
+from boardgen import BoardGenerator, checkNumGems
+from gemengine import GemEngine
+from selfplay import VARIANTS, percentile
+
+MAGIC = b'GEMPOOL\0'
+VERSION = 1
+
+# magic, version, width, height, gem types, variant, number of boards, number of tiers
+HEADER = struct.Struct('<8sHHHH16sQH')
+# fewest legal moves, first record, number of records
+TIER = struct.Struct('<HQQ')
+# refill seed, legal moves, best first-round points; the board follows
+RECORDHEAD = struct.Struct('<QHH')
+
+
+def rateBoard(seed, settings):
+    # Deals and rates board number seed. Returns its record as bytes, or
+    # None if it has fewer legal moves than the first tier.
+    rules = VARIANTS[settings['variant']]
+    rng = random.Random(seed)
+    board = BoardGenerator(rules, settings['gems'], rng).newBoard(settings['width'],
+                                                                  settings['height'])
+    if rules.findMatchingGems(board):
+        raise AssertionError('board %d was dealt with a run' % seed)
+    refillSeed = rng.getrandbits(64)
+
+    engine = GemEngine(settings['width'], settings['height'], settings['gems'],
+                       rules=rules, board=board)
+    moves = engine.moveIndex.getMoves()
+    if len(moves) < settings['tiers'][0]:
+        return None
+    bestPoints = max(engine.previewSwap(*move) for move in moves)
+    cells = bytearray()
+    for column in board:
+        cells.extend(column)
+    return RECORDHEAD.pack(refillSeed, min(len(moves), 0xffff), min(bestPoints, 0xffff)) + cells
+
+
+def getTier(legalMoves, tiers):
+    # The index of the last tier in tiers (a sorted list of fewest legal
+    # moves) that legalMoves reaches.
+    tier = 0
+    while tier + 1 < len(tiers) and legalMoves >= tiers[tier + 1]:
+        tier += 1
+    return tier
+
+
+def rateBoards(job):
+    # Runs in a worker process. Returns one bytes object of records for
+    # each tier, for a range of seeds.
+    firstSeed, numBoards, settings = job
+    tiers = settings['tiers']
+    records = [bytearray() for tier in tiers]
+    for seed in range(firstSeed, firstSeed + numBoards):
+        record = rateBoard(seed, settings)
+        if record is not None:
+            legalMoves = RECORDHEAD.unpack_from(record)[1]
+            records[getTier(legalMoves, tiers)] += record
+    return [bytes(tierRecords) for tierRecords in records]
+
+
+def writePool(path, settings, tierRecords):
+    # Writes a pool file. tierRecords is a list of lists of bytes objects,
+    # the records of each tier.
+    recordSize = RECORDHEAD.size + settings['width'] * settings['height']
+    counts = [sum(len(chunk) for chunk in chunks) // recordSize for chunks in tierRecords]
+    with open(path, 'wb') as poolFile:
+        poolFile.write(HEADER.pack(MAGIC, VERSION, settings['width'], settings['height'],
+                                   settings['gems'], settings['variant'].encode('ascii'),
+                                   sum(counts), len(counts)))
+        firstRecord = 0
+        for fewestMoves, count in zip(settings['tiers'], counts):
+            poolFile.write(TIER.pack(fewestMoves, firstRecord, count))
+            firstRecord += count
+        for chunks in tierRecords:
+            for chunk in chunks:
+                poolFile.write(chunk)
+
+
+class BoardPool:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.width, self.height, self.numGems, variant,
+         self.numBoards, numTiers) = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a version %d board pool' % (path, VERSION))
+        self.variant = variant.rstrip(b'\0').decode('ascii')
+        self.tiers = [TIER.unpack_from(self.data, HEADER.size + i * TIER.size)
+                      for i in range(numTiers)] # (fewest legal moves, first record, number of records)
+        self.recordSize = RECORDHEAD.size + self.width * self.height
+        self.recordsStart = HEADER.size + numTiers * TIER.size
+
+
+    def __len__(self):
+        return self.numBoards
+
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+    def matches(self, width, height, numGems, variant):
+        # Returns True if the pool's boards are for this game.
+        return (self.width, self.height, self.numGems, self.variant) == (width, height, numGems, variant)
+
+
+    def getBoard(self, i):
+        # Returns record i as (board, refill seed, legal moves, best
+        # first-round points), with board a board[x][y] list of lists.
+        start = self.recordsStart + i * self.recordSize
+        refillSeed, legalMoves, bestPoints = RECORDHEAD.unpack_from(self.data, start)
+        cells = self.data[start + RECORDHEAD.size:start + self.recordSize]
+        height = self.height
+        board = [list(cells[x * height:(x + 1) * height]) for x in range(self.width)]
+        return board, refillSeed, legalMoves, bestPoints
+
+
+    def sample(self, rng, tier=None):
+        # A random board (see getBoard()) from tier, or from the whole pool
+        # if tier is None.
+        if tier is None:
+            return self.getBoard(rng.randrange(self.numBoards))
+        fewestMoves, firstRecord, count = self.tiers[tier]
+        if not count:
+            raise ValueError('tier %d of the pool has no boards' % tier)
+        return self.getBoard(firstRecord + rng.randrange(count))
+
+
+def openPool(path, width, height, numGems, variant):
+    # The BoardPool in path if there is one for this game, else None.
+    if not os.path.exists(path):
+        return None
+    pool = BoardPool(path)
+    if not pool.matches(width, height, numGems, variant) or not len(pool):
+        pool.close()
+        return None
+    return pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds a pool of starting boards for the match-3 games.')
+    parser.add_argument('--boards', type=int, default=100000, help='number of boards to deal')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first board')
+    parser.add_argument('--variant', choices=sorted(VARIANTS), default='marija')
+    parser.add_argument('--width', type=int, default=8)
+    parser.add_argument('--height', type=int, default=8)
+    parser.add_argument('--gems', type=int, default=4, help='number of gem types (NUMGEMIMAGES)')
+    parser.add_argument('--tiers', default='1,20,30',
+                        help='fewest legal moves of each difficulty tier, hardest first')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk', type=int, default=1000, help='boards per job sent to a worker')
+    parser.add_argument('--out', default='boards.pool', help='pool file to write')
+    args = parser.parse_args()
+    try:
+        checkNumGems(VARIANTS[args.variant], args.gems)
+    except ValueError as e:
+        parser.error('--gems: %s' % e)
+    tiers = sorted(set(int(moves) for moves in args.tiers.split(',')))
+    if tiers[0] < 1 or tiers[-1] > 0xffff:
+        parser.error('--tiers must be between 1 and 65535 legal moves')
+
+    settings = {'width': args.width, 'height': args.height, 'gems': args.gems,
+                'variant': args.variant, 'tiers': tiers}
+    jobs = [(seed, min(args.chunk, args.seed + args.boards - seed), settings)
+            for seed in range(args.seed, args.seed + args.boards, args.chunk)]
+
+    startTime = time.perf_counter()
+    tierRecords = [[] for tier in tiers]
+    with multiprocessing.Pool(args.processes) as pool:
+        # imap() keeps the jobs in seed order, so the same arguments always
+        # make the same file.
+        for chunks in pool.imap(rateBoards, jobs):
+            for tier, chunk in enumerate(chunks):
+                tierRecords[tier].append(chunk)
+    writePool(args.out, settings, tierRecords)
+    elapsed = time.perf_counter() - startTime
+
+    pool = BoardPool(args.out)
+    print('%d of %d boards kept in %.1fs: %.0f boards/s'
+          % (len(pool), args.boards, elapsed, args.boards / elapsed))
+    for tier, (fewestMoves, firstRecord, count) in enumerate(pool.tiers):
+        if not count:
+            print('tier %d (%d+ moves): no boards' % (tier, fewestMoves))
+            continue
+        points = sorted(pool.getBoard(i)[3] for i in range(firstRecord, firstRecord + count))
+        print('tier %d (%d+ moves): %8d boards  best first-round points p10 %d  p50 %d  p90 %d'
+              % (tier, fewestMoves, count, percentile(points, 0.1), percentile(points, 0.5),
+                 percentile(points, 0.9)))
+    pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+A scrolling, zooming view of a match-3 board for cc_marija.py, so a
+board can be far bigger than the window (128x128 and up).
+
+The view maps board spaces to window pixels with arithmetic instead of
+a pygame.Rect per space: space x, y is at (left + x * size, top + y *
+size), where left, top is the window pixel of the board's top left
+corner and size is the space size of the zoom level. Scrolling moves
+left and top, zooming picks another size from sizes. A board smaller
+than the window along an axis is centred along it, like the fixed
+margins of the 8x8 game.
+
+visibleColumns() and visibleRows() are the spaces that are (partly) in
+the window, so drawing loops only visit those. version goes up every
+time the view scrolls or zooms, which tells the drawing code that
+everything on screen has to be drawn again.
+
+    view = BoardView(128, 128, DISPLAYSURF.get_rect(), (64, 32, 16, 8, 4))
+    view.scroll(0, 12)
+    view.zoom(1, pygame.mouse.get_pos())
+    rect = view.spaceRect(3, 4)
+"""
+
+import pygame
+
+
+class BoardView:
+    def __init__(self, boardWidth, boardHeight, viewport, sizes):
+        # viewport is the part of the window the board is shown in, sizes
+        # the space size in pixels of each zoom level, largest first.
+        self.boardWidth = boardWidth
+        self.boardHeight = boardHeight
+        self.viewport = pygame.Rect(viewport)
+        self.sizes = tuple(sizes)
+        self.version = 0
+
+        # Start at the largest zoom level that shows the whole board, or
+        # the smallest one if none does.
+        self.zoomLevel = len(self.sizes) - 1
+        for level, size in enumerate(self.sizes):
+            if boardWidth * size <= self.viewport.width and boardHeight * size <= self.viewport.height:
+                self.zoomLevel = level
+                break
+        self.size = self.sizes[self.zoomLevel]
+        self.left = self.viewport.left
+        self.top = self.viewport.top
+        self._clamp()
+
+
+    def _clamp(self):
+        # Centres the board along an axis it fits in, and otherwise keeps
+        # the window from scrolling past its edges.
+        viewport = self.viewport
+        boardPixels = self.boardWidth * self.size
+        if boardPixels <= viewport.width:
+            self.left = viewport.left + (viewport.width - boardPixels) // 2
+        else:
+            self.left = min(viewport.left, max(viewport.right - boardPixels, self.left))
+        boardPixels = self.boardHeight * self.size
+        if boardPixels <= viewport.height:
+            self.top = viewport.top + (viewport.height - boardPixels) // 2
+        else:
+            self.top = min(viewport.top, max(viewport.bottom - boardPixels, self.top))
+
+
+    def scroll(self, dx, dy):
+        # Moves the view dx, dy pixels over the board. Returns True if it
+        # moved.
+        oldPosition = (self.left, self.top)
+        self.left -= dx
+        self.top -= dy
+        self._clamp()
+        if (self.left, self.top) == oldPosition:
+            return False
+        self.version += 1
+        return True
+
+
+    def zoom(self, steps, anchor=None):
+        # Zooms in (steps > 0) or out (steps < 0) by that many levels,
+        # keeping the board point under the window pixel anchor (by
+        # default the middle of the view) where it is. Returns True if the
+        # zoom level changed.
+        level = max(0, min(len(self.sizes) - 1, self.zoomLevel - steps))
+        if level == self.zoomLevel:
+            return False
+        if anchor is None:
+            anchor = self.viewport.center
+        anchorX, anchorY = anchor
+        newSize = self.sizes[level]
+        self.left = anchorX - (anchorX - self.left) * newSize // self.size
+        self.top = anchorY - (anchorY - self.top) * newSize // self.size
+        self.zoomLevel = level
+        self.size = newSize
+        self._clamp()
+        self.version += 1
+        return True
+
+
+    def spacePosition(self, x, y):
+        # The window pixel of the top left corner of space x, y (which can
+        # be off the board, e.g. above it).
+        return (self.left + x * self.size, self.top + y * self.size)
+
+
+    def spaceRect(self, x, y):
+        return pygame.Rect(self.left + x * self.size, self.top + y * self.size, self.size, self.size)
+
+
+    def spaceAt(self, pos):
+        # The (x, y) space at window pixel pos, or None if pos is not on
+        # a space in the view.
+        if not self.viewport.collidepoint(pos):
+            return None
+        x = (pos[0] - self.left) // self.size
+        y = (pos[1] - self.top) // self.size
+        if 0 <= x < self.boardWidth and 0 <= y < self.boardHeight:
+            return (x, y)
+        return None
+
+
+    def visibleColumns(self):
+        # The range of board columns that are at least partly in the view.
+        return range(max(0, (self.viewport.left - self.left) // self.size),
+                     min(self.boardWidth, (self.viewport.right - self.left + self.size - 1) // self.size))
+
+
+    def visibleRows(self):
+        return range(max(0, (self.viewport.top - self.top) // self.size),
+                     min(self.boardHeight, (self.viewport.bottom - self.top + self.size - 1) // self.size))
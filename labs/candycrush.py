@@ -1,12 +1,16 @@
 import pygame
 import random
 
+from matchrules import CANDYCRUSHRULES
+from boardgen import BoardGenerator
+
 # --- Constants ---
 WIDTH, HEIGHT = 640, 700
 GRID_SIZE = 8
 TILE_SIZE = WIDTH // GRID_SIZE
 FPS = 30
 CANDY_TYPES = 4
+SEED = None # seed of the game's random number generator, None for a new game every time
 
 pygame.init()
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
@@ -27,62 +31,17 @@ IMAGES = [
 ]
 
 # --- Board Creation ---
-def create_board():
-    board = [[random.randint(0, CANDY_TYPES - 1) for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-    while find_matches(board):
-        remove_matches(board, find_matches(board))
-        apply_gravity(board)
-    return board
+def create_board(rng):
+    # Filled in one pass with no matches and at least one legal swap, see
+    # boardgen.py. The rules go in all four directions, so board[r][c]
+    # works the same as the generator's board[x][y].
+    return BoardGenerator(CANDYCRUSHRULES, CANDY_TYPES, rng).newBoard(GRID_SIZE, GRID_SIZE)
 
 # --- Match Detection (Rows, Columns, Diagonals, 3+) ---
 def find_matches(board):
-    matches = set()
-
-    # Horizontal
-    for r in range(GRID_SIZE):
-        c = 0
-        while c < GRID_SIZE - 2:
-            start = c
-            val = board[r][c]
-            while c < GRID_SIZE and board[r][c] == val:
-                c += 1
-            if c - start >= 3:
-                for x in range(start, c): matches.add((r, x))
-            if start == c: c += 1
-
-    # Vertical
-    for c in range(GRID_SIZE):
-        r = 0
-        while r < GRID_SIZE - 2:
-            start = r
-            val = board[r][c]
-            while r < GRID_SIZE and board[r][c] == val:
-                r += 1
-            if r - start >= 3:
-                for x in range(start, r): matches.add((x, c))
-            if start == r: r += 1
-
-    # Diagonal ↘
-    for r in range(GRID_SIZE - 2):
-        for c in range(GRID_SIZE - 2):
-            val = board[r][c]
-            k = 0
-            while r + k < GRID_SIZE and c + k < GRID_SIZE and board[r + k][c + k] == val:
-                k += 1
-            if k >= 3:
-                for i in range(k): matches.add((r + i, c + i))
-
-    # Diagonal ↙
-    for r in range(GRID_SIZE - 2):
-        for c in range(2, GRID_SIZE):
-            val = board[r][c]
-            k = 0
-            while r + k < GRID_SIZE and c - k >= 0 and board[r + k][c - k] == val:
-                k += 1
-            if k >= 3:
-                for i in range(k): matches.add((r + i, c - i))
-
-    return matches
+    # Set of (r, c) cells that are part of a run of 3+ in any direction,
+    # see MatchRules.findMatchedSpaces() in matchrules.py.
+    return CANDYCRUSHRULES.findMatchedSpaces(board)
 
 # --- Remove Matches ---
 def remove_matches(board, matches):
@@ -90,11 +49,11 @@ def remove_matches(board, matches):
         board[r][c] = -1
 
 # --- Gravity ---
-def apply_gravity(board):
+def apply_gravity(board, rng):
     for c in range(GRID_SIZE):
         stack = [board[r][c] for r in range(GRID_SIZE) if board[r][c] != -1]
         while len(stack) < GRID_SIZE:
-            stack.insert(0, random.randint(0, CANDY_TYPES - 1))
+            stack.insert(0, rng.randint(0, CANDY_TYPES - 1))
         for r in range(GRID_SIZE):
             board[r][c] = stack[r]
 
@@ -114,8 +73,9 @@ def draw(board, selected, score):
     pygame.display.flip()
 
 # --- Main Loop ---
-def main():
-    board = create_board()
+def main(seed=SEED):
+    rng = random.Random(seed) # every candy in the game comes from here
+    board = create_board(rng)
     selected = None
     score = 0
 
@@ -137,9 +97,9 @@ def main():
                         matches = find_matches(board)
                         if matches:
                             while matches:
-                                score += len(matches)
+                                score += CANDYCRUSHRULES.scoreGemSet(matches)
                                 remove_matches(board, matches)
-                                apply_gravity(board)
+                                apply_gravity(board, rng)
                                 matches = find_matches(board)
                         else:
                             board[r1][c1], board[r][c] = board[r][c], board[r1][c1]
@@ -0,0 +1,156 @@
+import numpy as np
+
+# NumPy version of the board logic in candycrush.py (diagonal matches
+# included). Instead of one board[r][c] list of lists it works on a whole
+# batch of boards at once: an int array of shape (N, GRID_SIZE, GRID_SIZE)
+# indexed as boards[n, r, c]. The shared rules engine,
+# matchrules.CANDYCRUSHRULES, is the reference implementation:
+# find_matches() here marks exactly the cells that
+# CANDYCRUSHRULES.findMatchedSpaces() returns for each board (which is
+# what candycrush.find_matches() returns too).
+#
+# This module does not import pygame or candycrush.py (which opens a
+# window on import), so it can be used for offline simulations.
+
+# --- Constants (same values as candycrush.py) ---
+GRID_SIZE = 8
+CANDY_TYPES = 4
+EMPTY = -1
+
+
+# --- Board Creation ---
+def create_boards(n, rng):
+    boards = rng.integers(0, CANDY_TYPES, size=(n, GRID_SIZE, GRID_SIZE))
+    resolve_cascades(boards, rng)
+    return boards
+
+
+# --- Match Detection (Rows, Columns, Diagonals, 3+) ---
+def find_matches(boards):
+    # Returns a bool array shaped like boards, True for every matched cell.
+    # A cell is matched when it is part of three equal cells in a row in
+    # any direction, which is the same set candycrush.find_matches() builds
+    # by following each run.
+    boards = np.asarray(boards)
+    matches = np.zeros(boards.shape, dtype=bool)
+
+    # Horizontal
+    mid = boards[:, :, 1:-1]
+    three = (boards[:, :, :-2] == mid) & (mid == boards[:, :, 2:])
+    matches[:, :, :-2] |= three
+    matches[:, :, 1:-1] |= three
+    matches[:, :, 2:] |= three
+
+    # Vertical
+    mid = boards[:, 1:-1, :]
+    three = (boards[:, :-2, :] == mid) & (mid == boards[:, 2:, :])
+    matches[:, :-2, :] |= three
+    matches[:, 1:-1, :] |= three
+    matches[:, 2:, :] |= three
+
+    # Diagonal ↘ and ↙ share the middle cell of each triplet
+    mid = boards[:, 1:-1, 1:-1]
+    three = (boards[:, :-2, :-2] == mid) & (mid == boards[:, 2:, 2:])
+    matches[:, :-2, :-2] |= three
+    matches[:, 1:-1, 1:-1] |= three
+    matches[:, 2:, 2:] |= three
+
+    three = (boards[:, :-2, 2:] == mid) & (mid == boards[:, 2:, :-2])
+    matches[:, :-2, 2:] |= three
+    matches[:, 1:-1, 1:-1] |= three
+    matches[:, 2:, :-2] |= three
+
+    return matches
+
+
+def match_set(matches, n):
+    # The matched cells of board n as a set of (r, c), the same form
+    # candycrush.find_matches() returns.
+    return {(int(r), int(c)) for r, c in zip(*np.nonzero(matches[n]))}
+
+
+# --- Remove Matches ---
+def remove_matches(boards, matches):
+    boards[matches] = EMPTY
+
+
+# --- Gravity ---
+def apply_gravity(boards, rng):
+    # Pulls the remaining candies of every column down (keeping their
+    # order) and fills the gaps at the top with random candies.
+    empty = boards == EMPTY
+    order = np.argsort(~empty, axis=1, kind='stable') # empty cells first
+    boards[...] = np.take_along_axis(boards, order, axis=1)
+    empty = np.take_along_axis(empty, order, axis=1)
+    boards[empty] = rng.integers(0, CANDY_TYPES, size=int(empty.sum()))
+
+
+def resolve_cascades(boards, rng):
+    # Removes matches and refills until no board has any left. Returns the
+    # points each board scored, counted like main() in candycrush.py
+    # (one point per matched cell per step).
+    #
+    # Only the boards that still have matches are carried into the next
+    # step, so a few long cascades don't make every board pay for them.
+    points = np.zeros(len(boards), dtype=np.int64)
+    active = np.arange(len(boards))
+    sub = boards
+    while len(active):
+        matches = find_matches(sub)
+        matched = matches.any(axis=(1, 2))
+        if not matched.all():
+            boards[active] = sub # store the boards that are done
+            active, sub, matches = active[matched], sub[matched], matches[matched]
+            if not len(active):
+                break
+        points[active] += matches.sum(axis=(1, 2))
+        remove_matches(sub, matches)
+        apply_gravity(sub, rng)
+    return points
+
+
+# --- Moves ---
+def swap_cells(boards, first, second):
+    # first and second are (N, 2) arrays of (row, col), one pair per board.
+    n = np.arange(len(boards))
+    r1, c1 = first[:, 0], first[:, 1]
+    r2, c2 = second[:, 0], second[:, 1]
+    boards[n, r1, c1], boards[n, r2, c2] = boards[n, r2, c2], boards[n, r1, c1].copy()
+
+
+def play_moves(boards, first, second, rng):
+    # Plays one swap on every board, like a click pair in main(): swaps
+    # that make no match are swapped back, the others cascade. Returns the
+    # points scored on each board.
+    swap_cells(boards, first, second)
+    matches = find_matches(boards)
+    bad = ~matches.any(axis=(1, 2))
+    if bad.any():
+        undo = boards[bad] # boolean indexing copies, so swap back and store
+        swap_cells(undo, first[bad], second[bad])
+        boards[bad] = undo
+    return resolve_cascades(boards, rng)
+
+
+def random_moves(n, rng):
+    # Random adjacent (first, second) cell pairs for n boards.
+    first = rng.integers(0, GRID_SIZE, size=(n, 2))
+    step = np.array([(0, 1), (1, 0), (0, -1), (-1, 0)])[rng.integers(0, 4, size=n)]
+    second = first + step
+    outside = (second < 0) | (second >= GRID_SIZE)
+    second[outside] = first[outside] - step[outside]
+    return first, second
+
+
+if __name__ == '__main__':
+    import time
+
+    rng = np.random.default_rng()
+    start = time.perf_counter()
+    boards = create_boards(2000, rng)
+    total = np.zeros(len(boards), dtype=np.int64)
+    for turn in range(10):
+        total += play_moves(boards, *random_moves(len(boards), rng), rng)
+    elapsed = time.perf_counter() - start
+    print('%d boards x 10 random moves in %.2fs, mean score %.1f'
+          % (len(boards), elapsed, total.mean()))
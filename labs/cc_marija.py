@@ -1,18 +1,31 @@
 
 """
-This program has "gem data structures", which are basically dictionaries
-with the following keys:
-  'x' and 'y' - The location of the gem on the board. 0,0 is the top left.
-                There is also a ROWABOVEBOARD row that 'y' can be set to,
+This program has "gem data structures", which are MovingGem objects (see
+movinggem.py) with the following attributes:
+  x and y     - The location of the gem on the board. 0,0 is the top left.
+                There is also a ROWABOVEBOARD row that y can be set to,
                 to indicate that it is above the board.
-  'direction' - one of the four constant variables UP, DOWN, LEFT, RIGHT.
+  direction   - one of the four constant variables UP, DOWN, LEFT, RIGHT.
                 This is the direction the gem is moving.
-  'imageNum'  - The integer index into GEMIMAGES to denote which image
+  dx and dy   - The board step of that direction, e.g. 0, 1 for DOWN.
+  imageNum    - The integer index into GEMIMAGES to denote which image
                 this gem uses.
 """
 
-import random, time, pygame, sys, copy
+import random, time, pygame, sys, os
 from pygame.locals import *
+from matchrules import MARIJARULES
+from boardgen import BoardGenerator
+from boardpool import openPool
+from movelog import MoveLogWriter, getLogPath, newSeed
+from savegame import saveGame, openSavedGame, reseed
+from movinggem import MovingGem, STEPDIRECTIONS, OPPOSITE, DOWN, ROWABOVEBOARD
+from dirtyscreen import DirtyScreen
+from boardview import BoardView
+from gemengine import GemEngine
+from gemsolver import HintSolver
+from hintworker import HintWorker
+from tweens import TweenScheduler, Tween, easeInQuad, easeInOutQuad
 
 FPS = 30 # frames per second to update the screen
 WINDOWWIDTH = 600  # width of the program's window, in pixels
@@ -22,18 +35,46 @@ BOARDWIDTH = 8 # how many columns in the board
 BOARDHEIGHT = 8 # how many rows in the board
 GEMIMAGESIZE = 64 # width & height of each space in pixels
 
+# A board that doesn't fit in the window (e.g. 128 x 128 for a co-op
+# event) is shown through a BoardView (see boardview.py): the arrow keys
+# scroll it, and the mouse wheel or + and - zoom through these space sizes.
+ZOOMSIZES = (GEMIMAGESIZE, 32, 16, 8, 4)
+SCROLLSPEED = 16 # pixels the view scrolls each frame an arrow key is held
+
 # NUMGEMIMAGES is the number of gem types. You will need .png image
 # files named gem0.png, gem1.png, etc. up to gem(N-1).png.
 NUMGEMIMAGES = 4
-assert NUMGEMIMAGES >= 1 # game needs at least 1 types of gems to work
+assert NUMGEMIMAGES >= 2 # game needs at least 2 types of gems to work
+
+# Deals the refills during the game.
+GEMGENERATOR = BoardGenerator(MARIJARULES, NUMGEMIMAGES, random)
 
 # NUMMATCHSOUNDS is the number of different sounds to choose from when
 # a match is made. The .wav files are named match0.wav, match1.wav, etc.
 #NUMMATCHSOUNDS = 6
 
 MOVERATE = 25 # 1 to 100, larger num means faster animations
+DROPTIME = 0.3 # seconds the gems of a refill take to fall, however far they fall
+SWAPEASING = easeInOutQuad # how the swapped gems speed up and slow down (see tweens.py)
+DROPEASING = easeInQuad # how falling gems speed up
+HINTEVENT = USEREVENT # the event the hint worker posts its best move so far with
+HINTMAXMOVES = 64 # most moves the hint solver looks at (the ones nearest the middle of the view)
+
+# Starting boards are read from this pool file (made by boardpool.py) if
+# it exists and was made for this board size and number of gem types.
+BOARDPOOLFILE = 'boards.pool'
+BOARDPOOLTIER = None # difficulty tier to pick boards from, None for any
+
+MOVELOGDIR = 'movelogs' # every game's move log goes here (see movelog.py), None for no logs
+# S saves the game to this file (see savegame.py), and the next game
+# resumes from it.
+SAVEFILE = 'marija.gemsave'
 DEDUCTSPEED = 0.8 # reduces score by 1 point every DEDUCTSPEED seconds.
 
+# When True, the board on the screen is compared against the engine's
+# board after every move.
+DEBUGBOARD = False
+
 #             R    G    B
 PURPLE    = (255,   0, 255)
 LIGHTBLUE = (170, 190, 255)
@@ -42,26 +83,17 @@ RED       = (255, 100, 100)
 BLACK     = (  0,   0,   0)
 BROWN     = ( 85,  65,   0)
 HIGHLIGHTCOLOR = PURPLE # color of the selected gem's border
+HINTCOLOR = RED # color of the border around a hinted swap
 BGCOLOR = LIGHTBLUE # background color on the screen
 GRIDCOLOR = BLUE # color of the game board
 GAMEOVERCOLOR = RED # color of the "Game over" text.
 GAMEOVERBGCOLOR = BLACK # background color of the "Game over" text.
 SCORECOLOR = BROWN # color of the text for the player's score
 
-XMARGIN = int((WINDOWWIDTH - GEMIMAGESIZE * BOARDWIDTH) / 2)
-YMARGIN = int((WINDOWHEIGHT - GEMIMAGESIZE * BOARDHEIGHT) / 2)
-
-# constants for direction values
-UP = 'up'
-DOWN = 'down'
-LEFT = 'left'
-RIGHT = 'right'
-
 EMPTY_SPACE = -1 # an arbitrary, nonpositive value
-ROWABOVEBOARD = 'row above board' # an arbitrary, noninteger value
 
 def main():
-    global FPSCLOCK, DISPLAYSURF, GEMIMAGES, BASICFONT, BOARDRECTS
+    global FPSCLOCK, DISPLAYSURF, GEMIMAGES, BASICFONT, VIEW, SCREEN, DRAWNBOARD, BOARDPOOL, HINTS, ANIMATIONS
 
     # Initial set up.
     pygame.init()
@@ -85,17 +117,24 @@ def main():
     # for i in range(NUMMATCHSOUNDS):
     #     GAMESOUNDS['match'].append(pygame.mixer.Sound('match%s.wav' % i))
 
-    # Create pygame.Rect objects for each board space to
-    # do board-coordinate-to-pixel-coordinate conversions.
-    BOARDRECTS = []
-    for x in range(BOARDWIDTH):
-        BOARDRECTS.append([])
-        for y in range(BOARDHEIGHT):
-            r = pygame.Rect((XMARGIN + (x * GEMIMAGESIZE),
-                             YMARGIN + (y * GEMIMAGESIZE),
-                             GEMIMAGESIZE,
-                             GEMIMAGESIZE))
-            BOARDRECTS[x].append(r)
+    # VIEW does the board-coordinate-to-pixel-coordinate conversions,
+    # and knows which spaces are in the window.
+    VIEW = BoardView(BOARDWIDTH, BOARDHEIGHT, DISPLAYSURF.get_rect(), ZOOMSIZES)
+
+    # Only the parts of the window that change are redrawn. DRAWNBOARD is
+    # the gem drawn in each space of SCREEN's layer (None where nothing
+    # is drawn yet), so drawBoard() can skip the rest.
+    background = pygame.Surface((WINDOWWIDTH, WINDOWHEIGHT)).convert()
+    background.fill(BGCOLOR)
+    SCREEN = DirtyScreen(DISPLAYSURF, background)
+    DRAWNBOARD = [[None] * BOARDHEIGHT for x in range(BOARDWIDTH)]
+    BOARDPOOL = openPool(BOARDPOOLFILE, BOARDWIDTH, BOARDHEIGHT, NUMGEMIMAGES, 'marija')
+    # The hint solver searches on its own thread whenever the board is
+    # at rest (see hintworker.py).
+    HINTS = HintWorker(HintSolver(NUMGEMIMAGES, MARIJARULES), HINTEVENT)
+    # Every animation is a tween that the game loop moves along each
+    # frame (see tweens.py), so events are handled while gems move.
+    ANIMATIONS = TweenScheduler()
 
     while True:
         runGame()
@@ -104,10 +143,47 @@ def main():
 def runGame():
     # Plays through a single game. When the game is over, this function returns.
 
-    # initalize the board
+    # initalize the board. The engine plays the moves; gameBoard is what
+    # is on the screen and catches up with the engine as each move is
+    # animated.
+    # Every gem of the game comes from its own random number generator,
+    # so the seed and the swaps are enough to play it again.
+    savedGame = openSavedGame(SAVEFILE, BOARDWIDTH, BOARDHEIGHT, NUMGEMIMAGES, 'marija')
+    if savedGame is not None:
+        os.remove(SAVEFILE) # a saved game is resumed once
+        seed = savedGame.seed
+        engine = GemEngine(BOARDWIDTH, BOARDHEIGHT, NUMGEMIMAGES, random.Random(seed),
+                           MARIJARULES, savedGame.board)
+        engine.score = savedGame.score
+    elif BOARDPOOL is not None:
+        board, seed, legalMoves, bestPoints = BOARDPOOL.sample(random, BOARDPOOLTIER)
+        engine = GemEngine(BOARDWIDTH, BOARDHEIGHT, NUMGEMIMAGES, random.Random(seed),
+                           MARIJARULES, board)
+    else:
+        seed = newSeed()
+        engine = GemEngine(BOARDWIDTH, BOARDHEIGHT, NUMGEMIMAGES, random.Random(seed),
+                           MARIJARULES)
+    moveLog = None
+    if MOVELOGDIR is not None:
+        moveLog = MoveLogWriter(getLogPath(MOVELOGDIR, 'marija', seed), 'marija', engine.board,
+                                NUMGEMIMAGES, seed, BOARDPOOL is not None or savedGame is not None,
+                                engine.score)
     gameBoard = getBlankBoard()
-    score = 0
-    fillBoardAndAnimate(gameBoard, [], score) # Drop the initial gems.
+    score = engine.score
+    SCREEN.setOverlays('game over', [])
+    HINTS.cancel() # the last game's search, if it was left running
+    ANIMATIONS.clear() # and the last game's animation
+    SCREEN.setOverlays('moving', [])
+    SCREEN.setOverlays('points', [])
+    drawScore(score)
+    dropGems(gameBoard, [], engine.initialDropSlots) # Drop the initial gems.
+    # While the board on the screen is catching up with the engine, the
+    # mouse events are kept in bufferedEvents, and handled once it has.
+    # settling is True until the game loop has seen it settle.
+    settling = True
+    bufferedEvents = []
+    hintMove = None # the two spaces of the best swap the hint worker has found so far
+    showHint = False # True once H is pressed, until the next move
 
     # initialize variables for the start of a new game
     firstSelectedGem = None
@@ -119,15 +195,45 @@ def runGame():
 
     while True: # main game loop
         clickedSpace = None
-        for event in pygame.event.get(): # event handling loop
-            if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
+        events = bufferedEvents + pygame.event.get()
+        bufferedEvents = []
+        for event in events: # event handling loop
+            if event.type in (MOUSEBUTTONDOWN, MOUSEBUTTONUP) and (settling or clickedSpace):
+                # Gems are moving, or this frame already has its click.
+                bufferedEvents.append(event)
+            elif event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
                 pygame.quit()
                 sys.exit()
             elif event.type == KEYUP and event.key == K_BACKSPACE:
+                if moveLog is not None:
+                    moveLog.close()
                 return # start a new game
+            elif event.type == KEYUP and event.key == K_s and not gameIsOver:
+                # The engine's generator restarts from a new seed, so the
+                # saved board and seed deal the rest of the game, and the
+                # move log goes on in a new log from here.
+                seed = reseed(engine.rng)
+                saveGame(SAVEFILE, 'marija', engine.board, NUMGEMIMAGES, engine.score, seed)
+                if moveLog is not None:
+                    moveLog.close()
+                    moveLog = MoveLogWriter(getLogPath(MOVELOGDIR, 'marija', seed), 'marija',
+                                            engine.board, NUMGEMIMAGES, seed, True, engine.score)
+            elif event.type == KEYUP and event.key == K_h and not gameIsOver:
+                showHint = True
+            elif event.type == HINTEVENT:
+                if HINTS.isCurrent(event):
+                    hintMove = event.move
+            elif event.type == KEYUP and event.key in (K_EQUALS, K_PLUS, K_KP_PLUS):
+                VIEW.zoom(1)
+            elif event.type == KEYUP and event.key in (K_MINUS, K_KP_MINUS):
+                VIEW.zoom(-1)
+            elif event.type == MOUSEWHEEL:
+                VIEW.zoom(event.y, pygame.mouse.get_pos())
 
             elif event.type == MOUSEBUTTONUP:
                 if gameIsOver:
+                    if moveLog is not None:
+                        moveLog.close()
                     return # after games ends, click to start a new game
 
                 if event.pos == (lastMouseDownX, lastMouseDownY):
@@ -156,58 +262,49 @@ def runGame():
                 firstSelectedGem = None # deselect the first gem
                 continue
 
-            # Show the swap animation on the screen.
-            boardCopy = getBoardCopyMinusGems(gameBoard, (firstSwappingGem, secondSwappingGem))
-            animateMovingGems(boardCopy, [firstSwappingGem, secondSwappingGem], [], score)
-
-            # Swap the gems in the board data structure.
-            gameBoard[firstSwappingGem['x']][firstSwappingGem['y']] = secondSwappingGem['imageNum']
-            gameBoard[secondSwappingGem['x']][secondSwappingGem['y']] = firstSwappingGem['imageNum']
-
-            # See if this is a matching move.
-            matchedGems = findMatchingGems(gameBoard)
-            if matchedGems == []:
-                # Was not a matching move; swap the gems back
-                #GAMESOUNDS['bad swap'].play()
-                animateMovingGems(boardCopy, [firstSwappingGem, secondSwappingGem], [], score)
-                gameBoard[firstSwappingGem['x']][firstSwappingGem['y']] = firstSwappingGem['imageNum']
-                gameBoard[secondSwappingGem['x']][secondSwappingGem['y']] = secondSwappingGem['imageNum']
-            else:
-                # This was a matching move.
-                scoreAdd = 0
-                while matchedGems != []:
-                    # Remove matched gems, then pull down the board.
-
-                    # points is a list of dicts that tells fillBoardAndAnimate()
-                    # where on the screen to display text to show how many
-                    # points the player got. points is a list because if
-                    # the playergets multiple matches, then multiple points text should appear.
-                    points = []
-                    for gemSet in matchedGems:
-                        scoreAdd += (10 + (len(gemSet) - 3) * 10)
-                        for gem in gemSet:
-                            gameBoard[gem[0]][gem[1]] = EMPTY_SPACE
-                        points.append({'points': scoreAdd,
-                                       'x': gem[0] * GEMIMAGESIZE + XMARGIN,
-                                       'y': gem[1] * GEMIMAGESIZE + YMARGIN})
-                    #random.choice(GAMESOUNDS['match']).play()
-                    score += scoreAdd
-
-                    # Drop the new gems.
-                    fillBoardAndAnimate(gameBoard, points, score)
-
-                    # Check if there are any new matches.
-                    matchedGems = findMatchingGems(gameBoard)
+            # The board is about to change, so the hint search is dropped
+            # (and the animation gets the time it was using).
+            HINTS.cancel()
+            hintMove = None
+            showHint = False
+
+            # Resolve the whole move in the engine first, then queue its
+            # animation for the game loop to play.
+            result = engine.swap((firstSwappingGem.x, firstSwappingGem.y),
+                                 (secondSwappingGem.x, secondSwappingGem.y))
+            if moveLog is not None:
+                moveLog.logSwap((firstSwappingGem.x, firstSwappingGem.y),
+                                (secondSwappingGem.x, secondSwappingGem.y), engine.score, engine.board)
+            animateMove(gameBoard, firstSwappingGem, secondSwappingGem, result)
             firstSelectedGem = None
-
-            if not canMakeMove(gameBoard):
+            settling = True
+
+        if settling and ANIMATIONS.isSettled():
+            # The board on the screen has caught up with the engine.
+            settling = False
+            score = engine.score
+            drawScore(score)
+            if DEBUGBOARD:
+                assert gameBoard == engine.board, 'screen board is out of step with the engine'
+            if engine.isGameOver():
                 gameIsOver = True
+                bufferedEvents = [] # clicks made during the last move don't skip the final score
+            else:
+                HINTS.search(engine.board, getHintMoves(engine.moveIndex.getMoves()))
+
+        # Held arrow keys scroll the view.
+        keys = pygame.key.get_pressed()
+        VIEW.scroll((keys[K_RIGHT] - keys[K_LEFT]) * SCROLLSPEED, (keys[K_DOWN] - keys[K_UP]) * SCROLLSPEED)
 
-        # Draw the board.
-        DISPLAYSURF.fill(BGCOLOR)
+        # Draw the board. Only what changed since the last frame is drawn.
         drawBoard(gameBoard)
+        highlights = []
+        if showHint and hintMove != None:
+            for hintx, hinty in hintMove:
+                highlights.append(getHighlightOverlay(hintx, hinty, HINTCOLOR))
         if firstSelectedGem != None:
-            highlightSpace(firstSelectedGem['x'], firstSelectedGem['y'])
+            highlights.append(getHighlightOverlay(firstSelectedGem['x'], firstSelectedGem['y']))
+        SCREEN.setOverlays('highlights', highlights)
         if gameIsOver:
             if clickContinueTextSurf == None:
                 # Only render the text once. In future iterations, just
@@ -215,14 +312,13 @@ def runGame():
                 clickContinueTextSurf = BASICFONT.render('Final Score: %s (Click to continue)' % (score), 1, GAMEOVERCOLOR, GAMEOVERBGCOLOR)
                 clickContinueTextRect = clickContinueTextSurf.get_rect()
                 clickContinueTextRect.center = int(WINDOWWIDTH / 2), int(WINDOWHEIGHT / 2)
-            DISPLAYSURF.blit(clickContinueTextSurf, clickContinueTextRect)
+            SCREEN.setOverlays('game over', [(clickContinueTextSurf, clickContinueTextRect)])
         #elif score > 0:
             # score drops over time
             #score -= 1
             #lastScoreDeduction = time.time()
-        drawScore(score)
-        pygame.display.update()
-        FPSCLOCK.tick(FPS)
+        SCREEN.present()
+        ANIMATIONS.update(FPSCLOCK.tick(FPS) / 1000.0)
 
 
 def getSwappingGems(board, firstXY, secondXY):
@@ -230,28 +326,13 @@ def getSwappingGems(board, firstXY, secondXY):
     # then their 'direction' keys are set to the appropriate direction
     # value to be swapped with each other.
     # Otherwise, (None, None) is returned.
-    firstGem = {'imageNum': board[firstXY['x']][firstXY['y']],
-                'x': firstXY['x'],
-                'y': firstXY['y']}
-    secondGem = {'imageNum': board[secondXY['x']][secondXY['y']],
-                 'x': secondXY['x'],
-                 'y': secondXY['y']}
-    highlightedGem = None
-    if firstGem['x'] == secondGem['x'] + 1 and firstGem['y'] == secondGem['y']:
-        firstGem['direction'] = LEFT
-        secondGem['direction'] = RIGHT
-    elif firstGem['x'] == secondGem['x'] - 1 and firstGem['y'] == secondGem['y']:
-        firstGem['direction'] = RIGHT
-        secondGem['direction'] = LEFT
-    elif firstGem['y'] == secondGem['y'] + 1 and firstGem['x'] == secondGem['x']:
-        firstGem['direction'] = UP
-        secondGem['direction'] = DOWN
-    elif firstGem['y'] == secondGem['y'] - 1 and firstGem['x'] == secondGem['x']:
-        firstGem['direction'] = DOWN
-        secondGem['direction'] = UP
-    else:
+    direction = STEPDIRECTIONS.get((secondXY['x'] - firstXY['x'], secondXY['y'] - firstXY['y']))
+    if direction is None:
         # These gems are not adjacent and can't be swapped.
         return None, None
+    firstGem = MovingGem(board[firstXY['x']][firstXY['y']], firstXY['x'], firstXY['y'], direction)
+    secondGem = MovingGem(board[secondXY['x']][secondXY['y']], secondXY['x'], secondXY['y'],
+                          OPPOSITE[direction])
     return firstGem, secondGem
 
 
@@ -263,280 +344,261 @@ def getBlankBoard():
     return board
 
 
-def canMakeMove(board):
-    # Return True if the board is in a state where a matching
-    # move can be made on it. Otherwise return False.
-
-    # The patterns in oneOffPatterns represent gems that are configured
-    # in a way where it only takes one move to make a triplet.
-    oneOffPatterns = (((0,1), (1,0), (2,0)),
-                      ((0,1), (1,1), (2,0)),
-                      ((0,0), (1,1), (2,0)),
-                      ((0,1), (1,0), (2,1)),
-                      ((0,0), (1,0), (2,1)),
-                      ((0,0), (1,1), (2,1)),
-                      ((0,0), (0,2), (0,3)),
-                      ((0,0), (0,1), (0,3)))
-
-    # The x and y variables iterate over each space on the board.
-    # If we use + to represent the currently iterated space on the
-    # board, then this pattern: ((0,1), (1,0), (2,0))refers to identical
-    # gems being set up like this:
-    #
-    #     +A
-    #     B
-    #     C
-    #
-    # That is, gem A is offset from the + by (0,1), gem B is offset
-    # by (1,0), and gem C is offset by (2,0). In this case, gem A can
-    # be swapped to the left to form a vertical three-in-a-row triplet.
-    #
-    # There are eight possible ways for the gems to be one move
-    # away from forming a triple, hence oneOffPattern has 8 patterns.
-
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            for pat in oneOffPatterns:
-                # check each possible pattern of "match in next move" to
-                # see if a possible move can be made.
-                if (getGemAt(board, x+pat[0][0], y+pat[0][1]) == \
-                    getGemAt(board, x+pat[1][0], y+pat[1][1]) == \
-                    getGemAt(board, x+pat[2][0], y+pat[2][1]) != None) or \
-                   (getGemAt(board, x+pat[0][1], y+pat[0][0]) == \
-                    getGemAt(board, x+pat[1][1], y+pat[1][0]) == \
-                    getGemAt(board, x+pat[2][1], y+pat[2][0]) != None):
-                    return True # return True the first time you find a pattern
-    return False
-
-
-def drawMovingGem(gem, progress):
-    # Draw a gem sliding in the direction that its 'direction' key
-    # indicates. The progress parameter is a number from 0 (just
-    # starting) to 100 (slide complete).
-    movex = 0
-    movey = 0
-    progress *= 0.01
-
-    if gem['direction'] == UP:
-        movey = -int(progress * GEMIMAGESIZE)
-    elif gem['direction'] == DOWN:
-        movey = int(progress * GEMIMAGESIZE)
-    elif gem['direction'] == RIGHT:
-        movex = int(progress * GEMIMAGESIZE)
-    elif gem['direction'] == LEFT:
-        movex = -int(progress * GEMIMAGESIZE)
-
-    basex = gem['x']
-    basey = gem['y']
-    if basey == ROWABOVEBOARD:
-        basey = -1
-
-    pixelx = XMARGIN + (basex * GEMIMAGESIZE)
-    pixely = YMARGIN + (basey * GEMIMAGESIZE)
-    r = pygame.Rect( (pixelx + movex, pixely + movey, GEMIMAGESIZE, GEMIMAGESIZE) )
-    DISPLAYSURF.blit(GEMIMAGES[gem['imageNum']], r)
-
-
-def pullDownAllGems(board):
-    # pulls down gems on the board to the bottom to fill in any gaps
-    for x in range(BOARDWIDTH):
-        gemsInColumn = []
-        for y in range(BOARDHEIGHT):
-            if board[x][y] != EMPTY_SPACE:
-                gemsInColumn.append(board[x][y])
-        board[x] = ([EMPTY_SPACE] * (BOARDHEIGHT - len(gemsInColumn))) + gemsInColumn
-
-
-def getGemAt(board, x, y):
-    if x < 0 or y < 0 or x >= BOARDWIDTH or y >= BOARDHEIGHT:
-        return None
-    else:
-        return board[x][y]
+def getMovingGemOverlay(gem, progress):
+    # Returns the (image, rect) overlay of a gem sliding in the direction
+    # that its dx and dy indicate. The progress parameter is a number
+    # from 0 (just starting) to 100 (slide complete).
+    size = VIEW.size
+    offset = int(progress * 0.01 * size * gem.distance)
+    pixelx, pixely = VIEW.spacePosition(gem.x, gem.y)
+    return (getZoomImages(size)[0][gem.imageNum],
+            (pixelx + gem.dx * offset, pixely + gem.dy * offset, size, size))
+
+
+def getHintMoves(moves):
+    # The moves the hint solver looks at: the ones in the view, and at most
+    # HINTMAXMOVES of them (those nearest the middle of the view), so a
+    # hint on a big board doesn't take longer than on a small one.
+    columns = VIEW.visibleColumns()
+    rows = VIEW.visibleRows()
+    visibleMoves = [((x1, y1), (x2, y2)) for (x1, y1), (x2, y2) in moves
+                    if x1 in columns and x2 in columns and y1 in rows and y2 in rows]
+    if len(visibleMoves) > HINTMAXMOVES:
+        middleX = (columns.start + columns.stop) / 2
+        middleY = (rows.start + rows.stop) / 2
+        visibleMoves.sort(key=lambda move: abs(move[0][0] - middleX) + abs(move[0][1] - middleY))
+        del visibleMoves[HINTMAXMOVES:]
+    return visibleMoves
+
+
+ZOOMIMAGES = {} # space size -> (gem images, space images), see getZoomImages()
+
+def getZoomImages(size):
+    # Returns the gem images scaled to size, and the images of a whole
+    # space (background, grid border and gem) that drawBoard() puts on
+    # the layer, indexed by gem + 1 so that EMPTY_SPACE (-1) is the first
+    # one. Each zoom level's images are made the first time it is shown.
+    if size not in ZOOMIMAGES:
+        if size == GEMIMAGESIZE:
+            gemImages = GEMIMAGES
+        else:
+            gemImages = [pygame.transform.smoothscale(image, (size, size)) for image in GEMIMAGES]
+        spaceImages = []
+        for gemImage in [None] + gemImages:
+            spaceImage = pygame.Surface((size, size)).convert()
+            spaceImage.fill(BGCOLOR)
+            pygame.draw.rect(spaceImage, GRIDCOLOR, spaceImage.get_rect(), 1)
+            if gemImage is not None:
+                spaceImage.blit(gemImage, (0, 0))
+            spaceImages.append(spaceImage)
+        ZOOMIMAGES[size] = (gemImages, spaceImages)
+    return ZOOMIMAGES[size]
 
 
 def getDropSlots(board):
     # Creates a "drop slot" for each column and fills the slot with a
-    # number of gems that that column is lacking. This function assumes
-    # that the gems have been gravity dropped already.
-    boardCopy = copy.deepcopy(board)
-    pullDownAllGems(boardCopy)
-
-    dropSlots = []
-    for i in range(BOARDWIDTH):
-        dropSlots.append([])
-
-    # count the number of empty spaces in each column on the board
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT-1, -1, -1): # start from bottom, going up
-            if boardCopy[x][y] == EMPTY_SPACE:
-                possibleGems = list(range(len(GEMIMAGES)))
-                for offsetX, offsetY in ((0, -1), (1, 0), (0, 1), (-1, 0)):
-                    # Narrow down the possible gems we should put in the
-                    # blank space so we don't end up putting an two of
-                    # the same gems next to each other when they drop.
-                    neighborGem = getGemAt(boardCopy, x + offsetX, y + offsetY)
-                    if neighborGem != None and neighborGem in possibleGems:
-                        possibleGems.remove(neighborGem)
-
-                newGem = random.choice(possibleGems)
-                boardCopy[x][y] = newGem
-                dropSlots[x].append(newGem)
-    return dropSlots
-
-
-def findMatchingGems(board):
-    gemsToRemove = [] # a list of lists of gems in matching triplets that should be removed
-    boardCopy = copy.deepcopy(board)
-
-    # loop through each space, checking for 3 adjacent identical gems
+    # number of gems that that column is lacking. The new gems never
+    # complete a run among themselves or with the gems already there (see
+    # boardgen.py).
+    return GEMGENERATOR.getDropSlots(board)
+
+
+HIGHLIGHTIMAGES = {} # (color, space size) -> transparent image of a space's highlighted border
+
+def getHighlightOverlay(x, y, color=HIGHLIGHTCOLOR):
+    # Returns the (image, rect) overlay that draws a border around the
+    # space at x, y.
+    key = (color, VIEW.size)
+    if key not in HIGHLIGHTIMAGES:
+        image = pygame.Surface((VIEW.size, VIEW.size), SRCALPHA)
+        pygame.draw.rect(image, color, image.get_rect(), max(1, VIEW.size // 16))
+        HIGHLIGHTIMAGES[key] = image
+    return (HIGHLIGHTIMAGES[key], VIEW.spaceRect(x, y))
+
+
+def getFallingGems(board, dropSlots):
+    # Returns a MovingGem for every gem that falls when the gems of board
+    # drop to the bottom and the gems in dropSlots come in from above, with
+    # the number of rows each one falls as its distance. The gems of a
+    # slot start stacked above the board, the first one lowest.
+    fallingGems = []
     for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            # look for horizontal matches
-            if getGemAt(boardCopy, x, y) == getGemAt(boardCopy, x + 1, y) == getGemAt(boardCopy, x + 2, y) and getGemAt(boardCopy, x, y) != EMPTY_SPACE:
-                targetGem = boardCopy[x][y]
-                offset = 0
-                removeSet = []
-                while getGemAt(boardCopy, x + offset, y) == targetGem:
-                    # keep checking if there's more than 3 gems in a row
-                    removeSet.append((x + offset, y))
-                    boardCopy[x + offset][y] = EMPTY_SPACE
-                    offset += 1
-                gemsToRemove.append(removeSet)
-
-            # look for vertical matches
-            if getGemAt(boardCopy, x, y) == getGemAt(boardCopy, x, y + 1) == getGemAt(boardCopy, x, y + 2) and getGemAt(boardCopy, x, y) != EMPTY_SPACE:
-                targetGem = boardCopy[x][y]
-                offset = 0
-                removeSet = []
-                while getGemAt(boardCopy, x, y + offset) == targetGem:
-                    # keep checking, in case there's more than 3 gems in a row
-                    removeSet.append((x, y + offset))
-                    boardCopy[x][y + offset] = EMPTY_SPACE
-                    offset += 1
-                gemsToRemove.append(removeSet)
-
-    return gemsToRemove
-
-
-def highlightSpace(x, y):
-    pygame.draw.rect(DISPLAYSURF, HIGHLIGHTCOLOR, BOARDRECTS[x][y], 4)
-
-
-def getDroppingGems(board):
-    # Find all the gems that have an empty space below them
-    boardCopy = copy.deepcopy(board)
-    droppingGems = []
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT - 2, -1, -1):
-            if boardCopy[x][y + 1] == EMPTY_SPACE and boardCopy[x][y] != EMPTY_SPACE:
-                # This space drops if not empty but the space below it is
-                droppingGems.append( {'imageNum': boardCopy[x][y], 'x': x, 'y': y, 'direction': DOWN} )
-                boardCopy[x][y] = EMPTY_SPACE
-    return droppingGems
-
-
-def animateMovingGems(board, gems, pointsText, score):
-    # pointsText is a dictionary with keys 'x', 'y', and 'points'
-    progress = 0 # progress at 0 represents beginning, 100 means finished.
-    while progress < 100: # animation loop
-        DISPLAYSURF.fill(BGCOLOR)
-        drawBoard(board)
-        for gem in gems: # Draw each gem.
-            drawMovingGem(gem, progress)
-        drawScore(score)
-        for pointText in pointsText:
-            pointsSurf = BASICFONT.render(str(pointText['points']), 1, SCORECOLOR)
-            pointsRect = pointsSurf.get_rect()
-            pointsRect.center = (pointText['x'], pointText['y'])
-            DISPLAYSURF.blit(pointsSurf, pointsRect)
-
-        pygame.display.update()
-        FPSCLOCK.tick(FPS)
-        progress += MOVERATE # progress the animation a little bit more for the next frame
+        landingY = BOARDHEIGHT - 1 # where the next gem up the column lands
+        for y in range(BOARDHEIGHT - 1, -1, -1):
+            if board[x][y] != EMPTY_SPACE:
+                if y != landingY:
+                    fallingGems.append(MovingGem(board[x][y], x, y, DOWN, landingY - y))
+                landingY -= 1
+        for i, gem in enumerate(dropSlots[x]):
+            fallingGems.append(MovingGem(gem, x, ROWABOVEBOARD - i, DOWN, landingY - ROWABOVEBOARD))
+    return fallingGems
+
+
+def animateGems(gems, pointsText, duration, easing, onDone=None):
+    # Starts a tween that slides gems, a list of MovingGems that are not
+    # on the board that drawBoard() draws, by their distance over duration
+    # seconds. pointsText is a list of dicts with keys 'x', 'y', and
+    # 'points' that are shown until the gems stop. onDone is called then.
+    pointsOverlays = []
+    for pointText in pointsText:
+        pointsSurf = BASICFONT.render(str(pointText['points']), 1, SCORECOLOR)
+        pointsRect = pointsSurf.get_rect()
+        pointsRect.center = (pointText['x'], pointText['y'])
+        pointsOverlays.append((pointsSurf, pointsRect))
+    SCREEN.setOverlays('points', pointsOverlays)
+
+    def showGems(progress):
+        # On a big board only the gems in (or next to) the columns in view
+        # can be seen, and of those only the ones in the window are drawn.
+        # Each frame redraws only the spaces the moving gems cross.
+        columns = VIEW.visibleColumns()
+        viewport = VIEW.viewport
+        overlays = []
+        for gem in gems:
+            if columns.start - 1 <= gem.x <= columns.stop:
+                overlay = getMovingGemOverlay(gem, 100 * progress)
+                if viewport.colliderect(overlay[1]):
+                    overlays.append(overlay)
+        SCREEN.setOverlays('moving', overlays)
+
+    def finish():
+        SCREEN.setOverlays('moving', [])
+        SCREEN.setOverlays('points', [])
+        if onDone is not None:
+            onDone()
+
+    ANIMATIONS.add(Tween(duration, easing, showGems, finish))
+
+
+def animateMove(board, firstGem, secondGem, result):
+    # Queues the animation of a move that the engine has played, result
+    # being its CascadeResult: the swap (and the swap back if it made no
+    # match), then each step of the cascade. board catches up with the
+    # engine's board as the animation goes.
+    gems = [firstGem, secondGem]
+    swapTime = 100.0 / MOVERATE / FPS # the time MOVERATE takes to move a gem one space
+
+    def startSwap():
+        for gem in gems:
+            board[gem.x][gem.y] = EMPTY_SPACE # the gems are drawn as they move instead
+        animateGems(gems, [], swapTime, SWAPEASING)
+
+    def endSwap():
+        # The two gems land swapped, or back where they were.
+        for gem in gems:
+            if result.valid:
+                board[gem.x + gem.dx][gem.y + gem.dy] = gem.imageNum
+            else:
+                board[gem.x][gem.y] = gem.imageNum
+
+    ANIMATIONS.then(startSwap)
+    if not result.valid:
+        # Was not a matching move; swap the gems back
+        #GAMESOUNDS['bad swap'].play()
+        backGems = [MovingGem(gem.imageNum, gem.x + gem.dx, gem.y + gem.dy, OPPOSITE[gem.direction])
+                    for gem in gems]
+        ANIMATIONS.then(lambda: animateGems(backGems, [], swapTime, SWAPEASING))
+    ANIMATIONS.then(endSwap)
+    for step in result.steps:
+        ANIMATIONS.then(lambda step=step: animateCascadeStep(board, step))
+
+
+def animateCascadeStep(board, step):
+    # Removes the matched gems of step, a CascadeStep, from board and
+    # drops the refill in.
+
+    # points is a list of dicts that tells animateGems() where on the
+    # screen to display text to show how many points the player got.
+    # points is a list because if the playergets multiple matches, then
+    # multiple points text should appear.
+    for gemSet in step.matchedGems:
+        for gem in gemSet:
+            board[gem[0]][gem[1]] = EMPTY_SPACE
+    points = []
+    for pointText in step.points:
+        pixelx, pixely = VIEW.spacePosition(pointText['x'], pointText['y'])
+        points.append({'points': pointText['points'], 'x': pixelx, 'y': pixely})
+    #random.choice(GAMESOUNDS['match']).play()
+    drawScore(step.score)
+    dropGems(board, points, step.dropSlots)
 
 
 def moveGems(board, movingGems):
-    # movingGems is a list of dicts with keys x, y, direction, imageNum
+    # movingGems is a list of MovingGems
+    # Returns the set of (x, y) spaces whose contents changed.
+    # The gems of a column have to be in bottom to top order, like
+    # getFallingGems() makes them, so no gem lands where one is leaving.
+    changedSpaces = set()
     for gem in movingGems:
-        if gem['y'] != ROWABOVEBOARD:
-            board[gem['x']][gem['y']] = EMPTY_SPACE
-            movex = 0
-            movey = 0
-            if gem['direction'] == LEFT:
-                movex = -1
-            elif gem['direction'] == RIGHT:
-                movex = 1
-            elif gem['direction'] == DOWN:
-                movey = 1
-            elif gem['direction'] == UP:
-                movey = -1
-            board[gem['x'] + movex][gem['y'] + movey] = gem['imageNum']
-        else:
-            # gem is located above the board (where new gems come from)
-            board[gem['x']][0] = gem['imageNum'] # move to top row
-
-
-def fillBoardAndAnimate(board, points, score):
-    dropSlots = getDropSlots(board)
-    while dropSlots != [[]] * BOARDWIDTH:
-        # do the dropping animation as long as there are more gems to drop
-        movingGems = getDroppingGems(board)
-        for x in range(len(dropSlots)):
-            if len(dropSlots[x]) != 0:
-                # cause the lowest gem in each slot to begin moving in the DOWN direction
-                movingGems.append({'imageNum': dropSlots[x][0], 'x': x, 'y': ROWABOVEBOARD, 'direction': DOWN})
-
-        boardCopy = getBoardCopyMinusGems(board, movingGems)
-        animateMovingGems(boardCopy, movingGems, points, score)
-        moveGems(board, movingGems)
-
-        # Make the next row of gems from the drop slots
-        # the lowest by deleting the previous lowest gems.
-        for x in range(len(dropSlots)):
-            if len(dropSlots[x]) == 0:
-                continue
-            board[x][0] = dropSlots[x][0]
-            del dropSlots[x][0]
+        if gem.y >= 0: # gems above the board (where new gems come from) leave no space
+            board[gem.x][gem.y] = EMPTY_SPACE
+            changedSpaces.add((gem.x, gem.y))
+        newx = gem.x + gem.dx * gem.distance
+        newy = gem.y + gem.dy * gem.distance
+        board[newx][newy] = gem.imageNum
+        changedSpaces.add((newx, newy))
+    return changedSpaces
+
+
+def dropGems(board, points, dropSlots=None):
+    # Starts the animation of the gems in dropSlots (see getDropSlots())
+    # dropping into board, or new random gems if dropSlots is None. Every
+    # gem falls straight to where it lands in one tween that takes
+    # DROPTIME seconds, and is put on the board when it lands.
+    if dropSlots is None:
+        dropSlots = getDropSlots(board)
+    fallingGems = getFallingGems(board, dropSlots)
+    if not fallingGems:
+        return
+    for gem in fallingGems:
+        if gem.y >= 0:
+            board[gem.x][gem.y] = EMPTY_SPACE # the gem is drawn as it falls instead
+    animateGems(fallingGems, points, DROPTIME, DROPEASING, lambda: moveGems(board, fallingGems))
 
 
 def checkForGemClick(pos):
     # See if the mouse click was on the board
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            if BOARDRECTS[x][y].collidepoint(pos[0], pos[1]):
-                return {'x': x, 'y': y}
-    return None # Click was not on the board.
-
+    space = VIEW.spaceAt(pos)
+    if space is None:
+        return None # Click was not on the board.
+    return {'x': space[0], 'y': space[1]}
 
-def drawBoard(board):
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            pygame.draw.rect(DISPLAYSURF, GRIDCOLOR, BOARDRECTS[x][y], 1)
-            gemToDraw = board[x][y]
-            if gemToDraw != EMPTY_SPACE:
-                DISPLAYSURF.blit(GEMIMAGES[gemToDraw], BOARDRECTS[x][y])
 
+DRAWNVIEW = [None] # the VIEW.version that DRAWNBOARD was drawn with
 
-def getBoardCopyMinusGems(board, gems):
-    # Creates and returns a copy of the passed board data structure,
-    # with the gems in the "gems" list removed from it.
-    #
-    # Gems is a list of dicts, with keys x, y, direction, imageNum
-
-    boardCopy = copy.deepcopy(board)
-
-    # Remove some of the gems from this board data structure copy.
-    for gem in gems:
-        if gem['y'] != ROWABOVEBOARD:
-            boardCopy[gem['x']][gem['y']] = EMPTY_SPACE
-    return boardCopy
-
+def drawBoard(board):
+    # Draws the gems of board that are in the view on SCREEN's layer,
+    # skipping the spaces that already show the right gem. After the view
+    # scrolls or zooms, every space in it is drawn again.
+    if DRAWNVIEW[0] != VIEW.version:
+        SCREEN.clearLayer()
+        for drawnColumn in DRAWNBOARD:
+            drawnColumn[:] = [None] * BOARDHEIGHT
+        DRAWNVIEW[0] = VIEW.version
+    spaceImages = getZoomImages(VIEW.size)[1]
+    rows = VIEW.visibleRows()
+    for x in VIEW.visibleColumns():
+        drawnColumn = DRAWNBOARD[x]
+        column = board[x]
+        if drawnColumn == column:
+            continue
+        for y in rows:
+            gemToDraw = column[y]
+            if gemToDraw != drawnColumn[y]:
+                SCREEN.drawLayer(VIEW.spaceRect(x, y), spaceImages[gemToDraw + 1])
+                drawnColumn[y] = gemToDraw
+
+
+SCOREOVERLAY = [None, None] # the score last rendered, and its (image, rect) overlay
 
 def drawScore(score):
-    scoreImg = BASICFONT.render(str(score), 1, SCORECOLOR)
-    scoreRect = scoreImg.get_rect()
-    scoreRect.bottomleft = (10, WINDOWHEIGHT - 6)
-    DISPLAYSURF.blit(scoreImg, scoreRect)
+    # The score text is only rendered again when the score changes.
+    if SCOREOVERLAY[0] != score:
+        scoreImg = BASICFONT.render(str(score), 1, SCORECOLOR)
+        scoreRect = scoreImg.get_rect()
+        scoreRect.bottomleft = (10, WINDOWHEIGHT - 6)
+        SCOREOVERLAY[:] = [score, (scoreImg, scoreRect)]
+    SCREEN.setOverlays('score', [SCOREOVERLAY[1]])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,117 @@
+"""
+Dirty rectangle drawing for the pygame games: only the parts of the
+window that changed are redrawn and passed to pygame.display.update().
+
+A DirtyScreen has two kinds of things on it:
+
+  - The layer: a copy of the background (drawn once) with whatever was
+    put on it with drawLayer(), e.g. the gems resting on the board. It
+    only changes where drawLayer() is called.
+  - Overlays: images drawn on top of the layer, e.g. the selection
+    highlight, the score, gems in the middle of an animation. They are
+    set in named groups with setOverlays(), which only marks the window
+    dirty where an overlay appeared, moved, changed or went away.
+
+present() redraws the dirty rectangles (layer first, then the overlays
+that cross them) and updates just those rectangles on the display. When
+nothing changed it does nothing, so an idle game costs next to no CPU.
+
+    screen = DirtyScreen(DISPLAYSURF, background)
+    screen.drawLayer(BOARDRECTS[x][y], GEMIMAGES[gem])
+    screen.setOverlays('score', [(scoreImg, scoreRect)])
+    screen.present()
+"""
+
+import pygame
+
+# With more dirty rectangles than this (e.g. thousands of gems falling on
+# a big board at a small zoom), they are drawn as the one rectangle that
+# covers them all, instead of matching every overlay against every one.
+MAXDIRTYRECTS = 256
+
+
+class DirtyScreen:
+    def __init__(self, surface, background):
+        self.surface = surface # the display surface
+        self.background = background # surface the size of the window, never changed
+        self.layer = background.copy()
+        self.overlays = {} # (group, i) -> (image, rect), in drawing order
+        self.groupSizes = {} # group -> number of overlays in it
+        self.dirty = [surface.get_rect()] # the first present() draws the whole window
+
+
+    def drawLayer(self, rect, image=None):
+        # Puts back the background in rect on the layer and draws image
+        # (if any) on top of it.
+        self.layer.blit(self.background, rect, rect)
+        if image is not None:
+            self.layer.blit(image, rect)
+        self.dirty.append(pygame.Rect(rect))
+
+
+    def setOverlays(self, group, items):
+        # Sets the overlays of group to items, a list of (image, rect)
+        # tuples drawn in that order. An overlay that is the same image
+        # object at the same place as before doesn't make anything dirty.
+        overlays = self.overlays
+        dirty = self.dirty
+        for i, (image, rect) in enumerate(items):
+            key = (group, i)
+            old = overlays.get(key)
+            if old is not None:
+                if old[0] is image and old[1] == rect:
+                    continue
+                dirty.append(old[1])
+            rect = pygame.Rect(rect)
+            overlays[key] = (image, rect)
+            dirty.append(rect)
+        for i in range(len(items), self.groupSizes.get(group, 0)):
+            dirty.append(overlays.pop((group, i))[1])
+        self.groupSizes[group] = len(items)
+
+
+    def redrawAll(self):
+        self.dirty = [self.surface.get_rect()]
+
+
+    def clearLayer(self):
+        # Puts the whole background back on the layer, e.g. when the view
+        # of the board scrolls and everything on it is drawn again.
+        self.layer.blit(self.background, (0, 0))
+        self.redrawAll()
+
+
+    def present(self):
+        # Redraws and updates the dirty parts of the window. Returns the
+        # list of rectangles that were updated.
+        if not self.dirty:
+            return []
+        windowRect = self.surface.get_rect()
+        dirty = []
+        seen = set()
+        for rect in self.dirty:
+            rect = rect.clip(windowRect)
+            key = tuple(rect)
+            if rect.width and rect.height and key not in seen:
+                seen.add(key)
+                dirty.append(rect)
+        self.dirty = []
+        if len(dirty) > MAXDIRTYRECTS:
+            dirty = [dirty[0].unionall(dirty[1:])]
+
+        layer = self.layer
+        overlays = list(self.overlays.values())
+        overlayRects = [rect for image, rect in overlays]
+        blits = [] # (source, destination, area), all drawn with one Surface.blits() call
+        for dirtyRect in dirty:
+            # Each dirty rectangle is drawn whole, layer then overlays, so
+            # an image with transparency is never blended in twice where
+            # two dirty rectangles overlap.
+            blits.append((layer, dirtyRect, dirtyRect))
+            for i in dirtyRect.collidelistall(overlayRects):
+                image, rect = overlays[i]
+                clip = rect.clip(dirtyRect)
+                blits.append((image, clip, clip.move(-rect.x, -rect.y)))
+        self.surface.blits(blits, doreturn=False)
+        pygame.display.update(dirty)
+        return dirty
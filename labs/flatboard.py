@@ -0,0 +1,149 @@
+"""
+A match-3 board stored in one flat array('b'), column by column, that
+still works as the board[x][y] data structure of cc_marija.py and
+CandyCrush_mine.py.
+
+  - clone() copies the board with a single memcpy of the array, instead
+    of copy.deepcopy() building a new list for every column.
+  - Changes can be logged and undone: mark() starts (or continues) the
+    undo log and returns a position in it, undo(position) puts back every
+    space changed since then. A search can play a move and take it back
+    without copying the board at all.
+
+A FlatBoard is a list of memoryviews, one per column, so board[x][y]
+reads and writes go straight to the array at the speed of a list of
+lists. Writes made that way are not logged, though: the changes to undo
+have to go through setGem(), clearGems() and setColumn() (board[x] = [...]
+calls setColumn()).
+
+copyBoard() copies either kind of board and is what the games use in
+place of copy.deepcopy().
+"""
+
+from array import array
+
+EMPTY_SPACE = -1 # same value as in cc_marija.py
+
+
+class FlatBoard(list):
+    def __init__(self, width, height, cells=None):
+        self.width = width
+        self.height = height
+        if cells is None:
+            cells = array('b', [EMPTY_SPACE]) * (width * height)
+        self.cells = cells # cells[x * height + y] is the gem at x, y
+        self.log = None # list of (index, old gem) while changes are being logged
+        view = memoryview(cells)
+        list.__init__(self, [view[x * height:(x + 1) * height] for x in range(width)])
+
+
+    @classmethod
+    def fromBoard(cls, board):
+        # Makes a FlatBoard from a board[x][y] list of lists.
+        cells = array('b')
+        for column in board:
+            cells.extend(column)
+        return cls(len(board), len(board[0]), cells)
+
+
+    def toBoard(self):
+        # The board as a list of lists.
+        return [column.tolist() for column in self]
+
+
+    def clone(self):
+        return FlatBoard(self.width, self.height, array('b', self.cells))
+
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+
+    def __reduce__(self):
+        # memoryviews can't be pickled, so rebuild them from the array.
+        return (FlatBoard, (self.width, self.height, self.cells))
+
+
+    def __setitem__(self, x, gems):
+        # board[x] = [...] replaces a whole column, like pullDownAllGems() does.
+        self.setColumn(x, gems)
+
+
+    def __eq__(self, other):
+        if isinstance(other, FlatBoard):
+            return self.width == other.width and self.cells == other.cells
+        return self.toBoard() == other
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def __repr__(self):
+        return 'FlatBoard.fromBoard(%r)' % self.toBoard()
+
+
+    def setGem(self, x, y, gem):
+        i = x * self.height + y
+        if self.log is not None:
+            self.log.append((i, self.cells[i]))
+        self.cells[i] = gem
+
+
+    def clearGems(self, spaces):
+        # Sets every (x, y) in spaces to EMPTY_SPACE.
+        for x, y in spaces:
+            self.setGem(x, y, EMPTY_SPACE)
+
+
+    def setColumn(self, x, gems):
+        # Replaces column x with the gems in the list gems (top first), for
+        # example after the column has been compacted by gravity. Only the
+        # spaces that change are logged.
+        if len(gems) != self.height:
+            raise ValueError('a column needs %d gems, not %d' % (self.height, len(gems)))
+        cells = self.cells
+        start = x * self.height
+        if self.log is None:
+            cells[start:start + self.height] = array('b', gems)
+            return
+        for y, gem in enumerate(gems):
+            if cells[start + y] != gem:
+                self.log.append((start + y, cells[start + y]))
+                cells[start + y] = gem
+
+
+    def mark(self):
+        # Starts logging changes (if they weren't already) and returns the
+        # current position in the undo log.
+        if self.log is None:
+            self.log = []
+        return len(self.log)
+
+
+    def undo(self, position=0):
+        # Reverts every change logged since mark() returned position. Undoing
+        # back to 0 also stops logging.
+        log = self.log
+        cells = self.cells
+        while len(log) > position:
+            i, gem = log.pop()
+            cells[i] = gem
+        if position == 0:
+            self.log = None
+
+
+def copyBoard(board):
+    # A copy of a FlatBoard or of a list of lists board. Much cheaper than
+    # copy.deepcopy(), which walks the board object by object.
+    if isinstance(board, FlatBoard):
+        return board.clone()
+    return [column[:] for column in board]
+
+
+def setGemAt(board, x, y, gem):
+    # board[x][y] = gem, logged if board is a FlatBoard.
+    if isinstance(board, FlatBoard):
+        board.setGem(x, y, gem)
+    else:
+        board[x][y] = gem
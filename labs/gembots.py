@@ -0,0 +1,247 @@
+"""
+Load tester for gemserver.py: bots that play match-3 games against the
+server over loopback, as fast as it answers, and report how many moves
+a second it checked and how long each one took.
+
+    python gemserver.py --port 7878 &
+    python gembots.py --port 7878 --connections 50 --games 20 --seconds 10
+
+or, to start (and stop) a server of its own:
+
+    python gembots.py --spawn --engine batch --seconds 10
+
+Each connection plays --games games at once, with one request of each
+game in flight, so there are connections * games requests waiting on the
+server at any time. A game that runs out of moves is ended and a new one
+started. The bots pick their moves from the boards in the replies, all
+the boards of one read at a time (see GemEnv.evaluateSwaps()):
+
+    legal   a random legal swap
+    greedy  the swap whose first round of matches scores the most
+    random  any two neighbours, so most swaps make no match and are
+            turned down by the server
+
+The latency of a move is the time from writing its SWAP to reading its
+reply, so it counts the time the request waited behind the others.
+"""
+
+import argparse, asyncio, collections, os, subprocess, sys, time
+
+import numpy as np
+
+from gemenv import GemEnv
+from gemserver import (HELLO, REQUEST, REPLY, MAGIC, VERSION, NEWGAME, SWAP, ENDGAME, OK, NOMATCH, BADSWAP,
+                       unpackBoards)
+from savegame import getPackedSize
+from selfplay import percentile
+
+
+class BotProtocol(asyncio.Protocol):
+    # One connection's bots.
+    def __init__(self, tester):
+        self.tester = tester
+        self.buffer = b''
+        self.hello = None
+        self.pending = collections.deque() # (request, time written) of each request waiting for its reply
+        self.done = asyncio.get_running_loop().create_future()
+
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+
+    def connection_lost(self, exc):
+        if not self.done.done():
+            self.done.set_exception(exc or ConnectionError('the server closed the connection'))
+
+
+    def send(self, requests):
+        # Writes requests, a list of REQUEST tuples, in one go.
+        now = time.perf_counter()
+        for request in requests:
+            self.pending.append((request[0], now))
+        self.transport.write(b''.join(REQUEST.pack(*request) for request in requests))
+
+
+    def data_received(self, data):
+        if self.buffer:
+            data = self.buffer + data
+        if self.hello is None:
+            if len(data) < HELLO.size:
+                self.buffer = data
+                return
+            self.startGames(HELLO.unpack_from(data))
+            data = data[HELLO.size:]
+
+        replySize = self.replySize
+        count = len(data) // replySize
+        self.buffer = data[count * replySize:]
+        if count:
+            self.handleReplies(data[:count * replySize], count)
+
+
+    def startGames(self, hello):
+        magic, version, width, height, numGems, bitsPerSpace, variant = hello
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a version %d gem server' % VERSION)
+        self.hello = hello
+        self.width = width
+        self.height = height
+        self.bitsPerSpace = bitsPerSpace
+        self.replySize = REPLY.size + getPackedSize(width, height, bitsPerSpace)
+        self.env = self.tester.getEnv(variant.rstrip(b'\0').decode('ascii'), width, height, numGems)
+        self.send([(NEWGAME, 0, 0, 0, 0, 0)] * self.tester.games)
+
+
+    def handleReplies(self, data, count):
+        tester = self.tester
+        now = time.perf_counter()
+        replies = np.frombuffer(data, dtype=np.uint8).reshape(count, self.replySize)
+        toMove = [] # (game number, index of its reply) of the games that move next
+        requests = []
+        for i in range(count):
+            status, gameNumber, points, score, gameOver = REPLY.unpack_from(data, i * self.replySize)
+            request, sent = self.pending.popleft()
+            if request == SWAP:
+                tester.latencies.append(now - sent)
+                tester.moves += 1
+                tester.statuses[status] += 1
+            elif request == ENDGAME:
+                tester.gamesPlayed += 1
+                tester.totalScore += score
+            if status not in (OK, NOMATCH, BADSWAP) or tester.stopping:
+                continue
+            if request == ENDGAME:
+                requests.append((NEWGAME, 0, 0, 0, 0, 0))
+            elif gameOver:
+                requests.append((ENDGAME, gameNumber, 0, 0, 0, 0))
+            else:
+                toMove.append((gameNumber, i))
+
+        if toMove:
+            boards = unpackBoards(replies[[i for gameNumber, i in toMove], REPLY.size:],
+                                  self.width, self.height, self.bitsPerSpace)
+            for (gameNumber, i), action in zip(toMove, tester.pickActions(self.env, boards)):
+                (x1, y1), (x2, y2) = self.env.actionToSwap(action)
+                requests.append((SWAP, gameNumber, x1, y1, x2, y2))
+        if requests:
+            self.send(requests)
+        elif not self.pending and not self.done.done():
+            self.transport.close()
+            self.done.set_result(None)
+
+
+class LoadTester:
+    def __init__(self, games, policy, seed=0):
+        self.games = games # games each connection plays at once
+        self.policy = policy
+        self.rng = np.random.default_rng(seed)
+        self.envs = {}
+        self.stopping = False # set when the time is up: no new requests are sent
+        self.moves = 0
+        self.latencies = []
+        self.statuses = collections.Counter()
+        self.gamesPlayed = 0
+        self.totalScore = 0
+
+
+    def getEnv(self, variant, width, height, numGems):
+        # A GemEnv of no boards, for its move checks.
+        key = (variant, width, height, numGems)
+        if key not in self.envs:
+            self.envs[key] = GemEnv(0, variant, width, height, numGems)
+        return self.envs[key]
+
+
+    def pickActions(self, env, boards):
+        # An action for each of boards, by the tester's policy.
+        if self.policy == 'random':
+            # any neighbours on the board
+            width, height = env.width, env.height
+            direction = self.rng.integers(2, size=len(boards))
+            x = self.rng.integers(width - (direction == 0))
+            y = self.rng.integers(height - (direction == 1))
+            return direction * width * height + x * height + y
+        if self.policy == 'greedy':
+            points, cleared, longestRun, legal = env.evaluateSwaps(boards)
+            choice = self.rng.random(legal.shape) * legal + points
+        else:
+            legal = env.getLegalMask(boards)
+            choice = self.rng.random(legal.shape) * legal
+        return choice.argmax(axis=1)
+
+
+async def runBots(tester, host, port, connections, seconds):
+    loop = asyncio.get_running_loop()
+    bots = []
+    for i in range(connections):
+        transport, bot = await loop.create_connection(lambda: BotProtocol(tester), host, port)
+        bots.append(bot)
+    startTime = time.perf_counter()
+    await asyncio.sleep(seconds)
+    tester.stopping = True
+    # the replies still on their way are counted too
+    await asyncio.gather(*(bot.done for bot in bots))
+    return time.perf_counter() - startTime
+
+
+async def waitForServer(host, port, timeout=10.0):
+    # Waits until a server accepts connections on host, port.
+    endTime = time.perf_counter() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.perf_counter() > endTime:
+                raise
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        return
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load tests gemserver.py with bots over loopback.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7878)
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--games', type=int, default=20, help='games each connection plays at once')
+    parser.add_argument('--seconds', type=float, default=10.0, help='how long the bots play')
+    parser.add_argument('--policy', choices=('legal', 'greedy', 'random'), default='legal')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--spawn', action='store_true',
+                        help='start a gemserver.py on --port for the test, and stop it after')
+    parser.add_argument('--engine', choices=('exact', 'batch'), default='exact',
+                        help='the --engine of the gemserver.py started by --spawn')
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                'gemserver.py'),
+                                   '--host', args.host, '--port', str(args.port), '--engine', args.engine,
+                                   '--stats', '0'])
+    tester = LoadTester(args.games, args.policy, args.seed)
+    try:
+        if server is not None:
+            asyncio.run(waitForServer(args.host, args.port))
+        elapsed = asyncio.run(runBots(tester, args.host, args.port, args.connections, args.seconds))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = sorted(tester.latencies)
+    if not latencies:
+        print('no moves were played')
+        return
+    print('%d moves in %.2fs: %.0f moves/s (%d made a match, %d no match, %d turned down), %d games ended'
+          % (tester.moves, elapsed, tester.moves / elapsed, tester.statuses[OK], tester.statuses[NOMATCH],
+             tester.moves - tester.statuses[OK] - tester.statuses[NOMATCH], tester.gamesPlayed))
+    print('latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f'
+          % tuple(1000 * value for value in (percentile(latencies, 0.5), percentile(latencies, 0.9),
+                                              percentile(latencies, 0.99), latencies[-1])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+The rules of cc_marija.py as a pure logic engine that does not import
+pygame. A move is resolved in one call:
+
+    engine = GemEngine()
+    result = engine.swap((3, 4), (3, 5))
+
+swap() applies the whole move (the swap, every cascade step and every
+refill) to engine.board right away and returns a CascadeResult that says
+what happened, so a game can replay it as animation, and a simulation
+can play thousands of moves per second without a frame clock.
+
+The board is the same board[x][y] list of lists that cc_marija.py uses.
+Which runs count and what they score comes from a MatchRules spec (see
+matchrules.py), cc_marija.py's MARIJARULES by default. New boards and
+refills come from a BoardGenerator (see boardgen.py) that follows the
+same rules.
+"""
+
+import random
+
+from boardgen import BoardGenerator
+from flatboard import setGemAt
+from matchrules import EMPTY_SPACE, MARIJARULES
+from moveindex import MoveIndex
+
+BOARDWIDTH = 8 # how many columns in the board
+BOARDHEIGHT = 8 # how many rows in the board
+NUMGEMIMAGES = 4 # number of gem types
+
+# When True, every incremental match check is compared against a full
+# rescan of the board, and the legal move index against a full scan.
+DEBUGMATCHES = False
+
+
+class CascadeStep:
+    # One round of a cascade: the runs that were removed and the new gems
+    # that dropped in to replace them.
+    def __init__(self, matchedGems, points, dropSlots, score):
+        self.matchedGems = matchedGems # list of lists of (x, y), like findMatchingGems()
+        self.points = points # list of dicts with keys points, x, y (board coordinates)
+        self.dropSlots = dropSlots # new gems for each column, lowest first, like getDropSlots()
+        self.score = score # the game's score after this step
+
+
+class CascadeResult:
+    def __init__(self, valid, score=0, steps=None, changedSpaces=None):
+        self.valid = valid # False if the swap made no match and was undone
+        self.score = score # points the move earned
+        self.steps = steps or [] # a CascadeStep for each round of matches
+        self.changedSpaces = changedSpaces or set() # every (x, y) the move changed
+
+
+class GemEngine:
+    def __init__(self, width=BOARDWIDTH, height=BOARDHEIGHT, numGems=NUMGEMIMAGES, rng=None,
+                 rules=MARIJARULES, board=None):
+        # board is a starting board with no runs (e.g. from a BoardPool);
+        # without one the generator deals a new board.
+        self.width = width
+        self.height = height
+        self.numGems = numGems
+        self.rng = rng or random.Random()
+        self.rules = rules
+        self.generator = BoardGenerator(rules, numGems, self.rng)
+        self.score = 0
+        if board is None:
+            self.board = self.generator.newBoard(width, height)
+        else:
+            self.board = [list(column) for column in board]
+
+        # The gems that drop in to start the game, for the UI to animate:
+        # the whole board, each column's lowest gem first.
+        self.initialDropSlots = [column[::-1] for column in self.board]
+        self.moveIndex = MoveIndex(self.board, rules.directions, rules.minRun)
+
+
+    def isGameOver(self):
+        return not self.moveIndex.hasMoves()
+
+
+    def previewSwap(self, first, second):
+        # Returns the points the first round of matches of this swap would
+        # earn (0 if it makes no match), without changing the board. The
+        # refills and the cascades after them are random, so they are not
+        # counted.
+        (x1, y1), (x2, y2) = first, second
+        board = self.board
+        board[x1][y1], board[x2][y2] = board[x2][y2], board[x1][y1]
+        matchedGems = self.rules.findMatchingGemsNear(board, (first, second))
+        board[x1][y1], board[x2][y2] = board[x2][y2], board[x1][y1]
+        return self.rules.score(matchedGems)
+
+
+    def swap(self, first, second):
+        # first and second are (x, y) tuples of two adjacent spaces.
+        result = resolveSwap(self.board, first, second, self.generator, self.score)
+        if result.valid:
+            self.score += result.score
+            self.moveIndex.update(result.changedSpaces)
+            if DEBUGMATCHES:
+                assert self.moveIndex.hasMoves() == self.rules.canMakeMove(self.board), 'legal move index is out of date'
+        return result
+
+
+def resolveSwap(board, first, second, generator, score=0):
+    # Plays the swap of first and second on board, with every cascade step
+    # and refill (dealt by generator, a BoardGenerator), and returns a
+    # CascadeResult. score is the score before the move; the CascadeSteps
+    # carry it forward. If the swap makes no match the board is left as
+    # it was.
+    (x1, y1), (x2, y2) = first, second
+    if abs(x1 - x2) + abs(y1 - y2) != 1:
+        raise ValueError('spaces %s and %s are not adjacent' % (first, second))
+
+    # The board may be a FlatBoard with an undo log running, so every
+    # change that stays made goes through setGemAt() or board[x] = [...].
+    gem1 = board[x1][y1]
+    gem2 = board[x2][y2]
+    board[x1][y1], board[x2][y2] = gem2, gem1
+    changedSpaces = {first, second}
+    matchedGems = findNewMatchingGems(board, changedSpaces, generator.rules)
+    if matchedGems == []:
+        # Was not a matching move; swap the gems back
+        board[x1][y1], board[x2][y2] = gem1, gem2
+        return CascadeResult(False)
+    board[x1][y1], board[x2][y2] = gem1, gem2
+    setGemAt(board, x1, y1, gem2)
+    setGemAt(board, x2, y2, gem1)
+
+    steps, movedSpaces, newScore = resolveCascade(board, matchedGems, generator, score)
+    return CascadeResult(True, newScore - score, steps, movedSpaces | changedSpaces)
+
+
+def resolveCascade(board, matchedGems, generator, score=0):
+    # Removes the runs in matchedGems, refills the board and keeps going
+    # as long as the refills make new runs. Returns the list of
+    # CascadeSteps, the set of spaces that changed and the new score.
+    #
+    # Like cc_marija.runGame(), scoreAdd keeps growing over the whole
+    # cascade and is added to the score after every step.
+    rules = generator.rules
+    movedSpaces = set()
+    steps = []
+    scoreAdd = 0
+    while matchedGems != []:
+        points = []
+        for gemSet in matchedGems:
+            scoreAdd += rules.scoreGemSet(gemSet)
+            for x, y in gemSet:
+                setGemAt(board, x, y, EMPTY_SPACE)
+            points.append({'points': scoreAdd, 'x': x, 'y': y})
+        score += scoreAdd
+
+        dropSlots = generator.getDropSlots(board)
+        changedSpaces = applyDropSlots(board, dropSlots)
+        movedSpaces |= changedSpaces
+        steps.append(CascadeStep(matchedGems, points, dropSlots, score))
+        matchedGems = findNewMatchingGems(board, changedSpaces, rules)
+    return steps, movedSpaces, score
+
+
+def applyDropSlots(board, dropSlots):
+    # Does what cc_marija.fillBoardAndAnimate() does to the board, without
+    # the animation: every column falls to the bottom and its drop slot
+    # gems land on top, the first gem in the slot lowest. Returns the set
+    # of (x, y) spaces that got a different gem.
+    changedSpaces = set()
+    for x, slot in enumerate(dropSlots):
+        if not slot:
+            continue # nothing was removed from this column
+        column = list(board[x])
+        lowestEmpty = max(y for y, gem in enumerate(column) if gem == EMPTY_SPACE)
+        gemsInColumn = [gem for gem in column if gem != EMPTY_SPACE]
+        board[x] = slot[::-1] + gemsInColumn
+        for y in range(lowestEmpty + 1):
+            changedSpaces.add((x, y))
+    return changedSpaces
+
+
+def findNewMatchingGems(board, changedSpaces, rules=MARIJARULES):
+    matchedGems = rules.findMatchingGemsNear(board, changedSpaces)
+    if DEBUGMATCHES:
+        assert matchedGems == rules.findMatchingGems(board), 'incremental match check missed a run'
+    return matchedGems
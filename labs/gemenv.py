@@ -0,0 +1,587 @@
+"""
+A batched, gym-style environment for training move-selection agents on
+the match-3 games, stepped with NumPy instead of pygame and the frame
+clock.
+
+GemEnv holds numEnvs boards in one int8 array of shape (numEnvs, width,
+height), indexed boards[n, x, y] like the board[x][y] of cc_marija.py,
+and plays one swap on every board per step():
+
+    env = GemEnv(4096, 'marija', seed=0)
+    observation, info = env.reset()
+    while training:
+        actions = agent.act(observation, info['legalMask'])
+        observation, reward, terminated, truncated, info = env.step(actions)
+
+The rules are a variant of selfplay.py ('marija' for cc_marija.py's rows
+and columns, 'mine' for CandyCrush_mine.py's diagonals too). The match
+and move checks are the bitboard checks of matchrules.py, run on every
+board at once: each board becomes one uint64 per gem type (so a board
+can have at most 64 spaces), with bit x * height + y set where that gem
+is. A swap that makes a run is scored like GemEngine scores it, cascade
+and all, down to the boards whose runs cross: the games take the spaces
+of crossing runs one run at a time (see MatchRules.findMatchingGems()),
+and so does _takeCrossingRuns(), for all of those boards at once.
+
+An action is a swap of a space with its neighbour to the right (action
+x * height + y) or below (action width * height + x * height + y), so
+there are 2 * width * height actions; the ones that would leave the
+board are never legal. A swap that makes no run is undone and scores 0,
+like in the games.
+
+observation is a uint8 array of shape (numEnvs, numGems, width, height),
+one plane per gem type, and info['legalMask'] a bool array of shape
+(numEnvs, 2 * width * height). A board is terminated when it has no
+legal move left and truncated after maxMoves moves; either way it is
+dealt again right away (its final score is in info['finalScore']).
+
+evaluateSwaps() scores every action on a batch of boards in one call:
+the points of its first round of matches (like GemEngine.previewSwap()),
+the spaces that round clears and the longest run it makes, with the
+legal mask. It is what a hint, a bot or a difficulty rating needs to
+rank the moves of a board, for a batch of boards at the cost of one
+findRuns() over the legal swaps. The evaluateSwaps() function does the
+same for one board[x][y] list of lists:
+
+    points, cleared, longestRun, legal = evaluateSwaps(board, 'marija')
+    bestAction = points.argmax() # an action, see GemEnv.actionToSwap()
+
+New boards and refills follow the same rules as BoardGenerator's: a new
+gem never takes part in a run, so cascades only come from the gems that
+fell, and a refill that leaves no legal move is dealt again. The
+generator does that space by space with backjumping; here every new gem
+is drawn at once and the ones in a run are drawn again until none is.
+So the gems are not the ones GemEngine would deal for the same seed, but
+the games play out alike (selfplay.py's random policy scores the same on
+average). A new board that isn't dealt that way within FILLROUNDS draws
+is dealt by a BoardGenerator instead.
+"""
+
+import random
+
+import numpy as np
+
+from boardgen import BoardGenerator, checkNumGems
+from matchrules import EMPTY_SPACE, SWAPSTEPS, getStartsMask
+from selfplay import VARIANTS
+
+FILLROUNDS = 32 # times the new gems in a run are drawn again before the run is let be
+REFILLATTEMPTS = 20 # times a refill with no legal move is dealt again, like boardgen.py
+
+
+def _getAffineScore(rules, longestRun):
+    # Returns (a, b) if rules scores a run of length n as a * n + b for
+    # every run that fits on the board (both variants do), else None.
+    minRun = rules.minRun
+    a = rules.scoreGemSet([None] * (minRun + 1)) - rules.scoreGemSet([None] * minRun)
+    b = rules.scoreGemSet([None] * minRun) - a * minRun
+    for n in range(minRun, longestRun + 1):
+        if rules.scoreGemSet([None] * n) != a * n + b:
+            return None
+    return a, b
+
+
+class GemEnv:
+    def __init__(self, numEnvs, variant='marija', width=8, height=8, numGems=4, seed=None,
+                 maxMoves=None):
+        if numGems < 2:
+            raise ValueError('a board needs at least 2 gem types, not %d' % numGems)
+        if width * height > 64:
+            raise ValueError('a %dx%d board does not fit in a 64-bit bitboard' % (width, height))
+        self.numEnvs = numEnvs
+        self.variant = variant
+        self.rules = VARIANTS[variant]
+        self.width = width
+        self.height = height
+        self.numGems = numGems
+        self.maxMoves = maxMoves
+        self.numActions = 2 * width * height
+        self.affineScore = _getAffineScore(self.rules, max(width, height))
+        self.gems = np.arange(numGems, dtype=np.int8).reshape(numGems, 1, 1)
+        self._seed(seed)
+
+        # For each run direction: its shift and starts mask (see
+        # MatchRules.getTables()), and the mask of the spaces that have a
+        # space before them in that direction, to tell where runs start.
+        self.runs = []
+        for (shift, starts), (dx, dy) in zip(self.rules.getTables(width, height)['runs'],
+                                             self.rules.directions):
+            if starts:
+                self.runs.append((shift, np.uint64(starts),
+                                  np.uint64(getStartsMask(width, height, ((0, 0), (-dx, -dy))))))
+
+        # For the runs of boards whose runs cross (see _takeCrossingRuns()):
+        # the window of each direction from each space, the shifts and
+        # masks of self.runs as arrays, and the points of a run of each
+        # length.
+        allBits = (1 << 64) - 1
+        self.runWindowMasks = np.array([[sum(1 << (i + k * shift) for k in range(self.rules.minRun)) & allBits
+                                         for i in range(64)] for shift, starts, hasBefore in self.runs],
+                                       dtype=np.uint64)
+        self.runShifts = np.array([shift for shift, starts, hasBefore in self.runs], dtype=np.uint64)
+        self.runHasBefore = np.array([hasBefore for shift, starts, hasBefore in self.runs], dtype=np.uint64)
+        self.runPoints = np.array([self.rules.scoreGemSet([None] * n) if n >= self.rules.minRun else 0
+                                   for n in range(65)], dtype=np.int64)
+
+        # For each shape that is one swap away from a run (see
+        # MatchRules._compileMovePatterns()): the shifts of its gems, its
+        # starts mask, and the direction and shift of the action that swaps
+        # its missing space with its source.
+        patterns = set()
+        for offsets in self.rules.runOffsets:
+            for missing in range(self.rules.minRun):
+                mx, my = offsets[missing]
+                for sx, sy in SWAPSTEPS:
+                    source = (mx + sx, my + sy)
+                    if source in offsets:
+                        continue
+                    shape = [offset for i, offset in enumerate(offsets) if i != missing] + [source]
+                    first = min((mx, my), source) # the swap's space to the left or above
+                    # the missing space has to be on the board too
+                    minX = min(dx for dx, dy in shape + [(mx, my)])
+                    minY = min(dy for dx, dy in shape + [(mx, my)])
+                    starts = getStartsMask(width, height, [(dx - minX, dy - minY)
+                                                           for dx, dy in shape + [(mx, my)]])
+                    if starts:
+                        patterns.add((tuple(sorted((dx - minX) * height + dy - minY for dx, dy in shape)),
+                                      starts, 0 if sy == 0 else 1,
+                                      (first[0] - minX) * height + first[1] - minY))
+        self.movePatterns = [(shifts, np.uint64(starts), direction, firstShift)
+                             for shifts, starts, direction, firstShift in sorted(patterns)]
+
+        # For each run direction: its shift and the starts mask of a run
+        # of each length from minRun up, for the longest runs of
+        # evaluateSwaps().
+        self.runLengths = []
+        for (shift, starts), (dx, dy) in zip(self.rules.getTables(width, height)['runs'],
+                                             self.rules.directions):
+            masks = []
+            length = self.rules.minRun
+            while True:
+                mask = getStartsMask(width, height, [(k * dx, k * dy) for k in range(length)])
+                if not mask:
+                    break
+                masks.append(np.uint64(mask))
+                length += 1
+            if masks:
+                self.runLengths.append((shift, masks))
+
+        self.boards = np.empty((numEnvs, width, height), dtype=np.int8)
+        self.scores = np.zeros(numEnvs, dtype=np.int64)
+        self.moves = np.zeros(numEnvs, dtype=np.int64)
+        self.legalMask = np.zeros((numEnvs, self.numActions), dtype=bool)
+
+
+    def _seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+        self.generator = BoardGenerator(self.rules, self.numGems,
+                                        random.Random(int(self.rng.integers(1 << 63))))
+
+
+    def reset(self, seed=None):
+        # Deals every board again. Returns (observation, info).
+        if seed is not None:
+            self._seed(seed)
+        self._deal(np.arange(self.numEnvs))
+        return self.getObservation(), {'legalMask': self.legalMask.copy()}
+
+
+    def step(self, actions):
+        # Plays actions (one per board) and returns (observation, reward,
+        # terminated, truncated, info).
+        actions = np.asarray(actions, dtype=np.int64)
+        envs = np.arange(self.numEnvs)
+        legal = self.legalMask[envs, actions]
+        reward = np.zeros(self.numEnvs, dtype=np.int64)
+
+        active = envs[legal]
+        if len(active):
+            sub = self.boards[active]
+            reward[active] = self.playActions(sub, actions[active])
+            self.boards[active] = sub
+
+        self.scores += reward
+        self.moves += 1
+        self.legalMask[:] = self.getLegalMask(self.boards)
+        terminated = ~self.legalMask.any(axis=1)
+        truncated = np.zeros(self.numEnvs, dtype=bool)
+        if self.maxMoves is not None:
+            truncated = (self.moves >= self.maxMoves) & ~terminated
+        finished = terminated | truncated
+        finalScore = np.where(finished, self.scores, 0)
+        if finished.any():
+            self._deal(envs[finished])
+        info = {'legalMask': self.legalMask.copy(), 'finalScore': finalScore}
+        return self.getObservation(), reward, terminated, truncated, info
+
+
+    def getObservation(self):
+        # One-hot gem planes of every board, shape (numEnvs, numGems, width, height).
+        return (self.boards[:, None, :, :] == self.gems).view(np.uint8)
+
+
+    def actionToSwap(self, action):
+        # The ((x1, y1), (x2, y2)) swap of an action, like MoveIndex stores it.
+        direction, space = divmod(int(action), self.width * self.height)
+        x, y = divmod(space, self.height)
+        return ((x, y), (x + 1, y) if direction == 0 else (x, y + 1))
+
+
+    def swapToAction(self, first, second):
+        (x1, y1), (x2, y2) = sorted((first, second))
+        if (x2 - x1, y2 - y1) not in ((1, 0), (0, 1)):
+            raise ValueError('spaces %s and %s are not adjacent' % (first, second))
+        return (y2 - y1) * self.width * self.height + x1 * self.height + y1
+
+
+    def playActions(self, boards, actions):
+        # Plays actions (one legal action per board) on boards, cascades
+        # and refills and all, and returns the points each board earned.
+        self._swap(boards, actions)
+        return self._resolveCascades(boards)
+
+
+    def _swap(self, boards, actions):
+        # Plays actions (one per board) on boards, without matching.
+        direction, space = np.divmod(actions, self.width * self.height)
+        x1, y1 = np.divmod(space, self.height)
+        x2 = x1 + (direction == 0)
+        y2 = y1 + (direction == 1)
+        n = np.arange(len(boards))
+        boards[n, x1, y1], boards[n, x2, y2] = boards[n, x2, y2], boards[n, x1, y1]
+
+
+    def evaluateSwaps(self, boards):
+        # Scores every action on every one of boards at once, like
+        # GemEngine.previewSwap() scores one: only the first round of
+        # matches counts, since the refills after it are random. Returns
+        # (points, cleared, longestRun, legal), each a (len(boards),
+        # numActions) array: the points of the first round, the spaces it
+        # clears, the longest run the swap makes, and whether the action
+        # is legal (makes a run). The first three are 0 where it isn't.
+        legal = self.getLegalMask(boards)
+        n, actions = np.nonzero(legal)
+        swapped = boards[n]
+        self._swap(swapped, actions)
+        matched, roundPoints = self.findRuns(swapped)
+
+        points = np.zeros(legal.shape, dtype=np.int64)
+        cleared = np.zeros(legal.shape, dtype=np.int64)
+        longestRun = np.zeros(legal.shape, dtype=np.int64)
+        points[n, actions] = roundPoints
+        cleared[n, actions] = matched.reshape(len(n), -1).sum(axis=1)
+        longestRun[n, actions] = self.getLongestRuns(swapped)
+        return points, cleared, longestRun, legal
+
+
+    def getLongestRuns(self, boards):
+        # The length of the longest run on each board, 0 if it has none.
+        # A run of length + 1 starts where a run of length does and the
+        # space after it holds the same gem, so each direction's starts
+        # are narrowed one length at a time until none is left.
+        planes = self.getBitboards(boards)
+        longest = np.zeros(len(boards), dtype=np.int64)
+        minRun = self.rules.minRun
+        for shift, masks in self.runLengths:
+            starts = planes & masks[0]
+            for k in range(1, minRun):
+                starts &= planes >> (k * shift)
+            for length, mask in enumerate(masks, minRun):
+                if length > minRun:
+                    starts &= (planes >> ((length - 1) * shift)) & mask
+                found = np.bitwise_or.reduce(starts, axis=0) != 0
+                if not found.any():
+                    break
+                longest[found] = np.maximum(longest[found], length)
+        return longest
+
+
+    def getBitboards(self, boards):
+        # Returns a (numGems, len(boards)) uint64 array, the bitboard of
+        # each gem on each board (like matchrules.getBitboards()).
+        planes = boards.reshape(1, len(boards), -1) == self.gems
+        packed = np.zeros((self.numGems, len(boards), 8), dtype=np.uint8)
+        packed[:, :, :(self.width * self.height + 7) // 8] = np.packbits(planes, axis=2, bitorder='little')
+        return packed.view('<u8')[:, :, 0]
+
+
+    def _toBits(self, spaces):
+        # A (n, width, height) bool array as n bitboards.
+        packed = np.zeros((len(spaces), 8), dtype=np.uint8)
+        packed[:, :(self.width * self.height + 7) // 8] = np.packbits(spaces.reshape(len(spaces), -1),
+                                                                      axis=1, bitorder='little')
+        return packed.view('<u8')[:, 0]
+
+
+    def _toSpaces(self, bits):
+        # n bitboards as a (n, width, height) bool array.
+        spaces = np.unpackbits(bits.astype('<u8').view(np.uint8).reshape(-1, 8), axis=1,
+                               count=self.width * self.height, bitorder='little')
+        return spaces.view(bool).reshape(-1, self.width, self.height)
+
+
+    def _getLegalBits(self, boards):
+        # The legal actions of each board as a (2, len(boards)) uint64
+        # array: the swaps to the right, and the swaps down.
+        planes = self.getBitboards(boards)
+        legal = np.zeros((2, len(boards)), dtype=np.uint64)
+        for shifts, starts, direction, firstShift in self.movePatterns:
+            found = (planes >> shifts[0]) & starts
+            for shift in shifts[1:]:
+                found &= planes >> shift
+            legal[direction] |= np.bitwise_or.reduce(found, axis=0) << firstShift
+        return legal
+
+
+    def getLegalMask(self, boards):
+        # The legal actions of each board as a (len(boards), numActions)
+        # bool array.
+        bits = np.ascontiguousarray(self._getLegalBits(boards).T)
+        legal = np.unpackbits(bits.view(np.uint8).reshape(len(boards), 2, 8), axis=2,
+                              count=self.width * self.height, bitorder='little')
+        return legal.view(bool).reshape(len(boards), self.numActions)
+
+
+    def findRuns(self, boards):
+        # Returns (matched, points): a bool array of the spaces each board
+        # removes in one round of matches, and the points of that round.
+        planes = self.getBitboards(boards)
+        matched = np.zeros(len(boards), dtype=np.uint64)
+        crossed = np.zeros(len(boards), dtype=np.uint64)
+        runCounts = np.zeros(len(boards), dtype=np.int64)
+        windowStarts = [] # the spaces a window of one gem starts on, for each direction
+        for shift, startsMask, hasBefore in self.runs:
+            starts = planes & startsMask
+            for k in range(1, self.rules.minRun):
+                starts &= planes >> (k * shift)
+            inRun = starts.copy()
+            for k in range(1, self.rules.minRun):
+                inRun |= starts << (k * shift)
+            # A run starts on each of its spaces whose space before it is
+            # not in a run of the same gem.
+            runStarts = inRun & ~((inRun << shift) & hasBefore)
+            runCounts += np.bitwise_count(runStarts).sum(axis=0, dtype=np.int64)
+            windowStarts.append(np.bitwise_or.reduce(starts, axis=0))
+            inRun = np.bitwise_or.reduce(inRun, axis=0)
+            crossed |= matched & inRun
+            matched |= inRun
+
+        if self.affineScore is None:
+            crossing = np.flatnonzero(matched)
+            points = np.zeros(len(boards), dtype=np.int64)
+        else:
+            crossing = np.flatnonzero(crossed)
+            a, b = self.affineScore
+            points = a * np.bitwise_count(matched).astype(np.int64) + b * runCounts
+        if len(crossing):
+            matched[crossing], points[crossing] = self._takeCrossingRuns(
+                boards[crossing], planes[:, crossing], [starts[crossing] for starts in windowStarts])
+        return self._toSpaces(matched), points
+
+
+    def _takeCrossingRuns(self, boards, planes, windowStarts):
+        # Returns the matched spaces (as bitboards) and points of boards
+        # whose runs cross, taken the way MatchRules.findMatchingGems()
+        # takes them: every minRun long window of one gem is a candidate,
+        # in scan order (space by space, then direction by direction). A
+        # candidate with a space that is already taken is skipped; the
+        # others take their run from the window on, up to the first space
+        # that is taken or holds another gem. Each round of the loop below
+        # takes the next candidate of every board at once.
+        numBoards = len(boards)
+        numDirections = len(self.runs)
+        # candidate i * numDirections + d for a window in direction d that
+        # starts on space i; nonzero() lists them board by board, in order
+        isCandidate = np.stack([self._toSpaces(starts).reshape(numBoards, -1) for starts in windowStarts],
+                               axis=2).reshape(numBoards, -1)
+        boardOf, candidates = np.nonzero(isCandidate)
+        counts = np.bincount(boardOf, minlength=numBoards)
+        rank = np.arange(len(boardOf)) - (np.cumsum(counts) - counts)[boardOf]
+        byRank = np.full((counts.max(), numBoards), -1, dtype=np.int64)
+        byRank[rank, boardOf] = candidates
+
+        cells = boards.reshape(numBoards, -1)
+        taken = np.zeros(numBoards, dtype=np.uint64)
+        points = np.zeros(numBoards, dtype=np.int64)
+        for candidates in byRank:
+            n = np.flatnonzero(candidates >= 0)
+            space, d = np.divmod(candidates[n], numDirections)
+            free = (taken[n] & self.runWindowMasks[d, space]) == 0
+            n, space, d = n[free], space[free], d[free]
+            if not len(n):
+                continue
+            # the run is every space from space on that can be reached one
+            # step at a time over untaken spaces of the same gem
+            shift = self.runShifts[d]
+            reachable = planes[cells[n, space], n] & ~taken[n] & self.runHasBefore[d]
+            run = np.uint64(1) << space.astype(np.uint64)
+            step = 1
+            while True:
+                run |= reachable & (run << shift)
+                step *= 2
+                if step >= max(self.width, self.height):
+                    break
+                reachable &= reachable << shift
+                shift = shift * np.uint64(2)
+            taken[n] |= run
+            points[n] += self.runPoints[np.bitwise_count(run)]
+        return taken, points
+
+
+    def _resolveCascades(self, boards):
+        # Removes runs and refills until no board has any left. Returns
+        # the points each board earned: like GemEngine, the points of a
+        # round are added to the ones of the rounds before it, and that sum
+        # is scored after every round.
+        #
+        # Only the boards that still have runs are carried into the next
+        # round, so a few long cascades don't make every board pay for them.
+        reward = np.zeros(len(boards), dtype=np.int64)
+        scoreAdd = np.zeros(len(boards), dtype=np.int64)
+        active = np.arange(len(boards))
+        sub = boards
+        while len(active):
+            matched, points = self.findRuns(sub)
+            hasRuns = matched.any(axis=(1, 2))
+            if not hasRuns.all():
+                boards[active] = sub # store the boards that are done
+                active, sub, matched, points = active[hasRuns], sub[hasRuns], matched[hasRuns], points[hasRuns]
+                if not len(active):
+                    break
+            scoreAdd[active] += points
+            reward[active] += scoreAdd[active]
+            sub[matched] = EMPTY_SPACE
+            self._refill(sub, self._pullDown(sub))
+        return reward
+
+
+    def _pullDown(self, boards):
+        # Pulls the gems of every column down (keeping their order), like
+        # matchrules.pullDownAllGems(). Returns the mask of the empty spaces
+        # left at the top.
+        empty = boards == EMPTY_SPACE
+        # every gem falls as many spaces as there are empty ones below it
+        fall = np.cumsum(empty[:, :, ::-1], axis=2, dtype=np.int8)[:, :, ::-1]
+        gems = np.flatnonzero(~empty)
+        fallen = np.full(boards.shape, EMPTY_SPACE, dtype=np.int8)
+        fallen.reshape(-1)[gems + fall.reshape(-1)[gems]] = boards.reshape(-1)[gems]
+        boards[...] = fallen
+        return fallen == EMPTY_SPACE
+
+
+    def _refill(self, boards, new):
+        # Fills the new spaces of boards (a bool array). New gems that end
+        # up in a run are drawn again, so runs are only made of the gems
+        # that were there already. A board left with no legal move gets
+        # its new gems dealt again, up to REFILLATTEMPTS times. Returns the
+        # bool array of the boards that still have a new gem in a run.
+        newBits = self._toBits(new)
+        leftInRuns = np.zeros(len(boards), dtype=bool)
+        for attempt in range(REFILLATTEMPTS):
+            todo = np.flatnonzero(newBits)
+            sub = boards[todo]
+            subNew = newBits[todo]
+            redraw = new[todo]
+            for fillRound in range(FILLROUNDS):
+                sub[redraw] = self.rng.integers(0, self.numGems, size=int(redraw.sum()), dtype=np.int8)
+                redrawBits = self._getNewInRuns(sub, subNew)
+                left = redrawBits != 0
+                if not left.all():
+                    # only the boards with gems left to draw go on
+                    boards[todo] = sub
+                    todo, sub, subNew, redrawBits = todo[left], sub[left], subNew[left], redrawBits[left]
+                    if not len(todo):
+                        break
+                redraw = self._toSpaces(redrawBits)
+            boards[todo] = sub
+            leftInRuns[:] = False
+            leftInRuns[todo] = True
+
+            stuck = (newBits != 0) & ~self._getLegalBits(boards).any(axis=0)
+            if attempt == REFILLATTEMPTS - 1 or not stuck.any():
+                break
+            newBits = np.where(stuck, newBits, 0)
+            new = new & stuck[:, None, None]
+        return leftInRuns
+
+
+    def _getNewInRuns(self, boards, newBits):
+        # The new spaces of each board that take part in a run, as bitboards.
+        planes = self.getBitboards(boards)
+        inRuns = np.zeros(len(boards), dtype=np.uint64)
+        for shift, startsMask, hasBefore in self.runs:
+            starts = planes & startsMask
+            touchesNew = newBits.copy()
+            for k in range(1, self.rules.minRun):
+                starts &= planes >> (k * shift)
+                touchesNew |= newBits >> (k * shift)
+            starts = np.bitwise_or.reduce(starts, axis=0) & touchesNew
+            for k in range(self.rules.minRun):
+                inRuns |= starts << (k * shift)
+        return inRuns & newBits
+
+
+    def _deal(self, envs):
+        # Deals new boards for envs, an array of board numbers.
+        sub = np.full((len(envs), self.width, self.height), EMPTY_SPACE, dtype=np.int8)
+        withRuns = self._refill(sub, np.ones(sub.shape, dtype=bool))
+        for n in np.flatnonzero(withRuns | ~self._getLegalBits(sub).any(axis=0)):
+            sub[n] = self.generator.newBoard(self.width, self.height)
+        self.boards[envs] = sub
+        self.scores[envs] = 0
+        self.moves[envs] = 0
+        self.legalMask[envs] = self.getLegalMask(sub)
+
+
+_EVALUATORS = {} # (variant, width, height, numGems) -> GemEnv of no boards, for evaluateSwaps()
+
+def evaluateSwaps(board, variant='marija', numGems=4):
+    # GemEnv.evaluateSwaps() of one board[x][y] (of at most 64 spaces).
+    # Returns (points, cleared, longestRun, legal), each an array of the
+    # board's 2 * width * height actions.
+    key = (variant, len(board), len(board[0]), numGems)
+    env = _EVALUATORS.get(key)
+    if env is None:
+        env = _EVALUATORS[key] = GemEnv(0, *key)
+    points, cleared, longestRun, legal = env.evaluateSwaps(np.array([board], dtype=np.int8))
+    return points[0], cleared[0], longestRun[0], legal[0]
+
+
+def main():
+    import argparse, time
+
+    parser = argparse.ArgumentParser(description='Steps a batch of match-3 boards with random legal moves.')
+    parser.add_argument('--envs', type=int, default=4096, help='boards stepped at once')
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--variant', choices=sorted(VARIANTS), default='marija')
+    parser.add_argument('--gems', type=int, default=4, help='number of gem types (NUMGEMIMAGES)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--greedy', action='store_true',
+                        help='play the legal action with the most first-round points (see evaluateSwaps())')
+    args = parser.parse_args()
+    try:
+        checkNumGems(VARIANTS[args.variant], args.gems)
+    except ValueError as e:
+        parser.error('--gems: %s' % e)
+
+    env = GemEnv(args.envs, args.variant, numGems=args.gems, seed=args.seed)
+    observation, info = env.reset()
+    rng = np.random.default_rng(args.seed)
+    finished = 0
+    startTime = time.perf_counter()
+    for i in range(args.steps):
+        # a random legal action for every board, or a random one of the
+        # best scoring ones
+        choice = rng.random(info['legalMask'].shape) * info['legalMask']
+        if args.greedy:
+            choice += env.evaluateSwaps(env.boards)[0]
+        observation, reward, terminated, truncated, info = env.step(choice.argmax(axis=1))
+        finished += int(terminated.sum())
+    elapsed = time.perf_counter() - startTime
+    steps = args.envs * args.steps
+    print('%d steps in %.2fs: %.0f steps/s, mean score %.1f, %d boards out of moves'
+          % (steps, elapsed, steps / elapsed, env.scores.mean(), finished))
+
+
+if __name__ == '__main__':
+    main()
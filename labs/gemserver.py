@@ -0,0 +1,418 @@
+"""
+Authoritative match-3 game server: one asyncio process holds the games
+of many clients and checks every swap they send against cc_marija.py's
+rules (the same resolveSwap() the game's GemEngine plays, with the same
+refills and scoring), so a client only ever shows boards and scores the
+server has dealt.
+
+    python gemserver.py --port 7878
+    python gembots.py --port 7878 --connections 50 --games 20
+
+The protocol is fixed-size binary records, in order, over one TCP
+connection. The server starts by sending HELLO (the board size, gem
+types and variant), so the client knows the size of every reply. After
+that, every REQUEST gets exactly one reply: REPLY and then the packed
+board (see savegame.packBoard()) as it is after the request. Requests
+can be pipelined; the replies come back in the order the requests were
+sent. A connection can play any number of games at once, each one known
+by the game number the server gave it in the reply to its NEWGAME.
+
+    NEWGAME   starts a game. The reply has its game number.
+    SWAP      swaps the spaces x1, y1 and x2, y2 of a game. The reply's
+              status is OK if the swap made a match (points is what the
+              whole cascade earned), NOMATCH if it was undone like in the
+              game, BADSWAP if the spaces are not two neighbours on the
+              board, or GAMEOVER if the game had no moves left.
+    ENDGAME   ends a game. The reply has its final score.
+
+A game on the server is a GameState of about 200 bytes: the board as
+one byte a space, the score, the number of moves and a 64-bit seed. The
+seed is all there is to the game's random number generator between
+moves: each move restarts the generator from it and leaves the next one
+in its place (like savegame.reseed()), so thousands of games don't each
+keep 2.5 kB of Mersenne Twister state.
+
+Requests are queued as they arrive and handled once every connection
+has had its turn to read, so the swaps of all the connections are played
+as one batch, and each connection's replies are sent in one write (one
+system call per batch instead of one per move). A second swap of the
+same game, or its ENDGAME, waits for the next batch, since it has to
+see the board the first one leaves. The server counts the moves it
+checks and prints how many a second it handled every --stats seconds.
+
+--engine picks how a batch is played:
+
+    exact   one swap at a time with resolveSwap(), like the game; each
+            game's refills come from its own seed, so a game can be
+            replayed from its first seed and its moves.
+    batch   every swap of the batch at once with a GemEnv (see
+            gemenv.py), on NumPy bitboards. Same rules and scores, but
+            the refills come from the GemEnv's random number generator,
+            so the seeds mean nothing. Boards of at most 64 spaces.
+"""
+
+import argparse, asyncio, collections, random, struct, time
+
+import numpy as np
+
+from boardgen import BoardGenerator, checkNumGems
+from boardpool import openPool
+from gemenv import GemEnv
+from gemengine import resolveSwap
+from movinggem import STEPDIRECTIONS
+from savegame import getBitsPerSpace, getPackedSize, packBoard
+from selfplay import VARIANTS
+
+MAGIC = b'GEMSERV\0'
+VERSION = 1
+
+# magic, version, width, height, gem types, bits per space, variant
+HELLO = struct.Struct('<8sHHHHB16s')
+# request, game number, x1, y1, x2, y2
+REQUEST = struct.Struct('<BI4B')
+# status, game number, points, score, game over (1 if the game has no moves left); the packed board follows
+REPLY = struct.Struct('<BIiqB')
+
+# requests
+NEWGAME = 1
+SWAP = 2
+ENDGAME = 3
+
+# reply statuses
+OK = 0
+NOMATCH = 1 # the swap made no match and was undone
+BADSWAP = 2 # the spaces are not neighbours on the board
+GAMEOVER = 3 # the game has no moves left, so only ENDGAME is taken
+NOGAME = 4 # this connection has no game by that number
+BADREQUEST = 5 # not a request this server knows
+FULL = 6 # the server already has MAXGAMES games
+
+MAXGAMES = 200000 # games the server holds at once, over all connections
+
+
+class GameState:
+    __slots__ = ('cells', 'seed', 'score', 'moves', 'over')
+
+    def __init__(self, cells, seed, score=0):
+        self.cells = cells # bytes, the board column by column, one gem a byte
+        self.seed = seed # the random number generator's seed for the next move
+        self.score = score
+        self.moves = 0
+        self.over = False # True once the board has no legal move
+
+
+class GameServer:
+    def __init__(self, variant='marija', width=8, height=8, numGems=4, pool=None, seed=None,
+                 engine='exact'):
+        self.variant = variant
+        self.rules = VARIANTS[variant]
+        self.width = width
+        self.height = height
+        self.numGems = numGems
+        self.pool = pool # a BoardPool to deal new games from, or None
+        self.rng = random.Random(seed) # picks the seed of every new game
+        # One generator deals for every game: its rng is set to the game's
+        # own generator before each move, like CandyCrush_mine.py does.
+        self.generator = BoardGenerator(self.rules, numGems, self.rng)
+        # With the batch engine, the swaps are played by a GemEnv instead
+        # (see playSwaps()).
+        self.env = None
+        if engine == 'batch':
+            self.env = GemEnv(0, variant, width, height, numGems, seed)
+        self.bitsPerSpace = getBitsPerSpace(numGems)
+        self.replySize = REPLY.size + getPackedSize(width, height, self.bitsPerSpace)
+        self.emptyBoard = bytes(getPackedSize(width, height, self.bitsPerSpace))
+        self.numGames = 0
+        self.lastGameNumber = 0 # game numbers are never reused, so a late request can't hit a new game
+        self.movesChecked = 0 # SWAP requests handled, for the stats
+        self.waiting = {} # GameProtocol -> None, the connections with requests to handle, in order
+        self.handlerScheduled = False
+
+
+    def getHello(self):
+        return HELLO.pack(MAGIC, VERSION, self.width, self.height, self.numGems, self.bitsPerSpace,
+                          self.variant.encode('ascii'))
+
+
+    def addRequests(self, connection, data):
+        # Queues the whole requests in data for connection, a GameProtocol,
+        # and returns the number of bytes of data they take. They are
+        # handled once every connection has had its turn to read.
+        end = len(data) - len(data) % REQUEST.size
+        if end:
+            connection.requests.extend(REQUEST.iter_unpack(memoryview(data)[:end]))
+            self.waiting[connection] = None
+            if not self.handlerScheduled:
+                self.handlerScheduled = True
+                asyncio.get_running_loop().call_soon(self.handleRequests)
+        return end
+
+
+    def handleRequests(self):
+        # Handles the queued requests of every waiting connection and
+        # writes their replies, one write per connection. The swaps of all
+        # of them are played together by playSwaps(); a second swap or an
+        # ENDGAME of a game waits (with the requests after it) for the next
+        # batch, since it has to see the board the first swap leaves.
+        self.handlerScheduled = False
+        while self.waiting:
+            connections = list(self.waiting)
+            self.waiting.clear()
+            swaps = [] # (replies, index of the reply, game number, GameState, first, second)
+            connectionReplies = []
+            for connection in connections:
+                games = connection.games
+                requests = connection.requests
+                replies = []
+                gamesInBatch = set()
+                while requests:
+                    request, gameNumber, x1, y1, x2, y2 = requests[0]
+                    if request in (SWAP, ENDGAME) and gameNumber in gamesInBatch:
+                        # a swap of this game is in the batch; this request
+                        # has to see the board it leaves
+                        self.waiting[connection] = None
+                        break
+                    if request == SWAP:
+                        reply = self.checkSwap(games, gameNumber, (x1, y1), (x2, y2))
+                        if reply is None:
+                            gamesInBatch.add(gameNumber)
+                            swaps.append((replies, len(replies), gameNumber, games[gameNumber],
+                                          (x1, y1), (x2, y2)))
+                        replies.append(reply)
+                    elif request == NEWGAME:
+                        replies.append(self.newGame(games))
+                    elif request == ENDGAME:
+                        replies.append(self.endGame(games, gameNumber))
+                    else:
+                        replies.append(self.getReply(BADREQUEST, gameNumber))
+                    requests.popleft()
+                connectionReplies.append((connection, replies))
+
+            if swaps:
+                self.playSwaps(swaps)
+            for connection, replies in connectionReplies:
+                if replies and not connection.transport.is_closing():
+                    connection.transport.write(b''.join(replies))
+
+
+    def getReply(self, status, gameNumber, game=None, board=None, points=0):
+        if game is None:
+            return REPLY.pack(status, gameNumber, 0, 0, 0) + self.emptyBoard
+        if board is None:
+            board = self.getBoard(game)
+        return (REPLY.pack(status, gameNumber, points, game.score, game.over)
+                + packBoard(board, self.numGems, self.bitsPerSpace))
+
+
+    def getBoard(self, game):
+        height = self.height
+        cells = game.cells
+        return [list(cells[x * height:(x + 1) * height]) for x in range(self.width)]
+
+
+    def newGame(self, games):
+        if self.numGames >= MAXGAMES:
+            return self.getReply(FULL, 0)
+        if self.pool is not None:
+            board, seed, legalMoves, bestPoints = self.pool.sample(self.rng)
+        else:
+            seed = self.rng.getrandbits(64)
+            self.generator.rng = random.Random(seed)
+            board = self.generator.newBoard(self.width, self.height)
+            seed = self.generator.rng.getrandbits(64)
+        game = GameState(bytes(gem for column in board for gem in column), seed)
+        self.lastGameNumber = self.lastGameNumber % 0xffffffff + 1
+        gameNumber = self.lastGameNumber
+        games[gameNumber] = game
+        self.numGames += 1
+        return self.getReply(OK, gameNumber, game, board)
+
+
+    def endGame(self, games, gameNumber):
+        game = games.pop(gameNumber, None)
+        if game is None:
+            return self.getReply(NOGAME, gameNumber)
+        self.numGames -= 1
+        return self.getReply(OK, gameNumber, game)
+
+
+    def checkSwap(self, games, gameNumber, first, second):
+        # Returns the reply that turns the swap down, or None if it is two
+        # neighbours on the board of a game that isn't over, like
+        # cc_marija.getSwappingGems() checks.
+        self.movesChecked += 1
+        game = games.get(gameNumber)
+        if game is None:
+            return self.getReply(NOGAME, gameNumber)
+        if game.over:
+            return self.getReply(GAMEOVER, gameNumber, game)
+        (x1, y1), (x2, y2) = first, second
+        if (x1 >= self.width or x2 >= self.width or y1 >= self.height or y2 >= self.height
+                or (x2 - x1, y2 - y1) not in STEPDIRECTIONS):
+            return self.getReply(BADSWAP, gameNumber, game)
+        return None
+
+
+    def playSwaps(self, swaps):
+        # Plays swaps, a list of (replies, index, game number, GameState,
+        # first, second) of different games, and puts the reply of each in
+        # replies[index].
+        if self.env is not None:
+            self._playSwapBatch(swaps)
+            return
+        for replies, index, gameNumber, game, first, second in swaps:
+            replies[index] = self._playSwap(gameNumber, game, first, second)
+
+
+    def _playSwap(self, gameNumber, game, first, second):
+        # Plays one swap like GemEngine.swap(), with the game's own refills.
+        board = self.getBoard(game)
+        rng = self.generator.rng = random.Random(game.seed)
+        result = resolveSwap(board, first, second, self.generator, game.score)
+        if not result.valid:
+            return self.getReply(NOMATCH, gameNumber, game, board)
+        game.cells = bytes(gem for column in board for gem in column)
+        game.seed = rng.getrandbits(64)
+        game.score += result.score
+        game.moves += 1
+        game.over = not self.rules.canMakeMove(board)
+        return self.getReply(OK, gameNumber, game, board, result.score)
+
+
+    def _playSwapBatch(self, swaps):
+        # Plays every swap at once with the batch engine: the same rules
+        # and scoring, but the refills come from the GemEnv's random
+        # number generator, so a game's seed doesn't replay it.
+        env = self.env
+        boards = np.frombuffer(b''.join(swap[3].cells for swap in swaps), dtype=np.int8)
+        boards = boards.reshape(len(swaps), self.width, self.height).copy()
+        actions = np.array([env.swapToAction(first, second)
+                            for replies, index, gameNumber, game, first, second in swaps], dtype=np.int64)
+        legal = env.getLegalMask(boards)[np.arange(len(swaps)), actions]
+        points = np.zeros(len(swaps), dtype=np.int64)
+        over = np.zeros(len(swaps), dtype=bool)
+        played = np.flatnonzero(legal)
+        if len(played):
+            sub = boards[played]
+            points[played] = env.playActions(sub, actions[played])
+            over[played] = ~env.getLegalMask(sub).any(axis=1)
+            boards[played] = sub
+
+        packed = packBoards(boards, self.bitsPerSpace)
+        for i, (replies, index, gameNumber, game, first, second) in enumerate(swaps):
+            if legal[i]:
+                game.cells = boards[i].tobytes()
+                game.score += int(points[i])
+                game.moves += 1
+                game.over = bool(over[i])
+            replies[index] = (REPLY.pack(OK if legal[i] else NOMATCH, gameNumber, int(points[i]),
+                                         game.score, game.over)
+                              + packed[i].tobytes())
+
+
+def packBoards(boards, bitsPerSpace):
+    # savegame.packBoard() of every board of boards, an int8 array of
+    # shape (n, width, height) with no empty spaces, as a uint8 array of
+    # shape (n, packed size).
+    codes = boards.reshape(len(boards), -1).astype(np.uint8)
+    bits = (codes[:, :, None] >> np.arange(bitsPerSpace, dtype=np.uint8)) & 1
+    return np.packbits(bits.reshape(len(boards), -1), axis=1, bitorder='little')
+
+
+def unpackBoards(packed, width, height, bitsPerSpace):
+    # The boards of packed, a uint8 array of shape (n, packed size) made
+    # by packBoards(), as an int8 array of shape (n, width, height).
+    bits = np.unpackbits(packed, axis=1, count=width * height * bitsPerSpace, bitorder='little')
+    bits = bits.reshape(len(packed), width * height, bitsPerSpace)
+    weights = (1 << np.arange(bitsPerSpace)).astype(np.int8)
+    return (bits * weights).sum(axis=2, dtype=np.int8).reshape(len(packed), width, height)
+
+
+class GameProtocol(asyncio.Protocol):
+    # One client connection and its games.
+    def __init__(self, server):
+        self.server = server
+        self.games = {} # game number -> GameState
+        self.requests = collections.deque() # REQUEST tuples not handled yet
+        self.buffer = b''
+
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(self.server.getHello())
+
+
+    def data_received(self, data):
+        if self.buffer:
+            data = self.buffer + data
+        used = self.server.addRequests(self, data)
+        self.buffer = data[used:]
+
+
+    def connection_lost(self, exc):
+        self.server.waiting.pop(self, None)
+        self.server.numGames -= len(self.games)
+        self.games.clear()
+        self.requests.clear()
+
+
+async def printStats(server, seconds):
+    lastMoves = server.movesChecked
+    lastTime = time.perf_counter()
+    while True:
+        await asyncio.sleep(seconds)
+        now = time.perf_counter()
+        print('%d games, %.0f moves/s' % (server.numGames,
+                                          (server.movesChecked - lastMoves) / (now - lastTime)))
+        lastMoves = server.movesChecked
+        lastTime = now
+
+
+async def serve(server, host, port, stats):
+    loop = asyncio.get_running_loop()
+    listener = await loop.create_server(lambda: GameProtocol(server), host, port)
+    print('serving %s games on %s:%d' % (server.variant, host, port))
+    if stats:
+        loop.create_task(printStats(server, stats))
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves match-3 games and checks every move.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7878)
+    parser.add_argument('--variant', choices=sorted(VARIANTS), default='marija')
+    parser.add_argument('--width', type=int, default=8)
+    parser.add_argument('--height', type=int, default=8)
+    parser.add_argument('--gems', type=int, default=4, help='number of gem types (NUMGEMIMAGES)')
+    parser.add_argument('--pool', help='board pool file (see boardpool.py) to deal new games from')
+    parser.add_argument('--seed', type=int, help='seed of the seeds of the games, for a repeatable run')
+    parser.add_argument('--engine', choices=('exact', 'batch'), default='exact',
+                        help='play each game like GemEngine, or all waiting swaps at once with a GemEnv')
+    parser.add_argument('--stats', type=float, default=5.0, help='seconds between stats lines, 0 for none')
+    args = parser.parse_args()
+    try:
+        checkNumGems(VARIANTS[args.variant], args.gems)
+    except ValueError as e:
+        parser.error('--gems: %s' % e)
+    if max(args.width, args.height) > 255:
+        parser.error('a board can be at most 255 spaces on a side')
+
+    pool = None
+    if args.pool:
+        pool = openPool(args.pool, args.width, args.height, args.gems, args.variant)
+        if pool is None:
+            parser.error('%s is not a pool of %dx%d %s boards with %d gem types'
+                         % (args.pool, args.width, args.height, args.variant, args.gems))
+    if args.engine == 'batch' and args.width * args.height > 64:
+        parser.error('the batch engine plays boards of at most 64 spaces')
+    server = GameServer(args.variant, args.width, args.height, args.gems, pool, args.seed, args.engine)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.stats))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Hint solver for cc_marija.py: scores every legal swap by the score its
+cascade is expected to earn.
+
+Only the first round of matches of a swap is known in advance; every
+refill after it is dealt at random by a BoardGenerator. The solver estimates
+each swap's expected score with Monte Carlo rollouts: it plays the swap
+on a copy of the board with its own random refills, and averages the
+results. With depth > 0 a rollout also plays that many greedy follow-up
+moves, which rewards swaps that leave a good board behind.
+
+Rollouts run on a FlatBoard copy of the position: each one marks the
+board's undo log, plays the move and undoes it, so no board is copied
+per rollout.
+
+The rollout totals are kept in a result cache keyed by the Zobrist
+hash of the board and the swap, so asking again about a position that
+was already analysed (the same hint twice, or a position reached again
+in offline analysis) starts from the samples it already has. Only the
+root positions searched are cached: a board is hashed in full once per
+search, and the positions inside rollouts are neither hashed nor looked
+up. Every swap there is followed by random refills, so those positions
+almost never come up twice (none of 600 follow-up positions did in a
+one second search with depth=2), and a table of them would only cost
+memory.
+
+    solver = HintSolver()
+    move, expectedScore = solver.findBestMove(board, timeBudget=0.05)
+
+The search runs in rounds (one rollout per legal swap) until the time
+budget is spent, and returns the best move found so far.
+
+cc_marija.py runs it on a worker thread while the player thinks (see
+hintworker.py).
+"""
+
+import random, time
+
+from boardgen import BoardGenerator
+from gemengine import NUMGEMIMAGES, resolveSwap
+from flatboard import FlatBoard
+from matchrules import MARIJARULES
+from moveindex import MoveIndex
+
+
+class ZobristHasher:
+    def __init__(self, width, height, numGems, seed=0):
+        # One random 64 bit number for every gem (and EMPTY_SPACE) on
+        # every space. A board's hash is the XOR of the numbers of its
+        # spaces' contents.
+        rng = random.Random(seed)
+        self.keys = [[rng.getrandbits(64) for gem in range(numGems + 1)]
+                     for space in range(width * height)]
+
+
+    def hashBoard(self, board):
+        h = 0
+        keys = self.keys
+        i = 0
+        for column in board:
+            for gem in column:
+                h ^= keys[i][gem + 1] # EMPTY_SPACE is -1
+                i += 1
+        return h
+
+
+class HintSolver:
+    def __init__(self, numGems=NUMGEMIMAGES, rules=MARIJARULES, depth=0,
+                 maxCacheSize=200000, seed=None):
+        self.numGems = numGems
+        self.rules = rules
+        self.depth = depth # greedy follow-up moves played in each rollout
+        self.maxCacheSize = maxCacheSize
+        self.rng = random.Random(seed)
+        self.generator = BoardGenerator(rules, numGems, self.rng) # deals the rollouts' refills
+        self.hashers = {} # (width, height) -> ZobristHasher
+        self.cache = {} # (board hash, move) -> [total rollout score, number of rollouts]
+
+
+    def hashBoard(self, board):
+        size = (len(board), len(board[0]))
+        hasher = self.hashers.get(size)
+        if hasher is None:
+            hasher = self.hashers[size] = ZobristHasher(size[0], size[1], self.numGems)
+        return hasher.hashBoard(board)
+
+
+    def getMoves(self, board):
+        return MoveIndex(board, self.rules.directions, self.rules.minRun).getMoves()
+
+
+    def searchRounds(self, board, moves=None, deadline=None):
+        # Generator that runs one rollout for every legal move per round and
+        # yields (best move, its expected score) after each round. board is
+        # not changed. Stopping the generator at any time gives an anytime
+        # search; with a time.perf_counter() deadline it stops by itself,
+        # in the middle of a round if need be.
+        if moves is None:
+            moves = self.getMoves(board)
+        moves = sorted(moves)
+        if not moves:
+            return
+        if len(self.cache) > self.maxCacheSize:
+            self.cache.clear()
+
+        boardHash = self.hashBoard(board)
+        entries = []
+        for move in moves:
+            entry = self.cache.get((boardHash, move))
+            if entry is None:
+                entry = self.cache[(boardHash, move)] = [0, 0]
+            entries.append((move, entry))
+        # The moves with the fewest rollouts go first, so a search that is
+        # cut off mid-round and started again (see hintworker.py) catches
+        # up on the moves it left out last time.
+        entries.sort(key=lambda moveEntry: moveEntry[1][1])
+
+        flatBoard = FlatBoard.fromBoard(board)
+        while True:
+            for move, entry in entries:
+                entry[0] += self.rollout(flatBoard, move)
+                entry[1] += 1
+                if deadline is not None and time.perf_counter() >= deadline:
+                    # a round on a big board can take far longer than the
+                    # time budget; the moves not yet played out this round
+                    # are left out (or counted on the rollouts they have).
+                    yield self.bestMove(entries)
+                    return
+            yield self.bestMove(entries)
+
+
+    def findBestMove(self, board, timeBudget=0.05, moves=None):
+        # Returns (move, expected score) for the best move found within
+        # timeBudget seconds, or (None, 0) if there are no legal moves.
+        # At least one rollout is always played.
+        best = (None, 0)
+        for best in self.searchRounds(board, moves, time.perf_counter() + timeBudget):
+            pass
+        return best
+
+
+    def rankMoves(self, board, moves=None):
+        # Every analysed move of this board as (expected score, rollouts,
+        # move), best first.
+        boardHash = self.hashBoard(board)
+        if moves is None:
+            moves = self.getMoves(board)
+        ranking = []
+        for move in moves:
+            entry = self.cache.get((boardHash, move))
+            if entry and entry[1]:
+                ranking.append((entry[0] / entry[1], entry[1], move))
+        ranking.sort(reverse=True)
+        return ranking
+
+
+    def bestMove(self, entries):
+        bestMove = None
+        bestValue = -1
+        for move, (total, rollouts) in entries:
+            if rollouts and total / rollouts > bestValue:
+                bestMove = move
+                bestValue = total / rollouts
+        return bestMove, bestValue
+
+
+    def rollout(self, flatBoard, move):
+        # Plays move (and self.depth greedy follow-ups) on flatBoard with
+        # random refills, undoes it all and returns the points earned.
+        undoPosition = flatBoard.mark()
+        total = resolveSwap(flatBoard, move[0], move[1], self.generator).score
+        for i in range(self.depth):
+            followUp = self.greedyMove(flatBoard)
+            if followUp is None:
+                break
+            total += resolveSwap(flatBoard, followUp[0], followUp[1], self.generator).score
+        flatBoard.undo(undoPosition)
+        return total
+
+
+    def greedyMove(self, board):
+        # The legal move whose first round of matches scores the most.
+        bestMove = None
+        bestScore = 0
+        for first, second in self.getMoves(board):
+            (x1, y1), (x2, y2) = first, second
+            board[x1][y1], board[x2][y2] = board[x2][y2], board[x1][y1]
+            moveScore = self.rules.score(self.rules.findMatchingGemsNear(board, (first, second)))
+            board[x1][y1], board[x2][y2] = board[x2][y2], board[x1][y1]
+            if moveScore > bestScore:
+                bestMove = (first, second)
+                bestScore = moveScore
+        return bestMove
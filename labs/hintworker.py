@@ -0,0 +1,107 @@
+"""
+Background hint search for cc_marija.py: a HintSolver (see gemsolver.py)
+runs on a worker thread while the player looks at the board, so a long
+search costs the game loop no frames.
+
+    HINTS = HintWorker(HintSolver(), HINTEVENT)
+    HINTS.search(engine.board, moves) # whenever the board comes to rest
+    HINTS.cancel()                    # before it changes
+    ...
+    for event in pygame.event.get():
+        if event.type == HINTEVENT and HINTS.isCurrent(event):
+            hintMove = event.move
+
+search() hands a copy of the board to the worker thread, which drops the
+search it is on and starts on the new one. Each time the best move so
+far changes, the worker posts an eventType event to the pygame event
+queue with the move, its expected score, the rollouts it has had and
+the number of the search. Events of a search that was dropped since are
+told apart by that number. A search ends after searchTime seconds, or
+when cancel() or search() is called.
+
+The worker keeps to a frame budget: it searches for sliceTime seconds
+(HintSolver.searchRounds() with a deadline), then sleeps for pauseTime.
+While it sleeps the game loop has the GIL to itself, and while it
+searches the game loop waits at most one slice for it. The solver's
+result cache keeps the rollouts of every slice, so the search
+picks up where it left off. Only the worker thread uses the solver.
+"""
+
+import threading, time
+
+import pygame
+
+from flatboard import copyBoard
+
+SEARCHTIME = 10.0 # seconds a position is searched before the worker gives up on it
+SLICETIME = 0.005 # seconds the worker searches before it pauses
+PAUSETIME = 0.01 # seconds it pauses, so it uses at most a third of the time
+
+
+class HintWorker:
+    def __init__(self, solver, eventType, searchTime=SEARCHTIME, sliceTime=SLICETIME,
+                 pauseTime=PAUSETIME):
+        self.solver = solver
+        self.eventType = eventType # pygame event type of the posted hints
+        self.searchTime = searchTime
+        self.sliceTime = sliceTime
+        self.pauseTime = pauseTime
+        self.searchNumber = 0 # number of the latest search() or cancel()
+        self.job = None # (search number, board, moves) the worker has not started yet
+        self.condition = threading.Condition()
+        # A daemon thread, so a game that exits doesn't wait for it.
+        self.thread = threading.Thread(target=self._run, name='hints', daemon=True)
+        self.thread.start()
+
+
+    def search(self, board, moves=None):
+        # Starts a search of board's moves (all legal moves if moves is
+        # None), dropping the one before. Returns the search number.
+        with self.condition:
+            self.searchNumber += 1
+            self.job = (self.searchNumber, copyBoard(board), moves)
+            self.condition.notify()
+        return self.searchNumber
+
+
+    def cancel(self):
+        # Drops the search, if there is one. The worker notices within
+        # one slice.
+        with self.condition:
+            self.searchNumber += 1
+            self.job = None
+
+
+    def isCurrent(self, event):
+        # True if event, a posted hint, is from the latest search.
+        return event.searchNumber == self.searchNumber
+
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.job is None:
+                    self.condition.wait()
+                searchNumber, board, moves = self.job
+                self.job = None
+            self._search(searchNumber, board, moves)
+
+
+    def _search(self, searchNumber, board, moves):
+        if moves is None:
+            moves = self.solver.getMoves(board)
+        if not moves:
+            return
+        endTime = time.perf_counter() + self.searchTime
+        postedMove = None
+        while searchNumber == self.searchNumber and time.perf_counter() < endTime:
+            for move, expectedScore in self.solver.searchRounds(board, moves,
+                                                                time.perf_counter() + self.sliceTime):
+                pass
+            if move != postedMove and searchNumber == self.searchNumber:
+                rollouts = self.solver.rankMoves(board, [move])[0][1]
+                pygame.event.post(pygame.event.Event(self.eventType, move=move,
+                                                     expectedScore=expectedScore,
+                                                     rollouts=rollouts, searchNumber=searchNumber))
+                postedMove = move
+            time.sleep(self.pauseTime)
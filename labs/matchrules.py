@@ -0,0 +1,324 @@
+"""
+The match-3 rules shared by cc_marija.py, CandyCrush_mine.py and
+candycrush.py (and by GemEngine, MoveIndex and the hint solver).
+
+A game's rules are a MatchRules spec: the directions a run can go in,
+the minimum run length and the points a set of matched gems is worth.
+
+    MARIJARULES      - cc_marija.py: rows and columns, 3 in a row,
+                       10 + (len(gemSet) - 3) * 10 points per run
+    MINERULES        - CandyCrush_mine.py: rows, columns and both
+                       diagonals, 3 in a row, len(gemSet) points per run
+    CANDYCRUSHRULES  - candycrush.py: like MINERULES, but scored one point
+                       per matched space
+
+The spec is compiled once into lookup tables: the spaces of a run in each
+direction, the shapes that are one swap away from a run, and for each
+board size the bit shifts and start masks of those shapes on a bitboard.
+All the match and move checks below are driven by those tables, so every
+variant gets the same (and equally fast) checks.
+
+Boards are board[x][y] lists of lists (candycrush.py's board[r][c] works
+too, since its rules go in all four directions). On a bitboard, bit
+(x * height + y) is set when the space at x, y holds the gem, so the
+space one step (dx, dy) away is (dx * height + dy) bits higher.
+"""
+
+from array import array
+
+EMPTY_SPACE = -1 # same value as in cc_marija.py
+
+# The directions a run can go in, as (dx, dy) steps.
+ORTHOGONAL = ((1, 0), (0, 1))
+DIAGONAL = ((1, 1), (1, -1))
+
+# A swap exchanges a gem with one of these neighbours.
+SWAPSTEPS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+
+def scoreMarija(gemSet):
+    # The points for one run in cc_marija.py.
+    return 10 + (len(gemSet) - 3) * 10
+
+
+def scoreMine(gemSet):
+    # The points for one run in CandyCrush_mine.py.
+    return len(gemSet)
+
+
+def getStartsMask(width, height, offsets):
+    # Returns a mask of every space x, y from which all of offsets stay on
+    # the board.
+    minX = min(dx for dx, dy in offsets)
+    maxX = max(dx for dx, dy in offsets)
+    minY = min(dy for dx, dy in offsets)
+    maxY = max(dy for dx, dy in offsets)
+    mask = 0
+    for x in range(max(0, -minX), width - max(0, maxX)):
+        for y in range(max(0, -minY), height - max(0, maxY)):
+            mask |= 1 << (x * height + y)
+    return mask
+
+
+def getBitboards(board):
+    # Returns a dict of gem number (or EMPTY_SPACE) -> bitmask of its spaces.
+    # The board is packed into one byte per space and each gem's mask is
+    # read out of it in one go by int(), so a 128x128 board costs a few
+    # string operations per gem instead of a loop over 16k spaces.
+    cells = array('b')
+    for column in board:
+        cells.extend(column)
+    cells = cells.tobytes()[::-1] # the last space is the lowest bit, so it comes last
+    masks = {}
+    for byte in set(cells):
+        table = _BITTABLES.get(byte)
+        if table is None:
+            table = _BITTABLES[byte] = bytes(49 if other == byte else 48 for other in range(256))
+        masks[byte - 256 if byte > 127 else byte] = int(cells.translate(table), 2)
+    return masks
+
+_BITTABLES = {} # byte -> bytes.translate() table that maps it to '1' and the rest to '0'
+
+
+def pullDownAllGems(board):
+    # pulls down gems on the board to the bottom to fill in any gaps
+    height = len(board[0])
+    for x in range(len(board)):
+        if EMPTY_SPACE not in board[x]:
+            continue # most columns of a big board have nothing to pull down
+        gemsInColumn = [gem for gem in board[x] if gem != EMPTY_SPACE]
+        board[x] = ([EMPTY_SPACE] * (height - len(gemsInColumn))) + gemsInColumn
+
+
+class MatchRules:
+    def __init__(self, directions=ORTHOGONAL, minRun=3, scoreGemSet=scoreMarija):
+        # directions are (dx, dy) steps, in the order a run is looked for
+        # on each space when two runs cross (see findMatchingGems()).
+        self.directions = tuple(directions)
+        self.minRun = minRun
+        self.scoreGemSet = scoreGemSet # function that returns the points for one set of matched gems
+
+        # runOffsets[d] is the spaces of a minRun long run in direction d,
+        # relative to its first space.
+        self.runOffsets = tuple(tuple((k * dx, k * dy) for k in range(minRun))
+                                for dx, dy in self.directions)
+        self.movePatterns = self._compileMovePatterns()
+        self._tablesCache = {} # (width, height) -> tables made by getTables()
+
+
+    def _compileMovePatterns(self):
+        # The shapes of minRun gems that are one swap away from a run: a
+        # run with one space missing, and the missing gem one swap step
+        # away from it (but not on the run). Each shape is moved so its
+        # offsets are not negative. For cc_marija's rules these are the
+        # eight patterns of canMakeMove() and their transposes.
+        patterns = set()
+        for offsets in self.runOffsets:
+            for missing in range(self.minRun):
+                mx, my = offsets[missing]
+                for sx, sy in SWAPSTEPS:
+                    source = (mx + sx, my + sy)
+                    if source in offsets:
+                        continue
+                    shape = [offset for i, offset in enumerate(offsets) if i != missing]
+                    shape.append(source)
+                    minX = min(dx for dx, dy in shape)
+                    minY = min(dy for dx, dy in shape)
+                    patterns.add(tuple(sorted((dx - minX, dy - minY) for dx, dy in shape)))
+        return tuple(sorted(patterns))
+
+
+    def getTables(self, width, height):
+        # The shift amounts and start masks only depend on the board size,
+        # so they are worked out once per size and reused.
+        tables = self._tablesCache.get((width, height))
+        if tables is not None:
+            return tables
+
+        runs = []
+        for (dx, dy), offsets in zip(self.directions, self.runOffsets):
+            runs.append((dx * height + dy, getStartsMask(width, height, offsets)))
+        patterns = []
+        for offsets in self.movePatterns:
+            starts = getStartsMask(width, height, offsets)
+            if starts:
+                patterns.append((tuple(dx * height + dy for dx, dy in offsets), starts))
+
+        tables = {'runs': tuple(runs), # (shift, starts mask) for each direction
+                  'patterns': tuple(patterns), # (shifts, starts mask) for each move pattern
+                  'windowsThrough': {}} # (x, y) -> the runs through it, see getWindowsThrough()
+        self._tablesCache[(width, height)] = tables
+        return tables
+
+
+    def getWindowsThrough(self, space, width, height):
+        # Every minRun long stretch of spaces on the board that goes
+        # through space, as (x, y, direction index, other spaces) where
+        # x, y is its first space.
+        windowsThrough = self.getTables(width, height)['windowsThrough']
+        windows = windowsThrough.get(space)
+        if windows is None:
+            windows = windowsThrough[space] = self._findWindowsThrough(space, width, height)
+        return windows
+
+
+    def _findWindowsThrough(self, space, width, height):
+        cx, cy = space
+        windows = []
+        for d, offsets in enumerate(self.runOffsets):
+            for kx, ky in offsets:
+                x = cx - kx
+                y = cy - ky
+                spaces = [(x + dx, y + dy) for dx, dy in offsets]
+                if all(0 <= sx < width and 0 <= sy < height for sx, sy in spaces):
+                    windows.append((x, y, d, tuple(spaces[1:])))
+        return tuple(windows)
+
+
+    def score(self, matchedGems):
+        # The points for a list of gem sets, like findMatchingGems() returns.
+        return sum(self.scoreGemSet(gemSet) for gemSet in matchedGems)
+
+
+    def findMatchingGems(self, board):
+        # Returns a list of runs, each a list of (x, y) tuples, the way
+        # cc_marija.findMatchingGems() finds them: the spaces are scanned
+        # column by column, top to bottom, looking for a run in each
+        # direction in turn, and every run is blanked out in a board copy
+        # as soon as it is found. A run that crosses an earlier one
+        # therefore loses the shared space and can end up shorter (or not
+        # be a run at all).
+        #
+        # Every space that starts minRun in a row becomes a candidate, and
+        # the candidates are replayed in scan order against a mask of the
+        # spaces blanked out so far. Bit order is scan order.
+        width = len(board)
+        height = len(board[0])
+        tables = self.getTables(width, height)
+        masks = getBitboards(board)
+        candidates = []
+        for gem, b in masks.items():
+            if gem == EMPTY_SPACE:
+                continue
+            for d, (shift, startsMask) in enumerate(tables['runs']):
+                starts = b & startsMask
+                for k in range(1, self.minRun):
+                    starts &= b >> (k * shift)
+                while starts:
+                    lowest = starts & -starts
+                    candidates.append((lowest.bit_length() - 1, d, gem))
+                    starts ^= lowest
+        if not candidates:
+            return []
+        candidates.sort()
+
+        gemsToRemove = []
+        removed = 0 # bitmask of the spaces already in gemsToRemove
+        for i, d, gem in candidates:
+            b = masks[gem] & ~removed
+            shift = tables['runs'][d][0]
+            if any(not (b >> (i + k * shift)) & 1 for k in range(self.minRun)):
+                continue # part of this run was taken by an earlier one
+            dx, dy = self.directions[d]
+            x, y = divmod(i, height)
+            removeSet = []
+            while 0 <= x < width and 0 <= y < height and (b >> (x * height + y)) & 1:
+                # keep checking if there's more than minRun gems in a row
+                removeSet.append((x, y))
+                removed |= 1 << (x * height + y)
+                x += dx
+                y += dy
+            gemsToRemove.append(removeSet)
+        return gemsToRemove
+
+
+    def findMatchingGemsNear(self, board, changedSpaces):
+        # Returns the same list as findMatchingGems(), but only looks at
+        # the runs that go through the (x, y) spaces in changedSpaces. This
+        # is only correct if the board had no runs before those spaces
+        # changed, because then every new run has to go through one of them.
+        width = len(board)
+        height = len(board[0])
+        windows = set()
+        for space in changedSpaces:
+            windows.update(self.getWindowsThrough(space, width, height))
+
+        # The tuples sort in the order findMatchingGems() visits the
+        # spaces: column by column, top to bottom, direction by direction.
+        candidates = []
+        for x, y, d, others in windows:
+            gem = board[x][y]
+            if gem == EMPTY_SPACE:
+                continue
+            for ox, oy in others:
+                if board[ox][oy] != gem:
+                    break
+            else:
+                candidates.append((x, y, d))
+        if not candidates:
+            return []
+        candidates.sort()
+
+        # The removed set stands in for the spaces findMatchingGems()
+        # blanks out.
+        gemsToRemove = []
+        removed = set()
+        for x, y, d in candidates:
+            dx, dy = self.directions[d]
+            if any((x + kx, y + ky) in removed for kx, ky in self.runOffsets[d]):
+                continue
+            targetGem = board[x][y]
+            removeSet = []
+            while (0 <= x < width and 0 <= y < height and board[x][y] == targetGem
+                   and (x, y) not in removed):
+                # keep checking if there's more than minRun gems in a row
+                removeSet.append((x, y))
+                removed.add((x, y))
+                x += dx
+                y += dy
+            gemsToRemove.append(removeSet)
+        return gemsToRemove
+
+
+    def findMatchedSpaces(self, board):
+        # Returns the set of (x, y) spaces that are part of any run, the
+        # way candycrush.find_matches() finds them: runs that cross share
+        # their spaces instead of blanking each other out.
+        width = len(board)
+        height = len(board[0])
+        tables = self.getTables(width, height)
+        matched = 0
+        for gem, b in getBitboards(board).items():
+            if gem == EMPTY_SPACE:
+                continue
+            for shift, startsMask in tables['runs']:
+                starts = b & startsMask
+                for k in range(1, self.minRun):
+                    starts &= b >> (k * shift)
+                for k in range(self.minRun):
+                    matched |= starts << (k * shift)
+
+        matchedSpaces = set()
+        while matched:
+            lowest = matched & -matched
+            matchedSpaces.add(divmod(lowest.bit_length() - 1, height))
+            matched ^= lowest
+        return matchedSpaces
+
+
+    def canMakeMove(self, board):
+        # Returns True if a swap of two neighbouring gems makes a run. Like
+        # cc_marija.canMakeMove(), EMPTY_SPACE counts as a gem type here.
+        patterns = self.getTables(len(board), len(board[0]))['patterns']
+        for b in getBitboards(board).values():
+            for shifts, starts in patterns:
+                for shift in shifts:
+                    starts &= b >> shift
+                if starts:
+                    return True
+        return False
+
+
+MARIJARULES = MatchRules(ORTHOGONAL, 3, scoreMarija)
+MINERULES = MatchRules(ORTHOGONAL + DIAGONAL, 3, scoreMine)
+CANDYCRUSHRULES = MatchRules(ORTHOGONAL + DIAGONAL, 3, len) # scored with all matched spaces as one set
@@ -0,0 +1,82 @@
+"""
+Board model for the memory games (memorypuzzle_lab.py, memorygame.py),
+built once per game so that a hint, a match check and the win check
+each take constant time, however big the board.
+
+    board = MemoryBoard(BOARDWIDTH, BOARDHEIGHT, len(ALLICONS))
+    shape, color = ALLICONS[board.getIcon(x, y)]
+    board.setRevealed(x, y, True)
+    if board.isMatch(firstSelection, (x, y)):
+        board.addMatch()
+        if board.hasWon():
+            ...
+    hintx, hinty = board.findMatchingBox(firstSelection)
+
+A box holds an integer icon id (board.icons[x][y]), which the game looks
+up in its own table of (shape, color) icons. Every icon is on exactly
+two boxes, which board.boxesOfIcon keeps, so the other box of a pair is
+one lookup instead of a scan of the board. The revealed boxes are one
+int with bit x * height + y set for each (like the bitboards of
+gemenv.py), and the board counts the pairs the player has matched: it is
+won when that count reaches the number of pairs.
+"""
+
+import random
+
+
+class MemoryBoard:
+    def __init__(self, width, height, numIcons, rng=random):
+        if (width * height) % 2:
+            raise ValueError('a %dx%d board has an odd number of boxes' % (width, height))
+        self.width = width
+        self.height = height
+        self.numPairs = width * height // 2
+        if numIcons < self.numPairs:
+            raise ValueError('%d icons are too few for %d pairs' % (numIcons, self.numPairs))
+
+        # Two of each of numPairs different icons, in random places.
+        icons = rng.sample(range(numIcons), self.numPairs) * 2
+        rng.shuffle(icons)
+        self.icons = [icons[x * height:(x + 1) * height] for x in range(width)]
+        self.boxesOfIcon = {} # icon id -> the two (x, y) boxes it is on
+        for x, column in enumerate(self.icons):
+            for y, icon in enumerate(column):
+                self.boxesOfIcon.setdefault(icon, []).append((x, y))
+        self.revealed = 0 # bit x * height + y is set if the box at x, y is revealed
+        self.matchedPairs = 0
+
+
+    def getIcon(self, x, y):
+        return self.icons[x][y]
+
+
+    def isRevealed(self, x, y):
+        return bool(self.revealed >> (x * self.height + y) & 1)
+
+
+    def setRevealed(self, x, y, revealed):
+        bit = 1 << (x * self.height + y)
+        if revealed:
+            self.revealed |= bit
+        else:
+            self.revealed &= ~bit
+
+
+    def isMatch(self, first, second):
+        # True if the boxes first and second, both (x, y), have the same icon.
+        return self.icons[first[0]][first[1]] == self.icons[second[0]][second[1]]
+
+
+    def findMatchingBox(self, box):
+        # The other box with the same icon as box.
+        first, second = self.boxesOfIcon[self.icons[box[0]][box[1]]]
+        return second if first == box else first
+
+
+    def addMatch(self):
+        # Counts a pair the player has found (both its boxes stay revealed).
+        self.matchedPairs += 1
+
+
+    def hasWon(self):
+        return self.matchedPairs == self.numPairs
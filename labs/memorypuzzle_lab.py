@@ -6,6 +6,9 @@
 import random, pygame, sys
 from pygame.locals import *
 
+from dirtyscreen import DirtyScreen
+from memoryboard import MemoryBoard
+
 FPS = 30 # frames per second, the general speed of the program
 WINDOWWIDTH = 760 # size of window's width in pixels
 WINDOWHEIGHT = 780 # size of windows' height in pixels
@@ -36,6 +39,7 @@ BGCOLOR = NAVYBLUE
 LIGHTBGCOLOR = GRAY
 BOXCOLOR = WHITE
 HIGHLIGHTCOLOR = BLUE
+ICONKEYCOLOR = (0, 0, 0) # see-through color of the icon images, in no icon
 
 DONUT = 'donut'
 SQUARE = 'square'
@@ -46,35 +50,50 @@ BALL = 'ball'
 
 ALLCOLORS = (RED, GREEN, BLUE, YELLOW, ORANGE, PURPLE, CYAN, PINK, LIME)
 ALLSHAPES = (DONUT, SQUARE, DIAMOND, LINES, OVAL, BALL)
-assert len(ALLCOLORS) * len(ALLSHAPES) * 2 >= BOARDWIDTH * BOARDHEIGHT, "Board is too big for the number of shapes/colors defined."
+# Every shape in every color. The boxes of a MemoryBoard hold indexes into this.
+ALLICONS = tuple((shape, color) for color in ALLCOLORS for shape in ALLSHAPES)
+assert len(ALLICONS) * 2 >= BOARDWIDTH * BOARDHEIGHT, "Board is too big for the number of shapes/colors defined."
 
 def main():
-    global FPSCLOCK, DISPLAYSURF
+    global FPSCLOCK, DISPLAYSURF, BASICFONT, ICONIMAGES, COVERIMAGE, HIGHLIGHTIMAGE, TITLEIMAGE, SCREEN, DRAWNBOXES
     pygame.init()
     FPSCLOCK = pygame.time.Clock()
     DISPLAYSURF = pygame.display.set_mode((WINDOWWIDTH, WINDOWHEIGHT))
+    BASICFONT = pygame.font.Font(None, 60)
+    ICONIMAGES = makeIconImages()
+    COVERIMAGE = pygame.Surface((BOXSIZE, BOXSIZE)).convert()
+    COVERIMAGE.fill(BOXCOLOR)
+    HIGHLIGHTIMAGE = makeOutlineImage(HIGHLIGHTCOLOR)
+    TITLEIMAGE = BASICFONT.render('Memory Game', True, (255, 255, 255))
 
     mousex = 0 # used to store x coordinate of mouse event
     mousey = 0 # used to store y coordinate of mouse event
     pygame.display.set_caption('Memory Game')
 
+    # Only the parts of the window that change are redrawn (see
+    # dirtyscreen.py). The title and the hint button are drawn once, on
+    # the background; the boxes are drawn on SCREEN's layer, and
+    # DRAWNBOXES is the image drawn in each box (None where nothing is
+    # drawn yet), so drawBoard() only draws the boxes that changed.
+    background = pygame.Surface((WINDOWWIDTH, WINDOWHEIGHT)).convert()
+    background.fill(BGCOLOR)
+    background.blit(TITLEIMAGE, getTitlePosition())
+    hintButton = drawHintButton(background)
+    SCREEN = DirtyScreen(DISPLAYSURF, background)
+    DRAWNBOXES = [[None] * BOARDHEIGHT for x in range(BOARDWIDTH)]
+
     mainBoard = getRandomizedBoard()
-    revealedBoxes = generateRevealedBoxesData(False)
 
     firstSelection = None # stores the (x, y) of the first box clicked.
     score = 0
     streak = 0
 
-
-    DISPLAYSURF.fill(BGCOLOR)
     startGameAnimation(mainBoard)
 
     while True: # main game loop
         mouseClicked = False
 
-        DISPLAYSURF.fill(BGCOLOR) # drawing the window
-        drawBoard(mainBoard, revealedBoxes)
-        hintButton = drawHintButton()
+        drawBoard(mainBoard, mainBoard.revealed)
 
         for event in pygame.event.get(): # event handling loop
             if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
@@ -87,80 +106,72 @@ def main():
                 mouseClicked = True
                 if hintButton.collidepoint(mousex, mousey) and firstSelection:
                     match = findMatchingTile(mainBoard, firstSelection)
-                    if match:
-                        revealBoxesAnimation(mainBoard, [match])
-                        revealedBoxes[match[0]][match[1]] = True
-                        if hasWon(revealedBoxes):
-                            gameWonAnimation(mainBoard)
-                            pygame.time.wait(2000)
-                            mainBoard = getRandomizedBoard()
-                            revealedBoxes = generateRevealedBoxesData(False)
-                            drawBoard(mainBoard, revealedBoxes)
-                            pygame.display.update()
-                            pygame.time.wait(1000)
-                            startGameAnimation(mainBoard)
-                        else:
-                            # The hint effectively "clicks" the second tile
-                            firstSelection = None
+                    revealBoxesAnimation(mainBoard, [match])
+                    mainBoard.setRevealed(match[0], match[1], True)
+                    mainBoard.addMatch()
+                    # The hint effectively "clicks" the second tile
+                    firstSelection = None
+                    if mainBoard.hasWon():
+                        gameWonAnimation(mainBoard)
+                        pygame.time.wait(2000)
+                        mainBoard = getRandomizedBoard()
+                        drawBoard(mainBoard, mainBoard.revealed)
+                        SCREEN.present()
+                        pygame.time.wait(1000)
+                        startGameAnimation(mainBoard)
 
         boxx, boxy = getBoxAtPixel(mousex, mousey)
+        highlights = []
         if boxx != None and boxy != None:
             # The mouse is currently over a box.
-            if not revealedBoxes[boxx][boxy]:
-                drawHighlightBox(boxx, boxy)
-            if not revealedBoxes[boxx][boxy] and mouseClicked:
+            if not mainBoard.isRevealed(boxx, boxy):
+                highlights.append(getHighlightOverlay(boxx, boxy))
+            if not mainBoard.isRevealed(boxx, boxy) and mouseClicked:
                 revealBoxesAnimation(mainBoard, [(boxx, boxy)])
-                revealedBoxes[boxx][boxy] = True # set the box as "revealed"
+                mainBoard.setRevealed(boxx, boxy, True) # set the box as "revealed"
                 if firstSelection == None: # the current box was the first box clicked
                     firstSelection = (boxx, boxy)
                 else: # the current box was the second box clicked
                     # Check if there is a match between the two icons.
-                    icon1shape, icon1color = getShapeAndColor(mainBoard, firstSelection[0], firstSelection[1])
-                    icon2shape, icon2color = getShapeAndColor(mainBoard, boxx, boxy)
-
-                    if icon1shape != icon2shape or icon1color != icon2color:
+                    if not mainBoard.isMatch(firstSelection, (boxx, boxy)):
                         # Icons don't match. Re-cover up both selections.
                         pygame.time.wait(1000) # 1000 milliseconds = 1 sec
                         coverBoxesAnimation(mainBoard, [(firstSelection[0], firstSelection[1]), (boxx, boxy)])
-                        revealedBoxes[firstSelection[0]][firstSelection[1]] = False
-                        revealedBoxes[boxx][boxy] = False
+                        mainBoard.setRevealed(firstSelection[0], firstSelection[1], False)
+                        mainBoard.setRevealed(boxx, boxy, False)
                         streak = 0
                     else:
+                        mainBoard.addMatch()
                         streak +=1
                         score, earned = apply_score(score, streak)
-                        if hasWon(revealedBoxes): # check if all pairs found
+                        if mainBoard.hasWon(): # check if all pairs found
                             gameWonAnimation(mainBoard)
                             pygame.time.wait(2000)
 
                             # Reset the board
                             mainBoard = getRandomizedBoard()
-                            revealedBoxes = generateRevealedBoxesData(False)
 
                             # Show the fully unrevealed board for a second.
-                            drawBoard(mainBoard, revealedBoxes)
-                            pygame.display.update()
+                            drawBoard(mainBoard, mainBoard.revealed)
+                            SCREEN.present()
                             pygame.time.wait(1000)
 
                             # Replay the start game animation.
                             startGameAnimation(mainBoard)
                     firstSelection = None # reset firstSelection variable
 
-        # Redraw the screen and wait a clock tick.
-
+        # Redraw the changed parts of the screen and wait a clock tick.
+        SCREEN.setOverlays('highlight', highlights)
         drawScore(score)
-        pygame.display.update()
+        SCREEN.present()
         FPSCLOCK.tick(FPS)
 
 
 def findMatchingTile(board, firstSelection):
-    shape, color = board[firstSelection[0]][firstSelection[1]]
-    for x in range(BOARDWIDTH):
-        for y in range(BOARDHEIGHT):
-            if (x, y) != firstSelection and board[x][y] == (shape, color):
-                return (x, y)
-    return None
+    return board.findMatchingBox(firstSelection)
 
-def drawHintButton():
+def drawHintButton(surface):
+    # Draws the hint button on surface and returns its rect.
     font = pygame.font.Font(None, 40)
     text = font.render('Hint', True, WHITE)
 
@@ -173,8 +184,8 @@ def drawHintButton():
     button_y = title_y
 
     buttonRect = pygame.Rect(button_x, button_y, button_width, button_height)
-    pygame.draw.rect(DISPLAYSURF, (100, 150, 255), buttonRect)
-    DISPLAYSURF.blit(text, (buttonRect.x + 20, buttonRect.y + 10))
+    pygame.draw.rect(surface, (100, 150, 255), buttonRect)
+    surface.blit(text, (buttonRect.x + 20, buttonRect.y + 10))
     return buttonRect
 
 def apply_score(score, streak):
@@ -183,39 +194,20 @@ def apply_score(score, streak):
     score += earned
     return score, earned
 
-def drawScore(score):
-    font = pygame.font.Font(None, 60)
-    scoreSurf = font.render(f"Score: {score}", True, (255, 255, 255))
-    DISPLAYSURF.blit(scoreSurf, (20, 10))
+SCOREOVERLAY = [None, None] # the score last rendered, and its (image, rect) overlay
 
-def generateRevealedBoxesData(val):
-    revealedBoxes = []
-    for i in range(BOARDWIDTH):
-        revealedBoxes.append([val] * BOARDHEIGHT)
-    return revealedBoxes
+def drawScore(score):
+    # The score text is only rendered again when the score changes.
+    if SCOREOVERLAY[0] != score:
+        scoreSurf = BASICFONT.render(f"Score: {score}", True, (255, 255, 255))
+        SCOREOVERLAY[:] = [score, (scoreSurf, scoreSurf.get_rect(topleft=(20, 10)))]
+    SCREEN.setOverlays('score', [SCOREOVERLAY[1]])
 
 
 def getRandomizedBoard():
-    # Get a list of every possible shape in every possible color.
-    icons = []
-    for color in ALLCOLORS:
-        for shape in ALLSHAPES:
-            icons.append( (shape, color) )
-
-    random.shuffle(icons) # randomize the order of the icons list
-    numIconsUsed = int(BOARDWIDTH * BOARDHEIGHT / 2) # calculate how many icons are needed
-    icons = icons[:numIconsUsed] * 2 # make two of each
-    random.shuffle(icons)
-
-    # Create the board data structure, with randomly placed icons.
-    board = []
-    for x in range(BOARDWIDTH):
-        column = []
-        for y in range(BOARDHEIGHT):
-            column.append(icons[0])
-            del icons[0] # remove the icons as we assign them
-        board.append(column)
-    return board
+    # A MemoryBoard with two of each of (BOARDWIDTH * BOARDHEIGHT / 2)
+    # randomly picked icons, in random places.
+    return MemoryBoard(BOARDWIDTH, BOARDHEIGHT, len(ALLICONS))
 
 
 def splitIntoGroupsOf(groupSize, theList):
@@ -235,55 +227,82 @@ def leftTopCoordsOfBox(boxx, boxy):
 
 
 def getBoxAtPixel(x, y):
-    for boxx in range(BOARDWIDTH):
-        for boxy in range(BOARDHEIGHT):
-            left, top = leftTopCoordsOfBox(boxx, boxy)
-            boxRect = pygame.Rect(left, top, BOXSIZE, BOXSIZE)
-            if boxRect.collidepoint(x, y):
-                return (boxx, boxy)
+    # The box under x, y, worked out from the grid (not in a gap).
+    boxx, offsetx = divmod(x - XMARGIN, BOXSIZE + GAPSIZE)
+    boxy, offsety = divmod(y - YMARGIN, BOXSIZE + GAPSIZE)
+    if 0 <= boxx < BOARDWIDTH and 0 <= boxy < BOARDHEIGHT and offsetx < BOXSIZE and offsety < BOXSIZE:
+        return (boxx, boxy)
     return (None, None)
 
 
-def drawIcon(shape, color, boxx, boxy):
+def drawShape(surface, shape, color, left, top):
     quarter = int(BOXSIZE * 0.25) # syntactic sugar
     half =    int(BOXSIZE * 0.5)  # syntactic sugar
 
-    left, top = leftTopCoordsOfBox(boxx, boxy) # get pixel coords from board coords
     # Draw the shapes
     if shape == DONUT:
-        pygame.draw.circle(DISPLAYSURF, color, (left + half, top + half), half - 5)
-        pygame.draw.circle(DISPLAYSURF, BGCOLOR, (left + half, top + half), quarter - 5)
+        pygame.draw.circle(surface, color, (left + half, top + half), half - 5)
+        pygame.draw.circle(surface, BGCOLOR, (left + half, top + half), quarter - 5)
     elif shape == SQUARE:
-        pygame.draw.rect(DISPLAYSURF, color, (left + quarter, top + quarter, BOXSIZE - half, BOXSIZE - half))
+        pygame.draw.rect(surface, color, (left + quarter, top + quarter, BOXSIZE - half, BOXSIZE - half))
     elif shape == DIAMOND:
-        pygame.draw.polygon(DISPLAYSURF, color, ((left + half, top), (left + BOXSIZE - 1, top + half), (left + half, top + BOXSIZE - 1), (left, top + half)))
+        pygame.draw.polygon(surface, color, ((left + half, top), (left + BOXSIZE - 1, top + half), (left + half, top + BOXSIZE - 1), (left, top + half)))
     elif shape == LINES:
         for i in range(0, BOXSIZE, 4):
-            pygame.draw.line(DISPLAYSURF, color, (left, top + i), (left + i, top))
-            pygame.draw.line(DISPLAYSURF, color, (left + i, top + BOXSIZE - 1), (left + BOXSIZE - 1, top + i))
+            pygame.draw.line(surface, color, (left, top + i), (left + i, top))
+            pygame.draw.line(surface, color, (left + i, top + BOXSIZE - 1), (left + BOXSIZE - 1, top + i))
     elif shape == OVAL:
-        pygame.draw.ellipse(DISPLAYSURF, color, (left, top + quarter, BOXSIZE, half))
+        pygame.draw.ellipse(surface, color, (left, top + quarter, BOXSIZE, half))
     elif shape == BALL:
-        pygame.draw.circle(DISPLAYSURF, color, (left + half, top + half), half - 5)
+        pygame.draw.circle(surface, color, (left + half, top + half), half - 5)
+
+
+def makeIconImages():
+    # Draws every icon of ALLICONS once, on a box-sized image of its own
+    # (see-through where the shape isn't), so drawing an icon is one blit.
+    images = []
+    for shape, color in ALLICONS:
+        image = pygame.Surface((BOXSIZE, BOXSIZE)).convert()
+        image.fill(ICONKEYCOLOR)
+        drawShape(image, shape, color, 0, 0)
+        image.set_colorkey(ICONKEYCOLOR, RLEACCEL)
+        images.append(image)
+    return images
 
 
-def getShapeAndColor(board, boxx, boxy):
-    # shape value for x, y spot is stored in board[x][y][0]
-    # color value for x, y spot is stored in board[x][y][1]
-    return board[boxx][boxy][0], board[boxx][boxy][1]
+def makeOutlineImage(color):
+    # A see-through image of the 4 pixel wide outline drawn around a box.
+    image = pygame.Surface((BOXSIZE + 10, BOXSIZE + 10), SRCALPHA)
+    pygame.draw.rect(image, color, image.get_rect(), 4)
+    return image
+
+
+def getTitlePosition():
+    return (WINDOWWIDTH // 2 - TITLEIMAGE.get_width() // 2, 20)
+
+
+def drawBox(boxx, boxy, image):
+    # Draws image (an icon or COVERIMAGE) in the box on SCREEN's layer,
+    # unless it is already there.
+    if DRAWNBOXES[boxx][boxy] is not image:
+        left, top = leftTopCoordsOfBox(boxx, boxy)
+        SCREEN.drawLayer((left, top, BOXSIZE, BOXSIZE), image)
+        DRAWNBOXES[boxx][boxy] = image
 
 
 def drawBoxCovers(board, boxes, coverage):
     # Draws boxes being covered/revealed. "boxes" is a list
     # of two-item lists, which have the x & y spot of the box.
+    # The icons go on SCREEN's layer and the covers over them, so only
+    # the boxes are updated on the display.
+    covers = []
     for box in boxes:
-        left, top = leftTopCoordsOfBox(box[0], box[1])
-        pygame.draw.rect(DISPLAYSURF, BGCOLOR, (left, top, BOXSIZE, BOXSIZE))
-        shape, color = getShapeAndColor(board, box[0], box[1])
-        drawIcon(shape, color, box[0], box[1])
+        drawBox(box[0], box[1], ICONIMAGES[board.getIcon(box[0], box[1])])
         if coverage > 0: # only draw the cover if there is an coverage
-            pygame.draw.rect(DISPLAYSURF, BOXCOLOR, (left, top, coverage, BOXSIZE))
-    pygame.display.update()
+            left, top = leftTopCoordsOfBox(box[0], box[1])
+            covers.append((COVERIMAGE, (left, top, coverage, BOXSIZE)))
+    SCREEN.setOverlays('covers', covers)
+    SCREEN.present()
     FPSCLOCK.tick(FPS)
 
 
@@ -297,33 +316,33 @@ def coverBoxesAnimation(board, boxesToCover):
     # Do the "box cover" animation.
     for coverage in range(0, BOXSIZE + REVEALSPEED, REVEALSPEED):
         drawBoxCovers(board, boxesToCover, coverage)
+    # Leave the boxes covered on the layer.
+    for box in boxesToCover:
+        drawBox(box[0], box[1], COVERIMAGE)
+    SCREEN.setOverlays('covers', [])
 
 
 def drawBoard(board, revealed):
-    # Draws all of the boxes in their covered or revealed state.
-    font = pygame.font.Font(None, 60)
-    title_surface = font.render('Memory Game', True, (255, 255, 255))
-    DISPLAYSURF.blit(title_surface, (WINDOWWIDTH // 2 - title_surface.get_width() // 2, 20))
+    # Draws all of the boxes in their covered or revealed state on
+    # SCREEN's layer; only the boxes that changed are drawn.
+    # revealed is a bitset of the revealed boxes, like MemoryBoard.revealed.
     for boxx in range(BOARDWIDTH):
         for boxy in range(BOARDHEIGHT):
-            left, top = leftTopCoordsOfBox(boxx, boxy)
-            if not revealed[boxx][boxy]:
+            if not revealed >> (boxx * BOARDHEIGHT + boxy) & 1:
                 # Draw a covered box.
-                pygame.draw.rect(DISPLAYSURF, BOXCOLOR, (left, top, BOXSIZE, BOXSIZE))
+                drawBox(boxx, boxy, COVERIMAGE)
             else:
                 # Draw the (revealed) icon.
-                shape, color = getShapeAndColor(board, boxx, boxy)
-                drawIcon(shape, color, boxx, boxy)
+                drawBox(boxx, boxy, ICONIMAGES[board.getIcon(boxx, boxy)])
 
 
-def drawHighlightBox(boxx, boxy):
+def getHighlightOverlay(boxx, boxy):
     left, top = leftTopCoordsOfBox(boxx, boxy)
-    pygame.draw.rect(DISPLAYSURF, HIGHLIGHTCOLOR, (left - 5, top - 5, BOXSIZE + 10, BOXSIZE + 10), 4)
+    return (HIGHLIGHTIMAGE, (left - 5, top - 5, BOXSIZE + 10, BOXSIZE + 10))
 
 
 def startGameAnimation(board):
     # Randomly reveal the boxes 8 at a time.
-    coveredBoxes = generateRevealedBoxesData(False)
     boxes = []
     for x in range(BOARDWIDTH):
         for y in range(BOARDHEIGHT):
@@ -331,7 +350,7 @@ def startGameAnimation(board):
     random.shuffle(boxes)
     boxGroups = splitIntoGroupsOf(8, boxes)
 
-    drawBoard(board, coveredBoxes)
+    drawBoard(board, 0) # every box covered
     for boxGroup in boxGroups:
         revealBoxesAnimation(board, boxGroup)
         coverBoxesAnimation(board, boxGroup)
@@ -339,24 +358,20 @@ def startGameAnimation(board):
 
 def gameWonAnimation(board):
     # flash the background color when the player has won
-    coveredBoxes = generateRevealedBoxesData(True)
+    icons = [(ICONIMAGES[board.getIcon(boxx, boxy)], leftTopCoordsOfBox(boxx, boxy))
+             for boxx in range(BOARDWIDTH) for boxy in range(BOARDHEIGHT)]
     color1 = LIGHTBGCOLOR
     color2 = BGCOLOR
 
     for i in range(13):
         color1, color2 = color2, color1 # swap colors
         DISPLAYSURF.fill(color1)
-        drawBoard(board, coveredBoxes)
+        DISPLAYSURF.blit(TITLEIMAGE, getTitlePosition())
+        DISPLAYSURF.blits(icons, doreturn=False)
         pygame.display.update()
         pygame.time.wait(300)
-
-
-def hasWon(revealedBoxes):
-    # Returns True if all the boxes have been revealed, otherwise False
-    for i in revealedBoxes:
-        if False in i:
-            return False # return False if any boxes are covered.
-    return True
+    # The whole window is drawn from SCREEN again after this.
+    SCREEN.redrawAll()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,120 @@
+"""
+The set of legal swaps on a match-3 board (cc_marija.py and
+CandyCrush_mine.py), kept up to date as spaces change.
+
+canMakeMove() rescans the whole board after every move just to answer
+"is there any move left?". A MoveIndex works out every legal swap once,
+and after that update() only rechecks the swaps close enough to a changed
+space for their result to be different. A swap is legal when it puts at
+least minRun identical gems in a row in one of the index's directions
+(the directions and minRun of the game's MatchRules, see matchrules.py).
+
+A swap is stored as ((x1, y1), (x2, y2)) where the second space is to
+the right of or below the first one.
+"""
+
+from matchrules import EMPTY_SPACE, ORTHOGONAL
+
+
+class MoveIndex:
+    def __init__(self, board, directions=ORTHOGONAL, minRun=3):
+        # board is a board[x][y] data structure. The index keeps a
+        # reference to it (and never changes it), so update() has to be
+        # called after the board changes.
+        self.board = board
+        self.width = len(board)
+        self.height = len(board[0])
+        self.directions = directions
+        self.minRun = minRun
+        self._nearSwaps = {} # (x, y) -> the swaps update() rechecks when it changes
+        self.moves = set()
+        for x in range(self.width):
+            for y in range(self.height):
+                for swap in (((x, y), (x + 1, y)), ((x, y), (x, y + 1))):
+                    if self._onBoard(swap[1]) and self.isLegal(swap):
+                        self.moves.add(swap)
+
+
+    def __len__(self):
+        return len(self.moves)
+
+
+    def hasMoves(self):
+        return bool(self.moves)
+
+
+    def getMoves(self):
+        return list(self.moves)
+
+
+    def update(self, changedSpaces):
+        # Rechecks every swap that has an end within minRun - 1 spaces of
+        # a changed space along one of the directions. Those are the only
+        # swaps that can look at a changed space.
+        swaps = set()
+        for space in changedSpaces:
+            nearSwaps = self._nearSwaps.get(space)
+            if nearSwaps is None:
+                nearSwaps = self._nearSwaps[space] = self._getSwapsNear(space)
+            swaps.update(nearSwaps)
+
+        for swap in swaps:
+            if self.isLegal(swap):
+                self.moves.add(swap)
+            else:
+                self.moves.discard(swap)
+
+
+    def _getSwapsNear(self, space):
+        cx, cy = space
+        swaps = set()
+        for dx, dy in self.directions:
+            for k in range(1 - self.minRun, self.minRun):
+                x = cx + k * dx
+                y = cy + k * dy
+                if not self._onBoard((x, y)):
+                    continue
+                for other in ((x + 1, y), (x, y + 1)):
+                    if self._onBoard(other):
+                        swaps.add(((x, y), other))
+                for other in ((x - 1, y), (x, y - 1)):
+                    if self._onBoard(other):
+                        swaps.add((other, (x, y)))
+        return tuple(swaps)
+
+
+    def isLegal(self, swap):
+        first, second = swap
+        gem1 = self.board[first[0]][first[1]]
+        gem2 = self.board[second[0]][second[1]]
+        if gem1 == gem2 or gem1 == EMPTY_SPACE or gem2 == EMPTY_SPACE:
+            return False
+        return self._makesRun(second, gem1, first) or self._makesRun(first, gem2, second)
+
+
+    def _onBoard(self, space):
+        return 0 <= space[0] < self.width and 0 <= space[1] < self.height
+
+
+    def _makesRun(self, space, gem, otherSpace):
+        # Returns True if gem, having been swapped from otherSpace into
+        # space, is part of minRun or more identical gems in a row. After
+        # the swap otherSpace holds a different gem, so a run stops there.
+        board = self.board
+        width = self.width
+        height = self.height
+        minRun = self.minRun
+        x, y = space
+        for dx, dy in self.directions:
+            length = 1
+            for sign in (1, -1):
+                cx = x + sign * dx
+                cy = y + sign * dy
+                while (length < minRun and 0 <= cx < width and 0 <= cy < height
+                       and (cx, cy) != otherSpace and board[cx][cy] == gem):
+                    length += 1
+                    cx += sign * dx
+                    cy += sign * dy
+            if length >= minRun:
+                return True
+        return False
@@ -0,0 +1,120 @@
+"""
+Move logs for the match-3 games: enough to play a game again exactly,
+without pygame and without the frame clock (see replay.py).
+
+Every game has its own random number generator, seeded with a fresh
+seed (or a pool board's refill seed) when the game starts, and every gem
+the game deals comes from it. So a game is its variant, its seed, its
+starting board and the swaps the player made. A log file is:
+
+    HEADER         magic, version, width, height, gem types, variant,
+                   seed, whether the starting board was given (from a
+                   pool or a saved game) instead of dealt from the seed,
+                   score at the start
+    board          one byte per space, column by column
+    MOVE * swaps   milliseconds since the game started, the two spaces,
+                   the score and the hash of the board after the swap
+
+A move is 24 bytes, so an hour of play is a few kilobytes.
+
+    log = MoveLogWriter(path, 'marija', engine.board, NUMGEMIMAGES, seed)
+    log.logSwap(first, second, engine.score, engine.board)
+    log.close()
+"""
+
+import hashlib, os, random, struct, time
+from array import array
+
+MAGIC = b'GEMLOG\0\0'
+VERSION = 2
+
+# magic, version, width, height, gem types, variant, seed, board given, score at the start
+HEADER = struct.Struct('<8sHHHH16sQBq')
+# version 1 logs, from before games could be saved: no score at the start
+HEADERVERSION1 = struct.Struct('<8sHHHH16sQB')
+# milliseconds since the game started, x1, y1, x2, y2, score, board hash
+MOVE = struct.Struct('<IHHHHqQ')
+
+
+def newSeed():
+    # A seed for a new game.
+    return random.SystemRandom().getrandbits(64)
+
+
+def hashBoard(board):
+    # A 64-bit hash of a board[x][y] that is the same on every run (unlike
+    # hash()), so a log can be checked on another machine.
+    cells = array('b')
+    for column in board:
+        cells.extend(column)
+    return int.from_bytes(hashlib.blake2b(cells.tobytes(), digest_size=8).digest(), 'little')
+
+
+def getLogPath(directory, variant, seed):
+    # A new file name in directory for a game's log.
+    return os.path.join(directory, '%s-%s-%016x.gemlog'
+                        % (variant, time.strftime('%Y%m%d-%H%M%S'), seed))
+
+
+class MoveLogWriter:
+    def __init__(self, path, variant, board, numGems, seed, fromPool=False, score=0):
+        # board is the starting board; seed is the seed of the game's
+        # random number generator. fromPool is True if board was not dealt
+        # from seed, and score is the score at the start (a resumed game
+        # starts with one).
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(board), len(board[0]), numGems,
+                                    variant.encode('ascii'), seed, fromPool, score))
+        cells = bytearray()
+        for column in board:
+            cells.extend(column)
+        self.file.write(cells)
+        self.file.flush()
+        self.startTime = time.perf_counter()
+
+
+    def logSwap(self, first, second, score, board):
+        # Logs the swap of the (x, y) spaces first and second, with the
+        # score and board after it (a swap that made no match too).
+        milliseconds = int((time.perf_counter() - self.startTime) * 1000)
+        self.file.write(MOVE.pack(min(milliseconds, 0xffffffff), first[0], first[1],
+                                  second[0], second[1], score, hashBoard(board)))
+        self.file.flush() # a log has to survive the game crashing
+
+
+    def close(self):
+        self.file.close()
+
+
+class MoveLog:
+    # A log file read back in.
+    def __init__(self, path):
+        with open(path, 'rb') as logFile:
+            data = logFile.read()
+        magic, version = struct.unpack_from('<8sH', data)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError('%s is not a version %d move log' % (path, VERSION))
+        if version == 1:
+            header = HEADERVERSION1
+            (magic, version, self.width, self.height, self.numGems, variant, self.seed,
+             fromPool) = header.unpack_from(data)
+            self.startScore = 0
+        else:
+            header = HEADER
+            (magic, version, self.width, self.height, self.numGems, variant, self.seed,
+             fromPool, self.startScore) = header.unpack_from(data)
+        self.variant = variant.rstrip(b'\0').decode('ascii')
+        self.fromPool = bool(fromPool)
+        start = header.size
+        height = self.height
+        self.board = [list(data[start + x * height:start + (x + 1) * height])
+                      for x in range(self.width)]
+        start += self.width * height
+        # (milliseconds, (x1, y1), (x2, y2), score, board hash) for each swap;
+        # a log cut short by a crash loses its last, partly written move.
+        self.moves = [(milliseconds, (x1, y1), (x2, y2), score, boardHash)
+                      for milliseconds, x1, y1, x2, y2, score, boardHash
+                      in MOVE.iter_unpack(data[start:start + (len(data) - start) // MOVE.size * MOVE.size])]
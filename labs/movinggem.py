@@ -0,0 +1,48 @@
+"""
+The moving gem record of the match-3 animations (cc_marija.py and
+CandyCrush_mine.py).
+
+getSwappingGems() and getFallingGems() make one MovingGem for every gem
+that slides during an animation, and moveGems() and the drawing code read
+them back. A cascade on a big board moves hundreds of gems per step, so
+a MovingGem has __slots__ instead of a dict, and its direction is an
+integer with the (dx, dy) step worked out once when the gem is made,
+instead of a string compared in an if-chain every frame.
+"""
+
+# constants for direction values, indexes into DIRECTIONSTEPS
+UP = 0
+DOWN = 1
+LEFT = 2
+RIGHT = 3
+
+# The (dx, dy) board step of each direction.
+DIRECTIONSTEPS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+# The direction of each (dx, dy) step between two adjacent spaces.
+STEPDIRECTIONS = {step: direction for direction, step in enumerate(DIRECTIONSTEPS)}
+
+OPPOSITE = (DOWN, UP, RIGHT, LEFT)
+
+# The y of a new gem that starts above the board. It is one row above row
+# 0, so moving it DOWN lands it on the top row like any other gem. When
+# several new gems drop into a column at once they are stacked above it,
+# at ROWABOVEBOARD, ROWABOVEBOARD - 1 and so on.
+ROWABOVEBOARD = -1
+
+
+class MovingGem:
+    __slots__ = ('imageNum', 'x', 'y', 'direction', 'dx', 'dy', 'distance')
+
+    def __init__(self, imageNum, x, y, direction, distance=1):
+        self.imageNum = imageNum # index into GEMIMAGES
+        self.x = x
+        self.y = y # a row of the board, or ROWABOVEBOARD (or above it)
+        self.direction = direction # UP, DOWN, LEFT or RIGHT
+        self.dx, self.dy = DIRECTIONSTEPS[direction]
+        self.distance = distance # number of spaces the gem moves
+
+
+    def __repr__(self):
+        return 'MovingGem(%r, %r, %r, %r, %r)' % (self.imageNum, self.x, self.y, self.direction,
+                                                  self.distance)
@@ -0,0 +1,90 @@
+"""
+Plays move logs (see movelog.py) again with GemEngine, with no pygame
+and no frame clock, and checks that every swap ends with the score and
+board the log says it did.
+
+    python replay.py movelogs/*.gemlog
+
+A mismatch means the game and the engine disagree (or the rules changed
+since the log was written); the first one in each log is printed and the
+exit status is 1. Replaying a set of real games is also a benchmark of
+the engine on real play; the speed is printed at the end.
+
+With --snapshots, the board and score after every move are written to a
+snapshot file (see savegame.py), a few bytes per move, for analytics:
+
+    python replay.py --snapshots moves.gemsnap movelogs/*.gemlog
+"""
+
+import argparse, random, sys, time
+
+from gemengine import GemEngine
+from movelog import MoveLog, hashBoard
+from savegame import SnapshotWriter
+from selfplay import VARIANTS
+
+
+def replayLog(log, snapshots=None):
+    # Plays log, a MoveLog. Returns None if every swap matches, else a
+    # string that says where it first went wrong. Every board after a
+    # move is added to snapshots, a SnapshotWriter, if there is one.
+    rules = VARIANTS[log.variant]
+    rng = random.Random(log.seed)
+    if log.fromPool:
+        engine = GemEngine(log.width, log.height, log.numGems, rng, rules, log.board)
+        engine.score = log.startScore
+    else:
+        # The game dealt its starting board from its seed, and so does
+        # the engine here.
+        engine = GemEngine(log.width, log.height, log.numGems, rng, rules)
+        if engine.board != log.board:
+            return 'the starting board is not the one the seed deals'
+
+    for i, (milliseconds, first, second, score, boardHash) in enumerate(log.moves):
+        engine.swap(first, second)
+        if engine.score != score:
+            return 'move %d %s-%s: score %d, the log has %d' % (i, first, second, engine.score, score)
+        if hashBoard(engine.board) != boardHash:
+            return 'move %d %s-%s: the board is not the one in the log' % (i, first, second)
+        if snapshots is not None:
+            snapshots.add(engine.board, engine.score)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays match-3 move logs and checks them.')
+    parser.add_argument('logs', nargs='+', help='move log files')
+    parser.add_argument('--snapshots', help='snapshot file to write the board after every move to')
+    args = parser.parse_args()
+
+    failures = 0
+    totalMoves = 0
+    elapsed = 0.0
+    snapshots = None
+    for path in args.logs:
+        log = MoveLog(path)
+        if args.snapshots and snapshots is None:
+            # the snapshots are all of the first log's board size
+            snapshots = SnapshotWriter(args.snapshots, log.width, log.height, log.numGems)
+        startTime = time.perf_counter()
+        if snapshots is not None and (log.width, log.height, log.numGems) != (snapshots.width, snapshots.height, snapshots.numGems):
+            problem = replayLog(log)
+        else:
+            problem = replayLog(log, snapshots)
+        elapsed += time.perf_counter() - startTime
+        totalMoves += len(log.moves)
+        if problem is None:
+            print('%s: %d moves, score %d ok' % (path, len(log.moves), log.moves[-1][3] if log.moves else 0))
+        else:
+            failures += 1
+            print('%s: %s' % (path, problem))
+
+    if snapshots is not None:
+        snapshots.close()
+    print('%d logs, %d moves in %.2fs: %.0f moves/s, %d failed'
+          % (len(args.logs), totalMoves, elapsed, totalMoves / max(elapsed, 1e-9), failures))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Saved games and board snapshots for the match-3 games, with the board
+packed into as few bits as its gems need.
+
+A board is packed space by space, column by column, into one little
+endian integer of bitsPerSpace bits a space (see getBitsPerSpace()): a
+board at rest between moves has no empty spaces and needs
+ceil(log2(numGems)) bits a space, so an 8x8 board of 4 gem types is 16
+bytes. A board that may have empty spaces takes ceil(log2(numGems + 1))
+bits a space, and an empty space is stored as all ones.
+
+A saved game file is:
+
+    HEADER   magic, version, width, height, gem types, bits per space,
+             variant, score, seed
+    board    the packed board
+
+The game's random number generator is saved as a seed, not as its
+2.5 kB of Mersenne Twister state: reseed() draws a new seed from the
+generator and restarts the generator from it, so from then on the seed
+is all there is to its state. A game resumed from the file deals the
+same gems the saved game would have dealt, and a move log started from
+the saved board and seed replays it (see movelog.py).
+
+A snapshot file holds any number of boards of one size and their
+scores, for analytics and solver caches (replay.py --snapshots writes
+one after every move it replays):
+
+    SNAPSHOTHEADER   magic, version, width, height, gem types, bits per space
+    records          SNAPSHOT (the score) and the packed board
+
+    snapshots = SnapshotWriter('moves.gemsnap', 8, 8, 4)
+    snapshots.add(engine.board, engine.score)
+    snapshots.close()
+    board, score = SnapshotFile('moves.gemsnap').getSnapshot(0)
+"""
+
+import mmap, os, struct
+
+from matchrules import EMPTY_SPACE
+
+MAGIC = b'GEMSAVE\0'
+SNAPSHOTMAGIC = b'GEMSNAP\0'
+VERSION = 1
+
+# magic, version, width, height, gem types, bits per space, variant, score, seed
+HEADER = struct.Struct('<8sHHHHB16sqQ')
+# magic, version, width, height, gem types, bits per space
+SNAPSHOTHEADER = struct.Struct('<8sHHHHB')
+# score; the packed board follows
+SNAPSHOT = struct.Struct('<q')
+
+
+def getBitsPerSpace(numGems, withEmptySpaces=False):
+    # The bits a space takes for numGems gem types, with room for
+    # EMPTY_SPACE too if withEmptySpaces is True.
+    return max(1, (numGems if withEmptySpaces else numGems - 1).bit_length())
+
+
+def getPackedSize(width, height, bitsPerSpace):
+    # The bytes a packed board takes.
+    return (width * height * bitsPerSpace + 7) // 8
+
+
+def packBoard(board, numGems, bitsPerSpace):
+    # Returns board[x][y] packed as bytes.
+    emptyCode = (1 << bitsPerSpace) - 1
+    value = 0
+    for column in reversed(board):
+        for gem in reversed(column):
+            if gem == EMPTY_SPACE:
+                if emptyCode < numGems:
+                    raise ValueError('no room for empty spaces in %d bits' % bitsPerSpace)
+                gem = emptyCode
+            elif not 0 <= gem < numGems:
+                raise ValueError('%r is not one of %d gem types' % (gem, numGems))
+            value = (value << bitsPerSpace) | gem
+    return value.to_bytes(getPackedSize(len(board), len(board[0]), bitsPerSpace), 'little')
+
+
+def unpackBoard(data, width, height, numGems, bitsPerSpace):
+    # The board[x][y] list of lists of a packed board. Codes that are not
+    # a gem are empty spaces.
+    value = int.from_bytes(data[:getPackedSize(width, height, bitsPerSpace)], 'little')
+    mask = (1 << bitsPerSpace) - 1
+    board = []
+    for x in range(width):
+        column = []
+        for y in range(height):
+            gem = value & mask
+            column.append(gem if gem < numGems else EMPTY_SPACE)
+            value >>= bitsPerSpace
+        board.append(column)
+    return board
+
+
+def reseed(rng):
+    # Restarts rng, a random.Random, from a seed drawn from it, and
+    # returns that seed.
+    seed = rng.getrandbits(64)
+    rng.seed(seed)
+    return seed
+
+
+def saveGame(path, variant, board, numGems, score, seed):
+    # Writes a saved game. seed is the seed the game's random number
+    # generator was just restarted from (see reseed()).
+    bitsPerSpace = getBitsPerSpace(numGems, any(EMPTY_SPACE in column for column in board))
+    data = (HEADER.pack(MAGIC, VERSION, len(board), len(board[0]), numGems, bitsPerSpace,
+                        variant.encode('ascii'), score, seed)
+            + packBoard(board, numGems, bitsPerSpace))
+    # Written next to the old save and then moved over it, so a crash
+    # while saving doesn't lose both.
+    with open(path + '.tmp', 'wb') as saveFile:
+        saveFile.write(data)
+    os.replace(path + '.tmp', path)
+
+
+class SavedGame:
+    # A saved game file read back in.
+    def __init__(self, path):
+        with open(path, 'rb') as saveFile:
+            data = saveFile.read()
+        (magic, version, self.width, self.height, self.numGems, bitsPerSpace, variant,
+         self.score, self.seed) = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a version %d saved game' % (path, VERSION))
+        self.variant = variant.rstrip(b'\0').decode('ascii')
+        self.board = unpackBoard(data[HEADER.size:], self.width, self.height, self.numGems,
+                                 bitsPerSpace)
+
+
+def openSavedGame(path, width, height, numGems, variant):
+    # The SavedGame in path if there is one for this game, else None.
+    if not os.path.exists(path):
+        return None
+    savedGame = SavedGame(path)
+    if (savedGame.width, savedGame.height, savedGame.numGems, savedGame.variant) != (width, height, numGems, variant):
+        return None
+    return savedGame
+
+
+class SnapshotWriter:
+    def __init__(self, path, width, height, numGems, withEmptySpaces=False):
+        self.width = width
+        self.height = height
+        self.numGems = numGems
+        self.bitsPerSpace = getBitsPerSpace(numGems, withEmptySpaces)
+        self.file = open(path, 'wb')
+        self.file.write(SNAPSHOTHEADER.pack(SNAPSHOTMAGIC, VERSION, width, height, numGems,
+                                            self.bitsPerSpace))
+
+
+    def add(self, board, score):
+        self.file.write(SNAPSHOT.pack(score) + packBoard(board, self.numGems, self.bitsPerSpace))
+
+
+    def close(self):
+        self.file.close()
+
+
+class SnapshotFile:
+    # A snapshot file, read through mmap like a BoardPool, so a file of
+    # millions of snapshots opens at once and each one is a slice of it.
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.width, self.height, self.numGems,
+         self.bitsPerSpace) = SNAPSHOTHEADER.unpack_from(self.data)
+        if magic != SNAPSHOTMAGIC or version != VERSION:
+            self.close()
+            raise ValueError('%s is not a version %d snapshot file' % (path, VERSION))
+        self.recordSize = SNAPSHOT.size + getPackedSize(self.width, self.height, self.bitsPerSpace)
+
+
+    def __len__(self):
+        return (len(self.data) - SNAPSHOTHEADER.size) // self.recordSize
+
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+    def getSnapshot(self, i):
+        # Returns snapshot i as (board, score).
+        start = SNAPSHOTHEADER.size + i * self.recordSize
+        score, = SNAPSHOT.unpack_from(self.data, start)
+        board = unpackBoard(self.data[start + SNAPSHOT.size:start + self.recordSize],
+                            self.width, self.height, self.numGems, self.bitsPerSpace)
+        return board, score
@@ -0,0 +1,160 @@
+"""
+Batch self-play for the match-3 games, for tuning the number of gem
+types, the board size and the scoring rule from statistics.
+
+Games are played by GemEngine (no pygame, no frame clock) with a policy
+that picks each swap, spread over a multiprocessing pool that uses every
+core. Game number i is played with seed (--seed + i), so any game in a
+sweep can be played again on its own.
+
+    python selfplay.py --games 1000000 --policy greedy --out greedy.bin
+
+Every game becomes one fixed-size record in the --out file (see RECORD);
+readResults() loads them back. A summary is printed at the end.
+"""
+
+import argparse, multiprocessing, os, random, struct, time
+from array import array
+
+from boardgen import checkNumGems
+from gemengine import GemEngine
+from matchrules import MARIJARULES, MINERULES
+
+# seed, score, moves played, cascade steps, deepest cascade, game over flag
+RECORD = struct.Struct('<QqIIHB')
+
+# The rules of each game (see matchrules.py).
+VARIANTS = {'marija': MARIJARULES, # cc_marija.py: rows and columns
+            'mine': MINERULES}     # CandyCrush_mine.py: diagonals too, len(gemSet) points per run
+
+
+def randomPolicy(engine, rng):
+    return rng.choice(sorted(engine.moveIndex.getMoves()))
+
+
+def firstPolicy(engine, rng):
+    return min(engine.moveIndex.getMoves())
+
+
+def greedyPolicy(engine, rng):
+    # The move whose first round of matches scores the most. Ties are
+    # broken at random so the greedy player doesn't always favour the
+    # top left of the board.
+    bestScore = -1
+    bestMoves = []
+    for move in sorted(engine.moveIndex.getMoves()):
+        moveScore = engine.previewSwap(*move)
+        if moveScore > bestScore:
+            bestScore = moveScore
+            bestMoves = [move]
+        elif moveScore == bestScore:
+            bestMoves.append(move)
+    return rng.choice(bestMoves)
+
+
+POLICIES = {'random': randomPolicy,
+            'greedy': greedyPolicy,
+            'first': firstPolicy}
+
+
+def playGame(seed, settings):
+    # Plays one game until no move is left or maxMoves moves have been
+    # played. Returns a RECORD tuple.
+    rng = random.Random(seed)
+    engine = GemEngine(settings['width'], settings['height'], settings['gems'],
+                       rng=rng, rules=VARIANTS[settings['variant']])
+    policy = POLICIES[settings['policy']]
+    moves = 0
+    cascadeSteps = 0
+    deepestCascade = 0
+    while moves < settings['maxMoves'] and not engine.isGameOver():
+        result = engine.swap(*policy(engine, rng))
+        moves += 1
+        cascadeSteps += len(result.steps)
+        deepestCascade = max(deepestCascade, len(result.steps))
+    return (seed, engine.score, moves, cascadeSteps, deepestCascade, engine.isGameOver())
+
+
+def playGames(job):
+    # Runs in a worker process. One job is a range of seeds, so only one
+    # bytes object per chunk of games goes back to the parent process.
+    firstSeed, numGames, settings = job
+    records = bytearray()
+    for seed in range(firstSeed, firstSeed + numGames):
+        records += RECORD.pack(*playGame(seed, settings))
+    return bytes(records)
+
+
+def readResults(path):
+    # Returns the list of RECORD tuples stored in a results file.
+    with open(path, 'rb') as resultsFile:
+        return list(RECORD.iter_unpack(resultsFile.read()))
+
+
+def percentile(sortedValues, fraction):
+    return sortedValues[min(len(sortedValues) - 1, int(fraction * len(sortedValues)))]
+
+
+def printSummary(records, elapsed):
+    # records is an iterable of RECORD tuples. Only the columns that need
+    # sorting are kept, in arrays, so a million games stay small.
+    scores = array('q')
+    moves = array('q')
+    deepest = array('q')
+    cascadeSteps = 0
+    gamesOver = 0
+    for seed, score, movesPlayed, steps, deepestCascade, gameOver in records:
+        scores.append(score)
+        moves.append(movesPlayed)
+        deepest.append(deepestCascade)
+        cascadeSteps += steps
+        gamesOver += gameOver
+    games = len(scores)
+    totalMoves = sum(moves)
+
+    print('%d games, %d moves in %.1fs: %.0f games/s, %.0f moves/s'
+          % (games, totalMoves, elapsed, games / elapsed, totalMoves / elapsed))
+    for name, values in (('score', scores), ('moves', moves), ('deepest cascade', deepest)):
+        values = sorted(values)
+        print('%-16s mean %10.1f  p10 %8d  p50 %8d  p90 %8d  p99 %8d  max %8d'
+              % (name, sum(values) / games, percentile(values, 0.1), percentile(values, 0.5),
+                 percentile(values, 0.9), percentile(values, 0.99), values[-1]))
+    print('cascade steps per move %.2f, games that ran out of moves %d (%.1f%%)'
+          % (cascadeSteps / max(totalMoves, 1), gamesOver, 100.0 * gamesOver / games))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch self-play for the match-3 games.')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--variant', choices=sorted(VARIANTS), default='marija')
+    parser.add_argument('--width', type=int, default=8)
+    parser.add_argument('--height', type=int, default=8)
+    parser.add_argument('--gems', type=int, default=4, help='number of gem types (NUMGEMIMAGES)')
+    parser.add_argument('--max-moves', type=int, default=500, help='moves before a game is stopped')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk', type=int, default=100, help='games per job sent to a worker')
+    parser.add_argument('--out', default='selfplay.bin', help='file the game records are written to')
+    args = parser.parse_args()
+    try:
+        checkNumGems(VARIANTS[args.variant], args.gems)
+    except ValueError as e:
+        parser.error('--gems: %s' % e)
+
+    settings = {'width': args.width, 'height': args.height, 'gems': args.gems,
+                'variant': args.variant, 'policy': args.policy, 'maxMoves': args.max_moves}
+    jobs = [(seed, min(args.chunk, args.seed + args.games - seed), settings)
+            for seed in range(args.seed, args.seed + args.games, args.chunk)]
+
+    startTime = time.perf_counter()
+    with open(args.out, 'wb') as resultsFile, multiprocessing.Pool(args.processes) as pool:
+        for chunk in pool.imap_unordered(playGames, jobs):
+            resultsFile.write(chunk)
+    elapsed = time.perf_counter() - startTime
+    with open(args.out, 'rb') as resultsFile:
+        printSummary(RECORD.iter_unpack(resultsFile.read()), elapsed)
+
+
+if __name__ == '__main__':
+    main()
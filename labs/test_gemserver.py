@@ -0,0 +1,61 @@
+"""
+Tests for gemserver.py, over a real loopback connection.
+
+    python -m pytest test_gemserver.py
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from gemserver import (HELLO, REQUEST, REPLY, NEWGAME, SWAP, ENDGAME, OK, GameServer, GameProtocol,
+                       unpackBoards)
+from moveindex import MoveIndex
+from savegame import getPackedSize
+
+
+async def readReplies(reader, count, packedSize):
+    # The next count replies as (status, game number, points, score, game over, board).
+    replies = []
+    for i in range(count):
+        data = await reader.readexactly(REPLY.size + packedSize)
+        replies.append(REPLY.unpack_from(data) + (data[REPLY.size:],))
+    return replies
+
+
+async def swapThenEndGame(engine):
+    # Pipelines a SWAP and the ENDGAME of the same game in one write, and
+    # returns their replies.
+    server = GameServer(seed=1, engine=engine)
+    loop = asyncio.get_running_loop()
+    listener = await loop.create_server(lambda: GameProtocol(server), '127.0.0.1', 0)
+    try:
+        reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+        magic, version, width, height, numGems, bitsPerSpace, variant = HELLO.unpack(
+            await reader.readexactly(HELLO.size))
+        packedSize = getPackedSize(width, height, bitsPerSpace)
+
+        writer.write(REQUEST.pack(NEWGAME, 0, 0, 0, 0, 0))
+        [(status, gameNumber, points, score, gameOver, packed)] = await readReplies(reader, 1, packedSize)
+        assert status == OK
+        board = unpackBoards(np.frombuffer(packed, dtype=np.uint8)[None], width, height, bitsPerSpace)[0]
+        (x1, y1), (x2, y2) = sorted(MoveIndex(board.tolist()).getMoves())[0]
+
+        writer.write(REQUEST.pack(SWAP, gameNumber, x1, y1, x2, y2)
+                     + REQUEST.pack(ENDGAME, gameNumber, 0, 0, 0, 0))
+        replies = await readReplies(reader, 2, packedSize)
+        writer.close()
+        return replies
+    finally:
+        listener.close()
+
+
+@pytest.mark.parametrize('engine', ['exact', 'batch'])
+def test_endgame_after_pipelined_swap_sees_the_swap(engine):
+    swapReply, endReply = asyncio.run(swapThenEndGame(engine))
+    assert swapReply[0] == OK and swapReply[2] > 0
+    assert endReply[0] == OK
+    # the ENDGAME is answered after the swap is played: same score, same board
+    assert endReply[3] == swapReply[3]
+    assert endReply[5] == swapReply[5]
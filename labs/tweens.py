@@ -0,0 +1,123 @@
+"""
+Tween scheduler for the pygame games: animations that the game's main
+loop moves along one frame at a time, instead of each animation running
+a frame loop of its own.
+
+A Tween runs for a number of seconds. Every frame, its onUpdate(progress)
+is called with its progress from 0.0 to 1.0 put through an easing
+function, and when it is done its onDone() is called. The game loop calls
+update() with the seconds the last frame took, and keeps handling its
+events in between, so input and window events are never held up by an
+animation:
+
+    scheduler = TweenScheduler()
+    scheduler.then(lambda: scheduler.add(Tween(0.3, easeInQuad, drawFall, landGems)))
+    scheduler.then(showScore)
+    while True:
+        ...handle events; only act on the board if scheduler.isSettled()...
+        scheduler.update(FPSCLOCK.tick(FPS) / 1000.0)
+
+add() starts a tween at once, alongside any that are running. then()
+queues a step, a function called once the tweens running before it are
+all done; a step starts the next tweens with add() (or just changes
+something, like the board or the score). Steps run in the order they
+were queued, so a cascade is one then() per swap, clear and fall.
+"""
+
+import collections
+
+
+def linear(t):
+    return t
+
+
+def easeInQuad(t):
+    # Starts slow and speeds up, like something falling.
+    return t * t
+
+
+def easeOutQuad(t):
+    return t * (2 - t)
+
+
+def easeInOutQuad(t):
+    return 2 * t * t if t < 0.5 else 1 - 2 * (1 - t) * (1 - t)
+
+
+class Tween:
+    __slots__ = ('duration', 'easing', 'onUpdate', 'onDone', 'elapsed')
+
+    def __init__(self, duration, easing=linear, onUpdate=None, onDone=None):
+        self.duration = duration # in seconds
+        self.easing = easing # function from 0.0-1.0 time to 0.0-1.0 progress
+        self.onUpdate = onUpdate # called with the progress every frame
+        self.onDone = onDone # called when the tween is done
+        self.elapsed = 0.0
+
+
+    def getProgress(self):
+        if self.elapsed >= self.duration:
+            return 1.0
+        return self.easing(self.elapsed / self.duration)
+
+
+class TweenScheduler:
+    def __init__(self):
+        self.tweens = [] # the tweens that are running
+        self.steps = collections.deque() # functions waiting for the running tweens to end
+
+
+    def add(self, tween):
+        # Starts tween. It shows its first frame right away.
+        self.tweens.append(tween)
+        if tween.onUpdate is not None:
+            tween.onUpdate(tween.getProgress())
+        return tween
+
+
+    def then(self, step):
+        # Queues step, a function called with no arguments, to run once
+        # the tweens started before it are done.
+        self.steps.append(step)
+        if not self.tweens:
+            self._runSteps()
+
+
+    def isSettled(self):
+        # True when nothing is running or waiting to run.
+        return not self.tweens and not self.steps
+
+
+    def clear(self):
+        # Drops every tween and step without finishing them.
+        self.tweens = []
+        self.steps.clear()
+
+
+    def update(self, seconds):
+        # Moves every tween on by seconds, finishes the ones that are
+        # done and runs the steps that were waiting for them.
+        running = []
+        finished = []
+        for tween in self.tweens:
+            tween.elapsed += seconds
+            if tween.elapsed >= tween.duration:
+                finished.append(tween)
+            else:
+                running.append(tween)
+                if tween.onUpdate is not None:
+                    tween.onUpdate(tween.getProgress())
+        self.tweens = running
+        for tween in finished:
+            if tween.onUpdate is not None:
+                tween.onUpdate(1.0)
+            if tween.onDone is not None:
+                tween.onDone()
+        self._runSteps()
+
+
+    def _runSteps(self):
+        # Steps that start no tweens run one after another, until one
+        # does (or there are none left).
+        while self.steps and not self.tweens:
+            self.steps.popleft()()